@@ -0,0 +1,265 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is refused by rate limiting or the concurrency gate."""
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class InMemoryBucketStore:
+    """
+    Token buckets kept in process memory.
+    Good enough for a single worker; each serverless instance gets its own buckets.
+    """
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """
+        Try to take `cost` tokens from bucket `key` refilled at `rate` tokens/sec.
+        Returns 0 if allowed, otherwise the seconds until enough tokens are available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (cost - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._evict(now)
+        return wait
+
+    def _evict(self, now):
+        # Drop the least recently touched half; those buckets are full again anyway
+        ordered = sorted(self._buckets.items(), key=lambda item: item[1][1])
+        for key, _ in ordered[:len(ordered) // 2]:
+            del self._buckets[key]
+
+
+class RedisBucketStore:
+    """
+    Token buckets shared across instances through Redis.
+    The refill-and-take step runs as a Lua script so it is atomic.
+    """
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url, prefix="ratelimit:"):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst, cost=1):
+        try:
+            wait = self._script(keys=[self.prefix + key], args=[rate, burst, cost, time.time()])
+            return float(wait)
+        except Exception as e:
+            # Fail open: a broken limiter must not take the scanner down
+            print(f"[ADMISSION] Redis bucket store error (allowing request): {e}")
+            return 0.0
+
+
+def get_bucket_store():
+    """Returns a shared Redis store if RATE_LIMIT_REDIS_URL is set, else an in-memory one."""
+    redis_url = os.getenv('RATE_LIMIT_REDIS_URL')
+    if redis_url:
+        try:
+            return RedisBucketStore(redis_url)
+        except Exception as e:
+            print(f"[ADMISSION] Redis unavailable, falling back to in-memory buckets: {e}")
+    return InMemoryBucketStore()
+
+
+class ConcurrencyGate:
+    """
+    Caps the number of in-flight upstream calls.
+    At most `max_queue` callers may wait for a slot, each for at most `queue_timeout` seconds.
+    """
+    def __init__(self, limit, max_queue, queue_timeout):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    def _retry_after(self):
+        return max(1.0, self.queue_timeout * (self.waiting + 1) / max(self.limit, 1))
+
+    def check_capacity(self):
+        """Raises AdmissionRejected right away if every slot is taken and the queue is full."""
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise AdmissionRejected("Server busy, queue full", self._retry_after())
+
+    async def acquire(self):
+        """Waits for a slot; raises AdmissionRejected if the queue is full or the wait times out."""
+        self.check_capacity()
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected("Server busy, timed out waiting for a slot", self._retry_after())
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AdmissionController:
+    """Per-IP and per-campaign token buckets in front of a global concurrency gate."""
+    def __init__(self, store, gate, ip_rate, ip_burst, campaign_rate, campaign_burst, upload_rate, upload_burst):
+        self.store = store
+        self.gate = gate
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.campaign_rate = campaign_rate
+        self.campaign_burst = campaign_burst
+        self.upload_rate = upload_rate
+        self.upload_burst = upload_burst
+
+    @classmethod
+    def from_env(cls):
+        # Rates are configured per minute, buckets refill per second
+        ip_per_min = float(os.getenv('ANALYZE_RATE_PER_MIN_IP', '10'))
+        campaign_per_min = float(os.getenv('ANALYZE_RATE_PER_MIN_CAMPAIGN', '300'))
+        upload_per_min = float(os.getenv('UPLOAD_URL_RATE_PER_MIN_IP', '20'))
+        return cls(
+            store=get_bucket_store(),
+            gate=ConcurrencyGate(
+                limit=int(os.getenv('GEMINI_MAX_CONCURRENCY', '8')),
+                max_queue=int(os.getenv('GEMINI_MAX_QUEUE', '32')),
+                queue_timeout=float(os.getenv('GEMINI_QUEUE_TIMEOUT', '10')),
+            ),
+            ip_rate=ip_per_min / 60.0,
+            ip_burst=float(os.getenv('ANALYZE_BURST_IP', '5')),
+            campaign_rate=campaign_per_min / 60.0,
+            campaign_burst=float(os.getenv('ANALYZE_BURST_CAMPAIGN', '50')),
+            upload_rate=upload_per_min / 60.0,
+            upload_burst=float(os.getenv('UPLOAD_URL_BURST_IP', '10')),
+        )
+
+    def check_rate(self, client_ip, campaign=None):
+        """Raises AdmissionRejected if the IP or campaign bucket is empty."""
+        wait = self.store.take(f"ip:{client_ip}", self.ip_rate, self.ip_burst)
+        if wait > 0:
+            raise AdmissionRejected("Too many requests from this address", wait)
+
+        if campaign:
+            wait = self.store.take(f"campaign:{campaign}", self.campaign_rate, self.campaign_burst)
+            if wait > 0:
+                raise AdmissionRejected("Too many requests for this campaign", wait)
+
+    def check_upload_rate(self, client_ip):
+        """
+        Raises AdmissionRejected if the IP's upload-url bucket is empty. Kept apart from the
+        analyze bucket so signing an upload doesn't use up the scans it is for.
+        """
+        wait = self.store.take(f"upload:{client_ip}", self.upload_rate, self.upload_burst)
+        if wait > 0:
+            raise AdmissionRejected("Too many upload requests from this address", wait)
+
+    def stats(self):
+        return {
+            "in_flight": self.gate.in_flight,
+            "waiting": self.gate.waiting,
+            "limit": self.gate.limit,
+            "max_queue": self.gate.max_queue,
+        }
+
+
+def client_ip_from_request(request):
+    """Best-effort client IP; Vercel puts the real address first in X-Forwarded-For."""
+    if request is None:
+        return "0.0.0.0"
+    forwarded = request.headers.get('x-forwarded-for')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.client.host if request.client else "0.0.0.0"
+
+
+def rejection_response(exc):
+    return JSONResponse(
+        status_code=429,
+        content={"status": "error", "error": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware taking the per-IP and per-campaign tokens for `paths` before the
+    request body is read, so a throttled client is refused with 429 without its upload
+    being received or parsed. The campaign comes from the `campaign` query parameter
+    or the X-Campaign header.
+    """
+    def __init__(self, app, controller, paths):
+        self.app = app
+        self.controller = controller
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        campaign = request.query_params.get('campaign') or request.headers.get('x-campaign')
+        client_ip = client_ip_from_request(request)
+        try:
+            self.controller.check_rate(client_ip, campaign)
+        except AdmissionRejected as e:
+            print(f"[ADMISSION] Rejected {scope['path']} from {client_ip}: {e.reason}")
+            await rejection_response(e)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+admission = AdmissionController.from_env()
@@ -0,0 +1,121 @@
+import re
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic_core import PydanticUseDefault, to_json
+
+# Floor applied to every score we return, whatever the model said
+MIN_SCORE = 70
+DEFAULT_FEEDBACK = 'Strong commercial potential with natural appeal.'
+
+
+def _blank_to_default(value):
+    # Models sometimes emit "" or null for fields they skipped; treat those as missing
+    if value is None or (isinstance(value, str) and not value.strip()):
+        raise PydanticUseDefault()
+    return value
+
+
+class FaceGeometryModel(BaseModel):
+    model_config = ConfigDict(extra='allow', coerce_numbers_to_str=True)
+
+    primary_shape: str = 'Unknown'
+    jawline_definition: str = 'Defined'
+    structural_note: str = 'N/A'
+
+    _defaults = field_validator('*', mode='before')(_blank_to_default)
+
+
+class MarketCategorizationModel(BaseModel):
+    model_config = ConfigDict(extra='allow', coerce_numbers_to_str=True)
+
+    primary: str = 'Unknown'
+    rationale: str = ''
+
+    _defaults = field_validator('*', mode='before')(_blank_to_default)
+
+
+class AestheticAuditModel(BaseModel):
+    model_config = ConfigDict(extra='allow', coerce_numbers_to_str=True)
+
+    lighting_quality: str = 'Unknown'
+    professional_readiness: str = 'Unknown'
+    technical_flaw: str = 'None'
+
+    _defaults = field_validator('*', mode='before')(_blank_to_default)
+
+
+class AnalysisModel(BaseModel):
+    """
+    Validated analysis result. Parsing fills defaults for skipped fields, coerces the
+    score to an int with the MIN_SCORE floor, and keeps extra keys (provider,
+    quality_gate, technical_metrics, ...) so they pass through untouched.
+    """
+    model_config = ConfigDict(extra='allow', coerce_numbers_to_str=True)
+
+    face_geometry: FaceGeometryModel = Field(default_factory=FaceGeometryModel)
+    market_categorization: MarketCategorizationModel = Field(default_factory=MarketCategorizationModel)
+    aesthetic_audit: AestheticAuditModel = Field(default_factory=AestheticAuditModel)
+    suitability_score: int = MIN_SCORE
+    scout_feedback: str = DEFAULT_FEEDBACK
+
+    _defaults = field_validator('face_geometry', 'aesthetic_audit', 'scout_feedback', mode='before')(_blank_to_default)
+
+    @field_validator('market_categorization', mode='before')
+    @classmethod
+    def _market_from_string(cls, value):
+        # Older clients and fallbacks send the category as a bare string
+        if isinstance(value, str) and value.strip():
+            return {'primary': value}
+        return _blank_to_default(value)
+
+    @field_validator('suitability_score', mode='before')
+    @classmethod
+    def _score(cls, value):
+        if isinstance(value, str):
+            # Models occasionally answer with a range like "80-85"; take the first number
+            match = re.search(r'\d+(\.\d+)?', value)
+            value = match.group(0) if match else None
+        try:
+            return max(int(float(value)), MIN_SCORE)
+        except (TypeError, ValueError):
+            return MIN_SCORE
+
+
+class BatchAnalysisModel(BaseModel):
+    """One multi-photo answer: a result per photo, in upload order, plus one for the person overall."""
+    model_config = ConfigDict(extra='ignore')
+
+    images: list[AnalysisModel]
+    aggregate: AnalysisModel = Field(default_factory=AnalysisModel)
+
+
+def parse_analysis_json(text):
+    """Parses, validates and fills defaults from raw model JSON in a single pass."""
+    return AnalysisModel.model_validate_json(text)
+
+
+def parse_batch_analysis_json(text, expected):
+    """Parses a multi-photo answer; raises ValueError unless it has exactly `expected` per-photo results."""
+    batch = BatchAnalysisModel.model_validate_json(text)
+    if len(batch.images) != expected:
+        raise ValueError(f"Model returned {len(batch.images)} results for {expected} photos")
+    return batch.images, batch.aggregate
+
+
+def normalize_analysis(result):
+    """Validated dict from a dict or an AnalysisModel (no re-validation for the latter)."""
+    if not isinstance(result, AnalysisModel):
+        result = AnalysisModel.model_validate(result)
+    return result.model_dump()
+
+
+def analysis_to_json(result):
+    """Serializes a result straight to JSON bytes with pydantic-core's encoder."""
+    if not isinstance(result, AnalysisModel):
+        result = AnalysisModel.model_validate(result)
+    return result.__pydantic_serializer__.to_json(result)
+
+
+def dumps(data):
+    """Fast JSON bytes for plain dicts (no validation)."""
+    return to_json(data)
@@ -0,0 +1,116 @@
+import csv
+import gzip
+import io
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pydantic_core import from_json, to_json
+
+from storage import get_lead_store, get_archive_store
+
+# Leads older than this move from the hot table to compressed NDJSON segments
+ARCHIVE_AFTER_DAYS = int(os.getenv('LEAD_ARCHIVE_AFTER_DAYS', '180'))
+# Leads per segment file (and per delete batch on the hot table)
+ARCHIVE_BATCH = int(os.getenv('LEAD_ARCHIVE_BATCH', '1000'))
+ARCHIVE_PREFIX = "leads/"
+
+EXPORT_COLUMNS = (
+    "id", "created_at", "first_name", "last_name", "age", "gender", "email", "phone", "city",
+    "zip_code", "campaign", "wants_assessment", "score", "category", "image_url", "webhook_status",
+    "archived",
+)
+
+
+def _segment_key(batch_number):
+    # Sorts by archive time, so newer segments hold newer leads; the suffix keeps runs apart
+    return f"{ARCHIVE_PREFIX}{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{batch_number:04d}-{uuid.uuid4().hex[:8]}.ndjson.gz"
+
+
+def archive_leads(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH, max_batches=None, dry_run=False):
+    """
+    Moves leads created more than `days` ago out of the hot table, oldest first.
+
+    Each batch is written as one gzipped NDJSON segment, then indexed in
+    lead_archive_index (contact fields and image digest for dedup and image GC), and only
+    then deleted from the hot table. A crash between steps leaves the lead in both places;
+    the next run archives it again and the index points at the newest copy.
+    Returns {"archived", "segments"}.
+    """
+    leads = get_lead_store()
+    archive = get_archive_store()
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%S')
+
+    archived = 0
+    segments = []
+    batch_number = 0
+    while max_batches is None or batch_number < max_batches:
+        batch = leads.leads_before(cutoff, batch_size)
+        if not batch:
+            break
+        batch_number += 1
+        if dry_run:
+            # Nothing is deleted in a dry run, so later batches would repeat this one
+            archived = len(batch)
+            print(f"[ARCHIVE] Would archive {len(batch)} leads (ids {batch[0]['id']}..{batch[-1]['id']}) in the first batch")
+            break
+
+        key = _segment_key(batch_number)
+        body = gzip.compress(b"".join(to_json(lead) + b"\n" for lead in batch))
+        archive.put(key, body, "application/gzip")
+        leads.index_archived([{
+            "lead_id": lead["id"],
+            "email": lead.get("email"),
+            "phone": lead.get("phone"),
+            "image_digest": lead.get("image_digest"),
+            "created_at": lead.get("created_at"),
+            "segment": key,
+        } for lead in batch])
+        leads.delete([lead["id"] for lead in batch])
+
+        archived += len(batch)
+        segments.append(key)
+        print(f"[ARCHIVE] {key}: {len(batch)} leads, {len(body)} bytes")
+
+    print(f"[ARCHIVE] {'Found' if dry_run else 'Archived'} {archived} leads older than {days} days")
+    return {"archived": archived, "segments": segments}
+
+
+def iter_archived_leads():
+    """Archived leads, newest first. Copies superseded by a later segment are skipped."""
+    leads = get_lead_store()
+    archive = get_archive_store()
+    keys = sorted((key for key, _ in archive.list_objects(ARCHIVE_PREFIX)), reverse=True)
+    for key in keys:
+        rows = [from_json(line) for line in gzip.decompress(archive.get(key)).splitlines() if line]
+        current = leads.archived_segments(row["id"] for row in rows)
+        for row in reversed(rows):
+            if current.get(row["id"]) == key:
+                yield {**row, "archived": True}
+
+
+def iter_export_leads(page_size=500):
+    """Every lead, hot and archived, newest first; callers don't need to know where a lead lives."""
+    leads = get_lead_store()
+    before = None
+    while True:
+        page, before = leads.list(page_size, before)
+        yield from page
+        if before is None:
+            break
+    yield from iter_archived_leads()
+
+
+def leads_to_csv(rows):
+    """Yields CSV text: a header line, then one line per lead."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({**row, "archived": bool(row.get("archived"))})
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,49 @@
+import hmac
+import os
+
+from fastapi import HTTPException, Request
+
+from storage import get_supabase, supabase_url
+
+
+def is_admin_user(user):
+    """
+    A Supabase user is an admin if their email is in ADMIN_EMAILS (comma-separated) or
+    their app_metadata has role "admin". app_metadata can only be set with the service
+    key, so users can't grant it to themselves; a session alone is not enough, since
+    sign-ups may be open.
+    """
+    admin_emails = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()}
+    if user.email and user.email.lower() in admin_emails:
+        return True
+    return (getattr(user, 'app_metadata', None) or {}).get('role') == 'admin'
+
+
+def require_admin(request: Request):
+    """
+    FastAPI dependency for admin-only endpoints. Accepts either
+    `Authorization: Bearer <ADMIN_API_TOKEN>` (self-hosted) or a Supabase session token
+    of a user that passes is_admin_user.
+    """
+    auth = request.headers.get('authorization', '')
+    if not auth.lower().startswith('bearer '):
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    token = auth[7:].strip()
+
+    admin_token = os.getenv('ADMIN_API_TOKEN')
+    if admin_token and hmac.compare_digest(token, admin_token):
+        return {"id": "admin-token"}
+
+    if supabase_url():
+        try:
+            user = get_supabase().auth.get_user(token)
+        except Exception as e:
+            print(f"[AUTH] Supabase token check failed: {e}")
+            user = None
+        if user and user.user:
+            if is_admin_user(user.user):
+                return {"id": user.user.id, "email": user.user.email}
+            print(f"[AUTH] Signed-in user {user.user.id} is not an admin")
+            raise HTTPException(status_code=403, detail="Not an admin")
+
+    raise HTTPException(status_code=401, detail="Invalid token")
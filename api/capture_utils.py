@@ -0,0 +1,209 @@
+import atexit
+import contextvars
+import functools
+import hashlib
+import hmac
+import os
+import random
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import parse_qsl
+
+from pydantic_core import to_json
+
+# Opt-in request recorder for load replay (see backend/replay_traffic.py)
+TRAFFIC_CAPTURE = os.getenv('TRAFFIC_CAPTURE', '0') == '1'
+TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH', 'traffic/capture.ndjson')
+# Fraction of requests recorded
+TRAFFIC_CAPTURE_SAMPLE = float(os.getenv('TRAFFIC_CAPTURE_SAMPLE', '1.0'))
+# Key for the one-way hashes of contact details, image digests and idempotency keys. Set it
+# to the same value on every instance so duplicates are still recognizable across them;
+# unset, each process uses a random key.
+TRAFFIC_CAPTURE_SALT = (os.getenv('TRAFFIC_CAPTURE_SALT') or secrets.token_hex(16)).encode()
+TRAFFIC_CAPTURE_FLUSH_INTERVAL = float(os.getenv('TRAFFIC_CAPTURE_FLUSH_MS', '1000')) / 1000.0
+
+CAPTURE_PREFIX = "/api/"
+# Only these query parameters are kept; anything else could carry identifiers
+CAPTURED_QUERY_PARAMS = ("stream", "limit", "format")
+
+_current = contextvars.ContextVar('traffic_capture', default=None)
+
+
+def scrub(value):
+    """Keyed one-way hash: equal inputs stay equal within a capture, but can't be read back."""
+    if value is None or value == "":
+        return None
+    return hmac.new(TRAFFIC_CAPTURE_SALT, str(value).encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+
+def note(**fields):
+    """Adds fields to the record of the request being captured (no-op when not capturing)."""
+    record = _current.get()
+    if record is not None:
+        record.update(fields)
+
+
+def note_image(data, mime_type):
+    record = _current.get()
+    if record is None:
+        return
+    from upload_utils import image_dimensions
+    try:
+        dimensions = image_dimensions(data, mime_type)
+    except Exception:
+        dimensions = None
+    record["image"] = {
+        "digest": scrub(hashlib.sha256(data).hexdigest()),
+        "bytes": len(data),
+        "mime_type": mime_type,
+        "width": dimensions[0] if dimensions else None,
+        "height": dimensions[1] if dimensions else None,
+    }
+
+
+def note_contact(email, phone):
+    """Hashes of the normalized contact fields, so duplicate resubmits stay recognizable."""
+    digits = ''.join(ch for ch in phone or '' if ch.isdigit())
+    note(contact={"email": scrub((email or '').strip().lower()), "phone": scrub(digits)})
+
+
+def record_upstream(name, seconds, ok=True):
+    record = _current.get()
+    if record is not None:
+        record["upstream"].append({"name": name, "ms": round(seconds * 1000, 1), "ok": ok})
+
+
+@contextmanager
+def upstream(name):
+    """Times a call to a dependency (Gemini, storage, CRM, SMTP) for the current request's record."""
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record_upstream(name, time.perf_counter() - start, ok)
+
+
+def instrument(store, label, methods):
+    """Times the given methods of a store instance as `<label>.<method>` upstream calls."""
+    def timed(method, name):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with upstream(name):
+                return method(*args, **kwargs)
+        return wrapper
+
+    for method in methods:
+        if hasattr(store, method):
+            setattr(store, method, timed(getattr(store, method), f"{label}.{method}"))
+    return store
+
+
+class TrafficRecorder:
+    """Buffers finished request records and appends them to an NDJSON file from a flusher thread."""
+    def __init__(self, path=TRAFFIC_CAPTURE_PATH, flush_interval=TRAFFIC_CAPTURE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def record(self, entry):
+        with self._lock:
+            self._pending.append(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, 'ab') as f:
+                    f.write(b"".join(to_json(entry) + b"\n" for entry in batch))
+            except Exception as e:
+                print(f"[CAPTURE] Failed to write {len(batch)} records: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+class TrafficCaptureMiddleware:
+    """
+    ASGI middleware recording one scrubbed line per /api/ request: arrival time, route
+    template, status, sizes, time to first byte, time to the end of the response and the
+    total including background tasks, plus the upstream calls made on its behalf.
+    Endpoints add request details through note(), note_image() and note_contact().
+    Names, contact details, IPs, tokens and image bytes are never written.
+    """
+    def __init__(self, app, recorder=None, sample=TRAFFIC_CAPTURE_SAMPLE):
+        self.app = app
+        self.recorder = recorder or TrafficRecorder()
+        self.sample = sample
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not scope["path"].startswith(CAPTURE_PREFIX)
+                or (self.sample < 1.0 and random.random() >= self.sample)):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope.get("headers", [])}
+        forwarded = headers.get('x-forwarded-for', '').split(',')[0].strip()
+        client = forwarded or (scope.get("client") or ("",))[0]
+        query = {key: value for key, value in parse_qsl(scope.get("query_string", b"").decode('latin-1'))
+                 if key in CAPTURED_QUERY_PARAMS}
+        record = {
+            "id": uuid.uuid4().hex,
+            "ts": round(time.time(), 3),
+            "method": scope["method"],
+            "route": None,
+            "query": query,
+            "status": None,
+            "request_bytes": int(headers['content-length']) if headers.get('content-length', '').isdigit() else None,
+            "request_type": headers.get('content-type', '').split(';')[0] or None,
+            "response_bytes": 0,
+            "ttfb_ms": None,
+            "duration_ms": None,
+            "total_ms": None,
+            "client": scrub(client),
+            "idempotency_key": scrub(headers.get('idempotency-key')),
+            "campaign": scrub(headers.get('x-campaign')),
+            "accept_ndjson": 'application/x-ndjson' in headers.get('accept', ''),
+            "upstream": [],
+        }
+        start = time.perf_counter()
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                record["status"] = message["status"]
+                record["ttfb_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            elif message["type"] == "http.response.body":
+                record["response_bytes"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    record["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            await send(message)
+
+        token = _current.set(record)
+        try:
+            await self.app(scope, receive, capture_send)
+        finally:
+            _current.reset(token)
+            # Background tasks run inside the app call, so this includes them
+            record["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            # The route template, never the raw path (which can hold lead ids and upload keys)
+            record["route"] = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.recorder.record(record)
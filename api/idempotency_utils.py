@@ -0,0 +1,298 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# How long completed responses are replayed for
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+# An in-progress marker expires after this long, so a crashed worker never blocks a key forever
+IDEMPOTENCY_LOCK_TTL = int(os.getenv('IDEMPOTENCY_LOCK_TTL', '90'))
+# How long a concurrent duplicate waits for the original before giving up with 409
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', '30'))
+POLL_INTERVAL = 0.1
+MAX_KEY_LENGTH = 255
+
+# Statuses worth replaying; 409/429/5xx are transient, so a retry should run again
+NON_CACHEABLE_STATUSES = (409, 429)
+
+
+def _is_error_payload(payload):
+    if not isinstance(payload, dict):
+        return False
+    if payload.get("status") == "error" or payload.get("error") or payload.get("type") == "error":
+        return True
+    # A streamed analysis result, possibly a failed_result placeholder
+    return payload.get("type") == "result" and _is_error_payload(payload.get("result"))
+
+
+def is_error_body(body, media_type):
+    """
+    True when a response reports a failure despite its status code: a JSON body with
+    status "error" or an `error` field, or an NDJSON stream with an error event or a failed
+    result. Those are transient too, so a retry with the same key should run again.
+    """
+    try:
+        if media_type == "application/x-ndjson":
+            return any(_is_error_payload(json.loads(line)) for line in body.splitlines() if line.strip())
+        if media_type == "application/json":
+            return _is_error_payload(json.loads(body))
+    except ValueError:
+        return False
+    return False
+
+
+class IdempotencyConflict(Exception):
+    """The key cannot be used for this request right now (reused, malformed, or still in progress)."""
+    def __init__(self, message, status_code, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class InMemoryIdempotencyStore:
+    """
+    Entries kept in process memory. Concurrent duplicates only meet when they land on
+    the same worker; set IDEMPOTENCY_REDIS_URL to share keys across instances.
+    """
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key, record, ttl):
+        """Stores `record` if the key is free and returns None, else returns the existing record."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+            self._entries[key] = (record, now + ttl)
+            if len(self._entries) > self.max_keys:
+                self._evict(now)
+        return None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry and entry[1] > time.monotonic() else None
+
+    def save(self, key, record, ttl):
+        with self._lock:
+            self._entries[key] = (record, time.monotonic() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _evict(self, now):
+        expired = [key for key, (_, expires) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        if len(self._entries) > self.max_keys:
+            # Still full: drop the entries closest to expiring
+            ordered = sorted(self._entries.items(), key=lambda item: item[1][1])
+            for key, _ in ordered[:len(ordered) // 2]:
+                del self._entries[key]
+
+
+class RedisIdempotencyStore:
+    """Entries shared across instances; reservation is a single SET NX so only one request wins."""
+    def __init__(self, url, prefix="idempotency:"):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.prefix = prefix
+
+    def reserve(self, key, record, ttl):
+        try:
+            if self.client.set(self.prefix + key, json.dumps(record), nx=True, ex=ttl):
+                return None
+            existing = self.client.get(self.prefix + key)
+            return json.loads(existing) if existing else None
+        except Exception as e:
+            # Fail open: without the store the request just runs normally
+            print(f"[IDEMPOTENCY] Redis error (processing request): {e}")
+            return None
+
+    def get(self, key):
+        try:
+            existing = self.client.get(self.prefix + key)
+            return json.loads(existing) if existing else None
+        except Exception as e:
+            print(f"[IDEMPOTENCY] Redis error: {e}")
+            return None
+
+    def save(self, key, record, ttl):
+        try:
+            self.client.set(self.prefix + key, json.dumps(record), ex=ttl)
+        except Exception as e:
+            print(f"[IDEMPOTENCY] Redis error saving response: {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as e:
+            print(f"[IDEMPOTENCY] Redis error releasing key: {e}")
+
+
+def get_idempotency_store():
+    """Redis if IDEMPOTENCY_REDIS_URL (or RATE_LIMIT_REDIS_URL) is set, else in-memory."""
+    redis_url = os.getenv('IDEMPOTENCY_REDIS_URL') or os.getenv('RATE_LIMIT_REDIS_URL')
+    if redis_url:
+        try:
+            return RedisIdempotencyStore(redis_url)
+        except Exception as e:
+            print(f"[IDEMPOTENCY] Redis unavailable, falling back to in-memory store: {e}")
+    return InMemoryIdempotencyStore()
+
+
+def fingerprint(*parts):
+    """Stable digest of the request parts that must match when a key is reused."""
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+class IdempotencyManager:
+    """
+    Records each Idempotency-Key as pending while its request runs, then stores the response.
+    Replays get the stored response; duplicates that arrive while the original is still
+    running wait for it instead of doing the work again.
+    """
+    def __init__(self, store, ttl=IDEMPOTENCY_TTL, lock_ttl=IDEMPOTENCY_LOCK_TTL, wait=IDEMPOTENCY_WAIT):
+        self.store = store
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait = wait
+
+    async def begin(self, key, request_fingerprint):
+        """
+        Returns None when this request owns the key and should run, or the stored response
+        record to replay. Raises IdempotencyConflict on reuse with a different request or
+        when the original is still running after `wait` seconds.
+        """
+        deadline = time.monotonic() + self.wait
+        while True:
+            record = self.store.reserve(key, {"state": "pending", "fingerprint": request_fingerprint}, self.lock_ttl)
+            if record is None:
+                return None
+            if record.get("fingerprint") != request_fingerprint:
+                raise IdempotencyConflict("Idempotency-Key was already used for a different request", 422)
+            if record.get("state") == "done":
+                return record
+            if time.monotonic() >= deadline:
+                raise IdempotencyConflict("A request with this Idempotency-Key is still in progress", 409, retry_after=1)
+            # Pending: wait for the original to finish (or fail and release the key)
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def complete(self, key, request_fingerprint, status_code, body, media_type):
+        if status_code >= 500 or status_code in NON_CACHEABLE_STATUSES or is_error_body(body, media_type):
+            self.release(key)
+            return
+        self.store.save(key, {
+            "state": "done",
+            "fingerprint": request_fingerprint,
+            "status_code": status_code,
+            "body": body.decode('utf-8'),
+            "media_type": media_type,
+        }, self.ttl)
+
+    def release(self, key):
+        self.store.delete(key)
+
+
+def replay_response(record):
+    return Response(
+        content=record["body"].encode('utf-8'),
+        status_code=record["status_code"],
+        media_type=record["media_type"],
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def conflict_response(e):
+    headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+    return JSONResponse(status_code=e.status_code, content={"status": "error", "message": e.message}, headers=headers)
+
+
+def _capture_stream(response, on_done):
+    """Passes a streaming body through unchanged and hands the full body to on_done (None if cut short)."""
+    body_iterator = response.body_iterator
+
+    async def capture():
+        chunks = []
+        finished = False
+        try:
+            async for chunk in body_iterator:
+                chunks.append(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+                yield chunk
+            finished = True
+        finally:
+            on_done(b"".join(chunks) if finished else None)
+
+    response.body_iterator = capture()
+    return response
+
+
+def idempotent(scope, request_parts):
+    """
+    Endpoint decorator adding Idempotency-Key support. `request_parts(kwargs)` returns the
+    values that identify the request (reusing a key with different values is a 422), or an
+    awaitable of them.
+    Requests without the header run unchanged. The endpoint must take a `request` argument.
+    """
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            request = kwargs.get('request')
+            header = request.headers.get('idempotency-key') if request is not None else None
+            if not header:
+                return await endpoint(*args, **kwargs)
+            if len(header) > MAX_KEY_LENGTH:
+                return conflict_response(IdempotencyConflict("Idempotency-Key is too long", 400))
+
+            key = f"{scope}:{header}"
+            parts = request_parts(kwargs)
+            if inspect.isawaitable(parts):
+                parts = await parts
+            request_fingerprint = fingerprint(*parts)
+            try:
+                record = await idempotency.begin(key, request_fingerprint)
+            except IdempotencyConflict as e:
+                print(f"[IDEMPOTENCY] {scope} key rejected: {e.message}")
+                return conflict_response(e)
+            if record is not None:
+                print(f"[IDEMPOTENCY] Replaying stored {scope} response")
+                return replay_response(record)
+
+            try:
+                response = await endpoint(*args, **kwargs)
+            except BaseException:
+                idempotency.release(key)
+                raise
+
+            if not isinstance(response, Response):
+                response = JSONResponse(content=jsonable_encoder(response))
+
+            if isinstance(response, StreamingResponse):
+                status_code, media_type = response.status_code, response.media_type
+
+                def on_done(body):
+                    if body is None:
+                        idempotency.release(key)
+                    else:
+                        idempotency.complete(key, request_fingerprint, status_code, body, media_type)
+                return _capture_stream(response, on_done)
+
+            idempotency.complete(key, request_fingerprint, response.status_code, bytes(response.body), response.media_type)
+            return response
+        return wrapper
+    return decorator
+
+
+idempotency = IdempotencyManager(get_idempotency_store())
@@ -0,0 +1,235 @@
+import atexit
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+# Longest side sent to the vision model; larger photos are downscaled and re-encoded as JPEG
+MAX_DIMENSION = 1024
+JPEG_QUALITY = 85
+
+# Worker processes for image preprocessing; 0 keeps it on the request thread (the default,
+# and the right choice on Vercel, where every invocation is its own short-lived process)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS') or '0')
+# Jobs allowed in the pool at once (running + queued); further callers wait for a slot
+IMAGE_WORKER_MAX_PENDING = int(os.getenv('IMAGE_WORKER_MAX_PENDING', '0')) or 2 * max(IMAGE_WORKERS, 1)
+# How long a caller waits for a slot, then for its result, before processing inline instead
+IMAGE_WORKER_QUEUE_TIMEOUT = float(os.getenv('IMAGE_WORKER_QUEUE_TIMEOUT', '5'))
+IMAGE_WORKER_JOB_TIMEOUT = float(os.getenv('IMAGE_WORKER_JOB_TIMEOUT', '20'))
+
+
+def transform(data, mime_type, max_size=MAX_DIMENSION):
+    """
+    Decodes `data`, downscales it past `max_size` and takes the local
+    technical measurements. Returns (resized bytes or None if unchanged, mime_type, metrics,
+    timings); timings are per-stage seconds.
+    """
+    from PIL import Image
+    from local_vision import image_metrics
+
+    timings = {}
+    start = time.perf_counter()
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    original_size = img.size
+    timings["decode"] = time.perf_counter() - start
+
+    resized = None
+    if img.width > max_size or img.height > max_size:
+        print(f"Resizing image from {img.width}x{img.height} to max {max_size}px")
+        stage = time.perf_counter()
+        img.thumbnail((max_size, max_size))
+        timings["resize"] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        buffer = io.BytesIO()
+        # Convert to RGB if necessary (e.g. for PNGs with transparency)
+        if img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        img.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+        resized = buffer.getvalue()
+        mime_type = "image/jpeg"  # Force JPEG after resizing
+        timings["encode"] = time.perf_counter() - stage
+        print(f"Resized image size: {len(resized)} bytes")
+
+    stage = time.perf_counter()
+    metrics = image_metrics(img, original_size)
+    timings["metrics"] = time.perf_counter() - stage
+    return resized, mime_type, metrics, timings
+
+
+def _run_job(name, size, mime_type):
+    """
+    Worker side: reads the upload from shared memory and writes the resized JPEG back into
+    the same block (the input is fully decoded by then). Only the name, lengths, metrics and
+    timings cross the process boundary. Output larger than the block comes back as bytes.
+    Timings include "started_at" (wall clock) so the caller can tell queueing from work.
+    """
+    started_at = time.time()
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # One local memcpy; BytesIO then wraps these bytes without copying them again
+        resized, mime_type, metrics, timings = transform(bytes(shm.buf[:size]), mime_type)
+        timings["started_at"] = started_at
+        if resized is None:
+            return None, mime_type, metrics, timings
+        if len(resized) <= size:
+            shm.buf[:len(resized)] = resized
+            return len(resized), mime_type, metrics, timings
+        return resized, mime_type, metrics, timings
+    finally:
+        shm.close()
+
+
+def _init_worker():
+    # Load Pillow codecs and NumPy once per worker rather than on the first job
+    import numpy  # noqa: F401
+    from PIL import Image
+    Image.init()
+    import local_vision  # noqa: F401
+
+
+class ImageWorkerPool:
+    """
+    Runs image preprocessing in worker processes so decoding and resizing never hold the
+    request process's GIL. Upload bytes go into a shared-memory block that the worker reads
+    in place and writes the resized output back into.
+
+    At most `max_pending` jobs are in the pool; callers wait up to `queue_timeout` for a
+    slot, and a job that can't get one (or a worker that fails or hangs) is processed inline,
+    so a saturated pool slows scans down rather than failing them. The pool starts on the
+    first job; stats() reports per-job queue wait and per-stage processing times.
+    """
+    def __init__(self, workers, max_pending=IMAGE_WORKER_MAX_PENDING,
+                 queue_timeout=IMAGE_WORKER_QUEUE_TIMEOUT, job_timeout=IMAGE_WORKER_JOB_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.job_timeout = job_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"jobs": 0, "inline": 0, "rejected": 0, "failed": 0}
+        self._totals = {}
+        self._counts = {}
+        self._max = {}
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded server process can copy held locks into the child
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+                print(f"[IMAGE_POOL] Started {self.workers} workers (max pending {self.max_pending})")
+            return self._executor
+
+    def process(self, image_bytes, mime_type):
+        """Returns (image_bytes, mime_type, metrics) like preprocess_image; raises if the image can't be decoded."""
+        if not self.enabled:
+            resized, mime_type, metrics, _ = transform(image_bytes, mime_type)
+            return resized or image_bytes, mime_type, metrics
+
+        queued = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._record("rejected")
+            print(f"[IMAGE_POOL] No free slot after {self.queue_timeout}s; processing inline")
+            return self._inline(image_bytes, mime_type)
+        try:
+            with self._lock:
+                self._pending += 1
+            return self._submit(image_bytes, mime_type, queued)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def _submit(self, image_bytes, mime_type, queued):
+        size = len(image_bytes)
+        submitted_at = time.time() - (time.perf_counter() - queued)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            shm.buf[:size] = image_bytes
+            future = self._get_executor().submit(_run_job, shm.name, size, mime_type)
+            try:
+                output, mime_type, metrics, timings = future.result(timeout=self.job_timeout)
+            except FutureTimeout:
+                future.cancel()
+                self._record("failed")
+                print(f"[IMAGE_POOL] Job timed out after {self.job_timeout}s; processing inline")
+                return self._inline(image_bytes, mime_type)
+            except BrokenProcessPool as e:
+                # A worker died (e.g. OOM-killed); start a fresh pool for the next job
+                self._reset()
+                self._record("failed")
+                print(f"[IMAGE_POOL] Worker pool broke ({e}); processing inline")
+                return self._inline(image_bytes, mime_type)
+
+            if output is None:
+                output = image_bytes
+            elif isinstance(output, int):
+                output = bytes(shm.buf[:output])
+            queue_wait = max(0.0, timings.pop("started_at") - submitted_at)
+            self._record("jobs", queue_wait=queue_wait, total=time.perf_counter() - queued, stages=timings)
+            return output, mime_type, metrics
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _inline(self, image_bytes, mime_type):
+        self._record("inline")
+        resized, mime_type, metrics, _ = transform(image_bytes, mime_type)
+        return resized or image_bytes, mime_type, metrics
+
+    def _reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, outcome, queue_wait=None, total=None, stages=None):
+        with self._lock:
+            self._stats[outcome] += 1
+            if total is not None:
+                for name, value in (("queue_wait", queue_wait), ("total", total), *(stages or {}).items()):
+                    self._totals[name] = self._totals.get(name, 0.0) + value
+                    self._counts[name] = self._counts.get(name, 0) + 1
+                    self._max[name] = max(self._max.get(name, 0.0), value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                **self._stats,
+                # Per stage: queue_wait, decode, resize, encode, metrics and total (end to end)
+                "timings_ms": {
+                    name: {
+                        "avg": round(1000 * total / self._counts[name], 1),
+                        "max": round(1000 * self._max[name], 1),
+                    }
+                    for name, total in self._totals.items()
+                },
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+image_pool = ImageWorkerPool(IMAGE_WORKERS)
+atexit.register(image_pool.shutdown)
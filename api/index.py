@@ -1,14 +1,16 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import json
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
 import os
 import time
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from pydantic import BaseModel
-from supabase import create_client, Client
 from dotenv import load_dotenv
 
+_boot_started = time.perf_counter()
+
 # Load valid environment
 load_dotenv()
 
@@ -18,16 +20,69 @@ sys.path.append(os.path.dirname(__file__))
 
 # Import local utils
 try:
-    from vision_logic import analyze_image
+    from vision_logic import analyze_image, analyze_images, analyze_image_stream, router as vision_router
 except ImportError as e:
     print(f"Vision Import Error: {e}")
     def analyze_image(img_data, mime_type):
         return {"suitability_score": 70, "market_categorization": "Unknown"}
+    def analyze_images(images):
+        results = [analyze_image(img_data, mime_type) for img_data, mime_type in images]
+        return {"images": results, "aggregate": results[0]}
+    def analyze_image_stream(img_data, mime_type):
+        yield {"type": "result", "result": analyze_image(img_data, mime_type)}
+    vision_router = None
 
-from webhook_utils import send_webhook
+from webhook_utils import deliver_crm_webhook, delivery_log
 from email_utils import send_lead_email
+from admission_utils import admission, AdmissionMiddleware, AdmissionRejected, client_ip_from_request, rejection_response
+from upload_utils import (
+    read_image_upload, UploadLimitMiddleware, UploadRejected,
+    new_upload_key, verify_stored_upload, sniff_image_type, UPLOAD_KEY_RE, UPLOAD_URL_TTL, MAX_UPLOAD_BYTES, MAX_PHOTOS,
+)
+from stream_utils import ndjson_line
+from storage import (
+    get_lead_store, get_blob_store, put_image, promote_upload, verify_upload_signature, file_digest, stored_image_digest,
+)
+from auth_utils import require_admin
+from usage_metrics import usage_meter
+from analysis_model import analysis_to_json, normalize_analysis
+from pydantic_core import from_json
+from idempotency_utils import idempotent
+from archive_utils import iter_export_leads, leads_to_csv
+from search_utils import search_leads
+from image_workers import image_pool
+from capture_utils import TRAFFIC_CAPTURE, TrafficCaptureMiddleware, note, note_image, note_contact, scrub, upstream
+from warmup_utils import Warmup, warm_vision, warm_lead_store, warm_blob_store, warm_crm, warm_image_pipeline
+
+warmup = Warmup({
+    "vision": lambda: warm_vision(vision_router) if vision_router else "unavailable",
+    "lead_store": warm_lead_store,
+    "blob_store": warm_blob_store,
+    "crm": warm_crm,
+    "image_pipeline": warm_image_pipeline,
+})
+# Module imports (SDKs, genai.configure, router construction) are the first part of a cold start
+warmup.boot_seconds = round(time.perf_counter() - _boot_started, 3)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Open clients and connections before the first request instead of during it
+    if os.getenv('WARMUP_ON_STARTUP', '1') == '1':
+        await run_in_threadpool(warmup.run)
+    yield
+    image_pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# Largest body per upload endpoint; a multi-photo scan carries up to MAX_PHOTOS files
+UPLOAD_PATHS = {"/api/lead": MAX_UPLOAD_BYTES, "/api/analyze": MAX_UPLOAD_BYTES * MAX_PHOTOS}
 
-app = FastAPI()
+# Counts body bytes as they arrive, before the multipart form is parsed; added before CORS
+# so its 413 responses still carry the CORS headers
+app.add_middleware(UploadLimitMiddleware, limits=UPLOAD_PATHS)
+
+# Per-IP / per-campaign buckets for /api/analyze, checked before the photos are received
+app.add_middleware(AdmissionMiddleware, controller=admission, paths={"/api/analyze"})
 
 # CORS
 app.add_middleware(
@@ -38,92 +93,104 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Helper to get Supabase client
-def get_supabase() -> Client:
-    url = os.getenv('SUPABASE_URL') or os.getenv('VITE_SUPABASE_URL')
-    key = (
-        os.getenv('BACKEND_SERVICE_KEY') or
-        os.getenv('SUPABASE_SERVICE_ROLE_KEY') or 
-        os.getenv('VITE_SUPABASE_ANON_KEY') or 
-        os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY') or 
-        os.getenv('SUPABASE_ANON_KEY') or 
-        os.getenv('SUPABASE_PUBLISHABLE_KEY')
-    )
-    if not url or not key:
-        raise HTTPException(status_code=500, detail="Supabase credentials missing")
-    return create_client(url, key)
+# Opt-in traffic recorder for load replay; added last so it sees the whole request
+if TRAFFIC_CAPTURE:
+    app.add_middleware(TrafficCaptureMiddleware)
+
+def score_and_category(analysis_json):
+    score = analysis_json.get('suitability_score', 0)
+    market_data = analysis_json.get('market_categorization', {})
+    category = market_data.get('primary', 'Unknown') if isinstance(market_data, dict) else str(market_data)
+    return score, category
 
-def process_lead_background(lead_record: dict, client_ip: str, user_agent: str):
+def process_stored_upload(lead_record: dict, image_key: str):
+    """
+    Derivative stage for a direct upload: moves the object to its content-addressed key and,
+    if the lead arrived without an analysis, analyzes the stored photo. Updates the lead
+    (and `lead_record`, so the CRM gets the final image URL).
+    """
+    try:
+        image_digest, image_url, content = promote_upload(image_key)
+    except Exception as e:
+        # The lead keeps pointing at the incoming object, which image GC leaves in place
+        print(f"[UPLOAD] Promoting {image_key} for lead {lead_record.get('id')} failed: {e}")
+        return
+    fields = {'image_url': image_url, 'image_digest': image_digest}
+
+    if not lead_record.get('analysis_json'):
+        try:
+            mime_type = 'image/png' if image_key.endswith('.png') else 'image/jpeg'
+            analysis_json = normalize_analysis(analyze_image(content, mime_type=mime_type))
+            fields['analysis_json'] = analysis_json
+            fields['score'], fields['category'] = score_and_category(analysis_json)
+        except Exception as e:
+            print(f"[UPLOAD] Background analysis for lead {lead_record.get('id')} failed: {e}")
+
+    get_lead_store().update(lead_record['id'], fields)
+    lead_record.update(fields)
+    print(f"[UPLOAD] Lead {lead_record.get('id')} image stored as {image_digest[:12]}")
+
+def process_lead_background(lead_record: dict, client_ip: str, user_agent: str, image_key: Optional[str] = None):
     """
     Background task to handle Meta CAPI, CRM Webhook, and Emails.
     This runs after the response has been sent to the user.
     """
     print(f"Starting background processing for lead {lead_record.get('id')}")
     
+    # 0. Direct upload: store the photo under its digest before anything links to it
+    if image_key:
+        process_stored_upload(lead_record, image_key)
+    
     # 1. Meta Conversion API
     try:
-        from api.meta_utils import send_conversion_event
-        send_conversion_event(lead_record, client_ip, user_agent)
+        from meta_utils import send_conversion_event
+        with upstream("meta"):
+            send_conversion_event(lead_record, client_ip, user_agent)
     except Exception as e:
         print(f"Meta CAPI failed in background: {e}")
 
     # 2. CRM Webhook
     webhook_url = os.getenv('CRM_WEBHOOK_URL')
     if webhook_url:
-        try:
-            supabase = get_supabase()
-            
-            # Prepare CRM payload
-            address = f"{lead_record.get('city', '')}, {lead_record.get('zip_code', '')}"
-            
-            crm_payload = {
-                'campaign': lead_record.get('campaign', ''),
-                'email': lead_record.get('email'),
-                'telephone': lead_record.get('phone'),
-                'address': address,
-                'firstname': lead_record.get('first_name'),
-                'lastname': lead_record.get('last_name'),
-                'image': lead_record.get('image_url', ''),
-                'analyticsid': '', 
-                'age': str(lead_record.get('age', '')),
-                'gender': 'M' if lead_record.get('gender') == 'Male' else 'F',
-                'opt_in': 'true' if lead_record.get('wants_assessment') else 'false'
-            }
-            
-            import requests
-            headers = {
-                'Content-Type': 'application/json',
-                'User-Agent': 'ModelScanner/1.0'
-            }
-            
-            print(f"Sending background webhook to: {webhook_url}")
-            wb_resp = requests.post(webhook_url, json=crm_payload, headers=headers, timeout=10)
-            
-            status = 'success' if wb_resp.status_code < 300 else 'failed'
-            resp_text = wb_resp.text
-            
-        except Exception as e:
-            status = 'failed'
-            resp_text = f"Background Error: {str(e)[:200]}"
-            
-        # Update Webhook Status
-        try:
-            get_supabase().table('leads').update({
-                'webhook_sent': True,
-                'webhook_status': status,
-                'webhook_response': resp_text
-            }).eq('id', lead_record['id']).execute()
-        except Exception as e:
-            print(f"Failed to update webhook status: {e}")
+        print(f"Sending background webhook to: {webhook_url}")
+        # Appended to the delivery log; the lead row itself is not updated
+        status, _ = deliver_crm_webhook(lead_record, webhook_url)
+        print(f"Background webhook {status} for lead {lead_record.get('id')}")
 
     # 3. Send Email Notification
     try:
         print("Sending background email notification...")
-        send_lead_email(lead_record)
+        with upstream("smtp"):
+            send_lead_email(lead_record)
     except Exception as e:
         print(f"Error sending background email: {e}")
 
+    # Serverless instances may be frozen right after the response; don't leave attempts buffered
+    if os.getenv('VERCEL'):
+        delivery_log.flush()
+
+async def _upload_parts(file):
+    """Content digest of an uploaded photo, the same image_digest put_image stores it under."""
+    return await run_in_threadpool(file_digest, file.file) if file else None
+
+async def _stored_upload_parts(key):
+    """Content digest of a direct upload, so retrying it as a form upload matches; the key if it can't be read."""
+    if not UPLOAD_KEY_RE.match(key):
+        return key
+    try:
+        return await run_in_threadpool(stored_image_digest, key)
+    except Exception:
+        return key
+
+async def _lead_parts(kw):
+    if kw['file']:
+        image = await _upload_parts(kw['file'])
+    else:
+        image = await _stored_upload_parts(kw['image_key']) if kw['image_key'] else None
+    return (kw['email'], kw['phone'], kw['first_name'], kw['last_name'], kw['campaign'], image)
+
 @app.post("/api/lead")
+@idempotent("lead", _lead_parts)
 async def create_lead(
     background_tasks: BackgroundTasks,  # Injected by FastAPI
     file: Optional[UploadFile] = File(None),
@@ -138,14 +205,17 @@ async def create_lead(
     zip_code: str = Form(...),
     campaign: Optional[str] = Form(None),
     wants_assessment: Optional[str] = Form("false"),
-    analysis_data: Optional[str] = Form("{}")
+    analysis_data: Optional[str] = Form("{}"),
+    image_key: Optional[str] = Form(None)  # From /api/upload-url, instead of `file`
 ):
+    note_contact(email, phone)
+    note(campaign=scrub(campaign), direct_upload=bool(image_key), has_analysis=analysis_data not in (None, "", "{}"))
     try:
-        supabase = get_supabase()
+        store = get_lead_store()
         
         # 1. Duplicate Check
-        existing = supabase.table('leads').select('id').or_(f"email.eq.{email},phone.eq.{phone}").execute()
-        if existing.data and len(existing.data) > 0:
+        # Store calls block on network/disk, keep them off the event loop
+        if await run_in_threadpool(store.find_by_contact, email, phone):
             return JSONResponse(
                 status_code=400,
                 content={"status": "error", "message": "This email or phone number has already been submitted."}
@@ -153,53 +223,53 @@ async def create_lead(
 
         # 2. Image Upload
         image_url = None
+        image_digest = None
         if file:
-            # Validate allowed file types
-            if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
+            # Validate magic bytes, size and dimensions while streaming; stop at the first bad chunk
+            try:
+                content, sniffed_type = await read_image_upload(file)
+                note_image(content, sniffed_type)
+            except UploadRejected as e:
                 return JSONResponse(
-                    status_code=400,
-                    content={"status": "error", "message": "Only JPEG and PNG images are allowed."}
+                    status_code=e.status_code,
+                    content={"status": "error", "message": e.message}
                 )
 
             try:
-                content = await file.read()
-                timestamp = int(time.time())
-                clean_email = email.replace('@', '-at-').replace('.', '-')
-                
-                # Determine correct extension based on actual file type
-                extension = '.jpeg'  # default
-                if file.content_type == 'image/png':
-                    extension = '.png'
-                elif file.content_type in ['image/jpeg', 'image/jpg']:
-                    extension = '.jpeg'
-                    
-                filename = f"{clean_email}_{timestamp}{extension}"
-                
-                # Upload
-                upload_response = supabase.storage.from_("lead-images").upload(
-                    path=filename,
-                    file=content,
-                    file_options={"content-type": "application/octet-stream"}
-                )
-                
-                sb_url = os.getenv('SUPABASE_URL') or os.getenv('VITE_SUPABASE_URL')
-                image_url = f"{sb_url}/storage/v1/object/public/lead-images/{filename}"
+                # Stored once per distinct image; resubmitting the same photo links to the existing object
+                image_digest, image_url = await run_in_threadpool(put_image, content, sniffed_type)
             except Exception as e:
                 print(f"Upload failed: {e}")
-                return {
-                    "status": "error",
-                    "message": f"Image upload failed: {str(e)}",
-                }
+                return JSONResponse(
+                    status_code=502,
+                    content={"status": "error", "message": f"Image upload failed: {str(e)}"}
+                )
+            image_key = None
+        elif image_key:
+            # Uploaded straight to storage; check the object's header instead of receiving the bytes
+            blobs = get_blob_store()
+            try:
+                await run_in_threadpool(verify_stored_upload, blobs, image_key)
+            except UploadRejected as e:
+                return JSONResponse(
+                    status_code=e.status_code,
+                    content={"status": "error", "message": e.message}
+                )
+            # Valid right away; the background stage moves it to its content-addressed key
+            image_url = blobs.public_url(image_key)
 
         # 3. Prepare Data
         try:
-            analysis_json = json.loads(analysis_data)
+            analysis_json = from_json(analysis_data) if analysis_data else {}
+            # Same validated shape as /api/analyze returned; an empty object stays empty
+            if isinstance(analysis_json, dict) and analysis_json:
+                analysis_json = normalize_analysis(analysis_json)
+            elif not isinstance(analysis_json, dict):
+                analysis_json = {}
         except:
             analysis_json = {}
             
-        score = analysis_json.get('suitability_score', 0)
-        market_data = analysis_json.get('market_categorization', {})
-        category = market_data.get('primary', 'Unknown') if isinstance(market_data, dict) else str(market_data)
+        score, category = score_and_category(analysis_json)
         
         # Insert Record
         lead_record = {
@@ -217,24 +287,20 @@ async def create_lead(
             'category': category,
             'analysis_json': analysis_json,
             'image_url': image_url,
+            'image_digest': image_digest,
             'webhook_sent': False,
             'webhook_status': 'pending',
             'webhook_response': None
         }
         
-        result = supabase.table('leads').insert(lead_record).execute()
-        
-        if not result.data:
-            raise Exception("Insert failed")
-            
-        final_record = result.data[0]
+        final_record = await run_in_threadpool(store.insert, lead_record)
         
         # --- 4. Queue Background Tasks ---
         # Get client info for Meta
         client_ip = request.client.host if request and request.client else "0.0.0.0"
         user_agent = request.headers.get('user-agent', '') if request else ""
         
-        background_tasks.add_task(process_lead_background, final_record, client_ip, user_agent)
+        background_tasks.add_task(process_lead_background, final_record, client_ip, user_agent, image_key)
             
         return {
             "status": "success",
@@ -253,26 +319,211 @@ async def create_lead(
         print(f"Error: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+class UploadUrlRequest(BaseModel):
+    content_type: str = 'image/jpeg'
+    size: Optional[int] = None
+
+@app.post("/api/upload-url")
+async def upload_url_endpoint(request: Request, req: UploadUrlRequest):
+    """
+    Short-lived signed URL for uploading the lead photo straight to storage; send the
+    returned `key` as `image_key` with /api/lead instead of the file.
+    """
+    client_ip = client_ip_from_request(request)
+    try:
+        admission.check_upload_rate(client_ip)
+        if req.size is not None and req.size > MAX_UPLOAD_BYTES:
+            raise UploadRejected(f"Upload too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB).", status_code=413)
+        key = new_upload_key(req.content_type)
+        signed = await run_in_threadpool(get_blob_store().signed_upload_url, key, req.content_type, UPLOAD_URL_TTL)
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except UploadRejected as e:
+        return JSONResponse(status_code=e.status_code, content={"status": "error", "message": e.message})
+    except Exception as e:
+        print(f"[UPLOAD] Could not sign upload URL: {e}")
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Could not create upload URL"})
+
+    url = signed["url"]
+    if url.startswith('/'):
+        # Local store: the signed URL is on this server
+        url = str(request.base_url).rstrip('/') + url
+    return {"key": key, "upload_url": url, "method": signed["method"], "headers": signed["headers"], "expires_in": UPLOAD_URL_TTL}
+
+@app.put("/api/uploads/{key:path}")
+async def signed_upload_endpoint(key: str, request: Request, expires: int = 0, signature: str = ""):
+    """Receiver for signed upload URLs when the local blob store is in use (Supabase takes them directly)."""
+    if not UPLOAD_KEY_RE.match(key) or not verify_upload_signature(key, expires, signature):
+        return JSONResponse(status_code=403, content={"status": "error", "message": "Invalid or expired upload URL"})
+    chunks = []
+    total = 0
+    async for chunk in request.stream():
+        total += len(chunk)
+        if total > MAX_UPLOAD_BYTES:
+            return JSONResponse(status_code=413, content={"status": "error", "message": "Upload too large"})
+        chunks.append(chunk)
+    content = b"".join(chunks)
+    if sniff_image_type(content[:16]) is None:
+        return JSONResponse(status_code=415, content={"status": "error", "message": "Only JPEG and PNG images are allowed."})
+    await run_in_threadpool(get_blob_store().put, key, content, request.headers.get('content-type', 'image/jpeg'))
+    return {"status": "success", "key": key}
+
+async def stream_analysis(content, mime_type):
+    """
+    NDJSON body for streaming mode. The Gemini slot is taken inside the stream so it is
+    always released with it, including when the client goes away mid-analysis.
+    """
+    try:
+        await admission.gate.acquire()
+    except AdmissionRejected as e:
+        yield ndjson_line({"type": "error", "error": e.reason, "retry_after": e.retry_after})
+        return
+
+    try:
+        async for event in iterate_in_threadpool(analyze_image_stream(content, mime_type=mime_type)):
+            # Results are AnalysisModel-normalized, so the score floor is already applied
+            yield ndjson_line(event)
+    finally:
+        admission.gate.release()
+
+async def _analyze_parts(kw):
+    request = kw['request']
+    wants_stream = kw['stream'] or 'application/x-ndjson' in request.headers.get('accept', '')
+    photos = [await _upload_parts(upload) for upload in kw['files'] or []]
+    return (await _upload_parts(kw['file']), photos, kw['campaign'] or request.headers.get('x-campaign'), wants_stream)
+
 @app.post("/api/analyze")
-async def analyze_endpoint(file: UploadFile = File(...)):
+@idempotent("analyze", _analyze_parts)
+async def analyze_endpoint(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    files: Optional[List[UploadFile]] = File(None),  # Multi-photo scan: 2..MAX_PHOTOS photos of one person
+    campaign: Optional[str] = None,
+    stream: bool = False,
+):
     try:
-        content = await file.read()
-        mime_type = file.content_type or "image/jpeg"
+        client_ip = client_ip_from_request(request)
+        campaign = campaign or request.headers.get('x-campaign')
+        uploads = ([file] if file else []) + list(files or [])
+        wants_stream = stream or 'application/x-ndjson' in request.headers.get('accept', '')
         
-        result = analyze_image(content, mime_type=mime_type)
+        # The rate buckets were already taken by AdmissionMiddleware; the concurrency gate is below
+        note(campaign=scrub(campaign), stream=bool(stream), photos=len(uploads))
+        if not uploads:
+            raise UploadRejected("No image uploaded.")
+        if len(uploads) > MAX_PHOTOS:
+            raise UploadRejected(f"Too many photos (max {MAX_PHOTOS}).")
+
+        if len(uploads) > 1:
+            images = [await read_image_upload(upload) for upload in uploads]
+            note_image(*images[0])
+            # One Gemini slot and one model round trip for the whole set
+            async with admission.gate.slot():
+                result = await run_in_threadpool(analyze_images, images)
+            # The aggregate keeps the single-photo shape, so existing clients can read it as is
+            body = {**result["aggregate"], "images": result["images"]}
+            if wants_stream:
+                return Response(content=ndjson_line({"type": "result", "result": body}), media_type="application/x-ndjson")
+            return Response(content=analysis_to_json(body), media_type="application/json")
+
+        content, mime_type = await read_image_upload(uploads[0])
+        note_image(content, mime_type)
         
-        # DOUBLE CHECK: Enforce strict minimum score of 70 at the API level
-        # This overrides anything returned by the vision engine
-        try:
-            current_score = int(result.get('suitability_score', 0))
-            result['suitability_score'] = max(current_score, 70)
-        except:
-            result['suitability_score'] = 70
-            
-        return result
+        # Streaming mode: local pre-score first, then model fields as they arrive
+        if wants_stream:
+            admission.gate.check_capacity()
+            return StreamingResponse(
+                stream_analysis(content, mime_type),
+                media_type="application/x-ndjson",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
+        # Only validated uploads take one of the limited Gemini slots
+        async with admission.gate.slot():
+            # Run the blocking Gemini call off the event loop so queued requests stay responsive
+            result = await run_in_threadpool(analyze_image, content, mime_type=mime_type)
+        
+        # DOUBLE CHECK: Serializing through AnalysisModel enforces the minimum score of 70
+        # at the API level, whatever the vision engine returned, and encodes straight to bytes
+        return Response(content=analysis_to_json(result), media_type="application/json")
+    except AdmissionRejected as e:
+        print(f"[ADMISSION] Rejected analyze from {client_ip}: {e.reason}")
+        return rejection_response(e)
+    except UploadRejected as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/api/leads")
+async def list_leads_endpoint(limit: int = 50, before: Optional[str] = None, admin: dict = Depends(require_admin)):
+    """Newest-first page of leads; pass `next_before` from the previous page to get the next one."""
+    try:
+        leads, next_before = await run_in_threadpool(get_lead_store().list, max(1, min(limit, 500)), before)
+        return {"leads": leads, "next_before": next_before}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@app.get("/api/leads/search")
+async def search_leads_endpoint(q: str = "", limit: int = 50, offset: int = 0, admin: dict = Depends(require_admin)):
+    """
+    Leads matching every word of `q` (name, email, phone in any format, city or zip), best
+    match first; pass `next_offset` from the previous page to get the next one. When
+    nothing matches exactly, near matches come back with "fuzzy": true.
+    """
+    try:
+        return await run_in_threadpool(search_leads, q, limit, offset)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/api/leads/export")
+async def export_leads_endpoint(format: str = "csv", admin: dict = Depends(require_admin)):
+    """All leads, hot and archived, newest first, streamed as CSV or NDJSON (format=ndjson)."""
+    if format == "ndjson":
+        rows = (ndjson_line(lead) for lead in iter_export_leads())
+        media_type = "application/x-ndjson"
+    else:
+        rows = leads_to_csv(iter_export_leads())
+        media_type = "text/csv"
+    return StreamingResponse(
+        iterate_in_threadpool(rows),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="leads.{"ndjson" if format == "ndjson" else "csv"}"'}
+    )
+
+@app.get("/api/leads/{lead_id}/deliveries")
+async def lead_deliveries_endpoint(lead_id: str, admin: dict = Depends(require_admin)):
+    """Every CRM delivery attempt for a lead, oldest first."""
+    try:
+        return {"deliveries": await run_in_threadpool(get_lead_store().deliveries, lead_id)}
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/api/warmup")
+async def warmup_endpoint():
+    """
+    Initializes clients, opens pooled connections (Gemini, storage, CRM) and loads the image
+    codecs, reporting per-stage timings. Safe to hit from a scheduler: within
+    WARMUP_MIN_INTERVAL it returns the last report without redoing the work, and it makes
+    no billed model calls.
+    """
+    report = await run_in_threadpool(warmup.run)
+    return JSONResponse(status_code=200 if report["status"] == "ok" else 503, content=report)
+
+@app.get("/api/metrics")
+async def metrics_endpoint(admin: dict = Depends(require_admin)):
+    """
+    Admission gate, per-provider health / adaptive concurrency (limit, in-flight, queue depth),
+    per-model token usage, estimated cost and latency, and image worker pool timings.
+    """
+    return {
+        "admission": admission.stats(),
+        "vision": vision_router.stats() if vision_router else {},
+        "usage": usage_meter.snapshot(),
+        "image_pool": image_pool.stats(),
+    }
+
 class RetryRequest(BaseModel):
     lead_id: str
 
@@ -280,7 +531,7 @@ class RetryRequest(BaseModel):
 async def retry_webhook(req: RetryRequest):
     print(f"[RETRY_WEBHOOK] Starting retry for lead_id={req.lead_id}")
     try:
-        supabase = get_supabase()
+        store = get_lead_store()
         webhook_url = os.getenv('CRM_WEBHOOK_URL')
         
         if not webhook_url:
@@ -289,46 +540,21 @@ async def retry_webhook(req: RetryRequest):
         
         print(f"[RETRY_WEBHOOK] Webhook URL: {webhook_url[:30]}...")
             
-        resp = supabase.table('leads').select('*').eq('id', req.lead_id).execute()
-        if not resp.data:
+        lead_record = store.get(req.lead_id)
+        if not lead_record:
             print(f"[RETRY_WEBHOOK] ERROR: Lead {req.lead_id} not found in database")
             raise HTTPException(status_code=404, detail="Lead not found")
              
-        lead_record = resp.data[0]
         print(f"[RETRY_WEBHOOK] Found lead: {lead_record.get('first_name')} {lead_record.get('last_name')} ({lead_record.get('email')})")
         
-        # Build CRM payload (must match format in process_lead_background)
-        address = f"{lead_record.get('city', '')}, {lead_record.get('zip_code', '')}"
-        crm_payload = {
-            'campaign': lead_record.get('campaign', ''),
-            'email': lead_record.get('email'),
-            'telephone': lead_record.get('phone'),
-            'address': address,
-            'firstname': lead_record.get('first_name'),
-            'lastname': lead_record.get('last_name'),
-            'image': lead_record.get('image_url', ''),
-            'analyticsid': '',
-            'age': str(lead_record.get('age', '')),
-            'gender': 'M' if lead_record.get('gender') == 'Male' else 'F',
-            'opt_in': 'true' if lead_record.get('wants_assessment') else 'false'
-        }
-        print(f"[RETRY_WEBHOOK] CRM payload telephone: {crm_payload['telephone']}")
-        
-        wb_resp = send_webhook(webhook_url, crm_payload)
-        
-        status = 'success' if wb_resp is not None and wb_resp.status_code < 300 else 'failed'
-        resp_text = wb_resp.text if wb_resp is not None else "Connection failed"
-        
-        print(f"[RETRY_WEBHOOK] Webhook response: status_code={wb_resp.status_code if wb_resp is not None else 'None'}, result={status}")
+        status, resp_text = deliver_crm_webhook(lead_record, webhook_url, attempt=lead_record.get('webhook_attempts', 0) + 1)
+        print(f"[RETRY_WEBHOOK] Webhook result={status}")
         print(f"[RETRY_WEBHOOK] Response body: {resp_text[:500]}")
         
-        supabase.table('leads').update({
-            'webhook_sent': True,
-            'webhook_status': status,
-            'webhook_response': resp_text
-        }).eq('id', req.lead_id).execute()
+        # The admin reloads right after a retry, so the attempt must be stored before we answer
+        await run_in_threadpool(delivery_log.flush)
         
-        print(f"[RETRY_WEBHOOK] Database updated for lead {req.lead_id}, status={status}")
+        print(f"[RETRY_WEBHOOK] Delivery logged for lead {req.lead_id}, status={status}")
         
         return {
             "status": "success", 
@@ -0,0 +1,93 @@
+import re
+
+# Admin lead search (see /api/leads/search). Both stores index one precomputed
+# `search_text` column per lead: trigram indexes match any 3+ character substring of it.
+SEARCH_MAX_LIMIT = 100
+# Deepest offset a ranked search can page to; past that, narrow the query instead
+SEARCH_MAX_OFFSET = 1000
+# Shortest term the trigram indexes can look up
+SEARCH_MIN_TERM = 3
+SEARCH_MAX_TERMS = 8
+# Near matches are only tried when nothing matches exactly; a lead qualifies when every
+# term shares at least this fraction of its trigrams with one of the lead's words
+FUZZY_MIN_SIMILARITY = 0.4
+
+_PHONE_CHARS = re.compile(r'^[\d\s()+.\-]+$')
+_NON_DIGITS = re.compile(r'\D')
+_SEPARATORS = re.compile(r'[\s,;]+')
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def phone_digits(phone):
+    return _NON_DIGITS.sub('', phone or '')
+
+
+def search_text(record):
+    """
+    The text a lead is found by, computed once at insert: lowercased names, city and zip,
+    the email whole and as local part / domain, and the phone as bare digits, so
+    "(555) 010-0100", "555.010.0100" and "5550100100" all find the same lead.
+    """
+    email = normalize_email(record.get('email'))
+    local, _, domain = email.partition('@')
+    parts = (
+        record.get('first_name'), record.get('last_name'), email, local, domain,
+        phone_digits(record.get('phone')), record.get('city'), record.get('zip_code'),
+    )
+    return ' '.join(filter(None, (str(part).strip().lower() for part in parts if part is not None)))
+
+
+def search_terms(query):
+    """
+    Splits an admin query into lookup terms, normalized like search_text. Phone-like
+    input ("(555) 010-0100") becomes one digit string; terms shorter than SEARCH_MIN_TERM
+    can't use the index and are dropped. Raises ValueError if nothing searchable is left.
+    """
+    query = (query or '').strip().lower()
+    if _PHONE_CHARS.match(query) and len(phone_digits(query)) >= SEARCH_MIN_TERM:
+        return [phone_digits(query)]
+    terms = []
+    for term in _SEPARATORS.split(query):
+        term = term.strip('"\'')
+        if _PHONE_CHARS.match(term):
+            term = phone_digits(term)
+        if len(term) >= SEARCH_MIN_TERM and term not in terms:
+            terms.append(term)
+    if not terms:
+        raise ValueError(f"Search needs at least {SEARCH_MIN_TERM} characters")
+    return terms[:SEARCH_MAX_TERMS]
+
+
+def trigrams(term):
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def word_similarity(term, text):
+    """
+    Share of the term's trigrams (padded at the word edges, like pg_trgm) found in the
+    closest word of `text`; 1.0 when the term is a whole word of it.
+    """
+    wanted = trigrams(f"  {term} ")
+    return max((len(wanted & trigrams(f"  {word} ")) / len(wanted) for word in (text or '').split()), default=0.0)
+
+
+def search_leads(query, limit=50, offset=0):
+    """
+    Leads matching every term of `query`, best match first. Returns {"leads",
+    "next_offset", "fuzzy"}; when nothing matches exactly, the first page holds near
+    matches instead (fuzzy=True, no further pages). Archived leads aren't searched.
+    """
+    from storage import get_lead_store
+
+    terms = search_terms(query)
+    limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+    offset = max(0, min(int(offset), SEARCH_MAX_OFFSET))
+    store = get_lead_store()
+    leads = store.search(terms, limit, offset)
+    if leads or offset:
+        more = len(leads) == limit and offset + limit <= SEARCH_MAX_OFFSET
+        return {"leads": leads, "next_offset": offset + limit if more else None, "fuzzy": False}
+    return {"leads": store.search(terms, limit, 0, fuzzy=True), "next_offset": None, "fuzzy": True}
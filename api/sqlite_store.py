@@ -0,0 +1,619 @@
+import sqlite3
+import json
+import os
+import queue
+import threading
+import time
+import atexit
+from concurrent.futures import Future
+
+from search_utils import FUZZY_MIN_SIMILARITY, search_text, trigrams, word_similarity
+
+DB_NAME = os.getenv("LEADS_DB_PATH", "leads_v2.db")
+
+# Group commit: the writer thread gathers up to BATCH_MAX writes, waiting at most
+# BATCH_WINDOW seconds after the first one, and commits them in a single transaction.
+BATCH_MAX = int(os.getenv("LEADS_DB_BATCH_MAX", "256"))
+BATCH_WINDOW = float(os.getenv("LEADS_DB_BATCH_WINDOW_MS", "2")) / 1000.0
+WRITE_TIMEOUT = 30
+
+# Search ranks only the newest this-many matches, so a term most leads contain ("gmail")
+# costs a bounded bm25 pass instead of one over every match
+SEARCH_RANK_WINDOW = int(os.getenv("LEADS_SEARCH_RANK_WINDOW", "5000"))
+# Near-match search scores this many trigram candidates per page it returns
+FUZZY_CANDIDATES_PER_RESULT = 5
+
+
+def _backfill_search_text(conn):
+    rows = conn.execute("SELECT id, first_name, last_name, email, phone, city, zip_code FROM leads").fetchall()
+    columns = ("id", "first_name", "last_name", "email", "phone", "city", "zip_code")
+    conn.executemany(
+        "UPDATE leads SET search_text = ? WHERE id = ?",
+        ((search_text(dict(zip(columns, row))), row[0]) for row in rows)
+    )
+
+
+def trigram_supported(conn):
+    """True if this SQLite has FTS5 with the trigram tokenizer (3.34+)."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(x, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp.trigram_probe")
+    return True
+
+
+def has_search_index(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'leads_fts'").fetchone() is not None
+
+
+def _create_search_index(conn):
+    """
+    External-content FTS5 table over leads.search_text with the trigram tokenizer, so any
+    3+ character substring is an index lookup; triggers keep it in step with the leads
+    table. Skipped (search falls back to a scan) when this SQLite lacks the tokenizer, and
+    created at the next start once it has it. Safe to run again.
+    """
+    if has_search_index(conn):
+        return
+    if not trigram_supported(conn):
+        print(f"[DB] SQLite {sqlite3.sqlite_version} has no FTS5 trigram tokenizer (needs 3.34+); "
+              "lead search will scan the leads table")
+        return
+    for statement in (
+        "CREATE VIRTUAL TABLE leads_fts USING fts5(search_text, content='leads', content_rowid='id', tokenize='trigram')",
+        '''
+        CREATE TRIGGER IF NOT EXISTS leads_fts_insert AFTER INSERT ON leads
+        BEGIN
+            INSERT INTO leads_fts (rowid, search_text) VALUES (new.id, new.search_text);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS leads_fts_delete AFTER DELETE ON leads
+        BEGIN
+            INSERT INTO leads_fts (leads_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS leads_fts_update AFTER UPDATE OF search_text ON leads
+        BEGIN
+            INSERT INTO leads_fts (leads_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+            INSERT INTO leads_fts (rowid, search_text) VALUES (new.id, new.search_text);
+        END
+        ''',
+        "INSERT INTO leads_fts (leads_fts) VALUES ('rebuild')",
+    ):
+        conn.execute(statement)
+    print("[DB] Built the lead search index")
+
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Never edit an entry once shipped; append a new one instead. An entry is SQL, or a
+# function of the connection for data migrations SQL can't express.
+MIGRATIONS = [
+    # 1: original table (IF NOT EXISTS so pre-migration databases are adopted as-is)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS leads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT,
+            last_name TEXT,
+            age INTEGER,
+            gender TEXT,
+            email TEXT,
+            phone TEXT,
+            city TEXT,
+            zip_code TEXT,
+            wants_assessment BOOLEAN,
+            score INTEGER,
+            category TEXT,
+            analysis_json TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ],
+    # 2: lookup indexes for dedup checks and time-ordered listing
+    [
+        'CREATE INDEX IF NOT EXISTS idx_leads_email ON leads (email)',
+        'CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads (phone)',
+        'CREATE INDEX IF NOT EXISTS idx_leads_timestamp ON leads (timestamp)',
+    ],
+    # 3: columns used by the shared API (campaign, stored image, CRM webhook state)
+    [
+        'ALTER TABLE leads ADD COLUMN campaign TEXT',
+        'ALTER TABLE leads ADD COLUMN image_url TEXT',
+        'ALTER TABLE leads ADD COLUMN webhook_sent BOOLEAN DEFAULT 0',
+        'ALTER TABLE leads ADD COLUMN webhook_status TEXT',
+        'ALTER TABLE leads ADD COLUMN webhook_response TEXT',
+    ],
+    # 4: content-addressed image each lead links to (see storage.put_image)
+    [
+        'ALTER TABLE leads ADD COLUMN image_digest TEXT',
+        'CREATE INDEX IF NOT EXISTS idx_leads_image_digest ON leads (image_digest)',
+    ],
+    # 5: append-only delivery log; the trigger keeps the latest status per lead and channel
+    # so the leads row is never rewritten after insert
+    [
+        '''
+        CREATE TABLE webhook_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lead_id INTEGER NOT NULL,
+            channel TEXT NOT NULL,
+            attempt INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            status_code INTEGER,
+            latency_ms INTEGER,
+            response_excerpt TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX idx_webhook_deliveries_lead ON webhook_deliveries (lead_id, id)',
+        '''
+        CREATE TABLE lead_delivery_status (
+            lead_id INTEGER NOT NULL,
+            channel TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            status_code INTEGER,
+            response_excerpt TEXT,
+            updated_at DATETIME,
+            PRIMARY KEY (lead_id, channel)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX idx_lead_delivery_status_status ON lead_delivery_status (channel, status)',
+        '''
+        CREATE TRIGGER materialize_delivery_status AFTER INSERT ON webhook_deliveries
+        BEGIN
+            INSERT INTO lead_delivery_status (lead_id, channel, status, attempts, status_code, response_excerpt, updated_at)
+            VALUES (new.lead_id, new.channel, new.status, new.attempt, new.status_code, new.response_excerpt, new.created_at)
+            ON CONFLICT (lead_id, channel) DO UPDATE SET
+                status = excluded.status,
+                attempts = MAX(lead_delivery_status.attempts, excluded.attempts),
+                status_code = excluded.status_code,
+                response_excerpt = excluded.response_excerpt,
+                updated_at = excluded.updated_at;
+        END
+        ''',
+        # Carry over the status written to the old lead columns
+        '''
+        INSERT INTO lead_delivery_status (lead_id, channel, status, attempts, response_excerpt, updated_at)
+        SELECT id, 'crm', webhook_status, 1, substr(webhook_response, 1, 500), timestamp
+        FROM leads WHERE webhook_sent AND webhook_status IS NOT NULL
+        ''',
+    ],
+    # 6: lookup index for leads moved to cold storage (see archive_utils); keeps dedup and
+    # image reference counts working after the rows leave the hot table
+    [
+        '''
+        CREATE TABLE lead_archive_index (
+            lead_id INTEGER PRIMARY KEY,
+            email TEXT,
+            phone TEXT,
+            image_digest TEXT,
+            created_at DATETIME,
+            segment TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX idx_lead_archive_email ON lead_archive_index (email)',
+        'CREATE INDEX idx_lead_archive_phone ON lead_archive_index (phone)',
+        'CREATE INDEX idx_lead_archive_image_digest ON lead_archive_index (image_digest)',
+    ],
+    # 7: admin search. search_text is computed at insert (see search_utils.search_text)
+    # and indexed by _create_search_index where this SQLite supports it
+    [
+        'ALTER TABLE leads ADD COLUMN search_text TEXT',
+        _backfill_search_text,
+        _create_search_index,
+    ],
+]
+
+# Fixed column list so every insert reuses the same cached prepared statement
+INSERT_COLUMNS = (
+    "first_name", "last_name", "age", "gender", "email", "phone", "city", "zip_code",
+    "campaign", "wants_assessment", "score", "category", "analysis_json", "image_url",
+    "image_digest", "webhook_sent", "webhook_status", "webhook_response", "search_text",
+)
+INSERT_LEAD_SQL = f"INSERT INTO leads ({', '.join(INSERT_COLUMNS)}) VALUES ({', '.join('?' for _ in INSERT_COLUMNS)})"
+
+LEAD_COLUMNS = "id, " + ", ".join(INSERT_COLUMNS) + ", timestamp"
+
+DELIVERY_COLUMNS = ("lead_id", "channel", "attempt", "status", "status_code", "latency_ms", "response_excerpt")
+INSERT_DELIVERY_SQL = f"INSERT INTO webhook_deliveries ({', '.join(DELIVERY_COLUMNS)}) VALUES ({', '.join('?' for _ in DELIVERY_COLUMNS)})"
+
+# Leads with their CRM delivery state: the materialized status wins over the columns
+# written before the delivery log existed
+_DELIVERY_OVERRIDES = {
+    "webhook_sent": "(s.status IS NOT NULL OR leads.webhook_sent) AS webhook_sent",
+    "webhook_status": "COALESCE(s.status, leads.webhook_status) AS webhook_status",
+    "webhook_response": "COALESCE(s.response_excerpt, leads.webhook_response) AS webhook_response",
+}
+LEAD_WITH_STATUS_SELECT = (
+    "SELECT leads.id, "
+    + ", ".join(_DELIVERY_OVERRIDES.get(column, f"leads.{column}") for column in INSERT_COLUMNS)
+    + ", leads.timestamp, COALESCE(s.attempts, 0) AS webhook_attempts"
+    + " FROM leads LEFT JOIN lead_delivery_status s ON s.lead_id = leads.id AND s.channel = 'crm'"
+)
+
+
+def _connect():
+    # isolation_level=None: no implicit transactions. Writes and migrations open their own
+    # with BEGIN, which (unlike the legacy mode) also covers DDL
+    conn = sqlite3.connect(DB_NAME, timeout=WRITE_TIMEOUT, check_same_thread=False, cached_statements=256,
+                           isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL is durable across application crashes; only an OS crash can lose the last commits
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={WRITE_TIMEOUT * 1000}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def migrate(conn):
+    """
+    Applies any migrations newer than the database's user_version. Each one runs in a
+    single transaction with its user_version bump, so a failing migration leaves no
+    partial schema behind and is simply retried on the next start.
+    """
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, statements in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version={version}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"[DB] Applied migration {version}")
+
+
+class LeadWriter:
+    """
+    Single writer thread fed by a queue of (sql, params) statements. SQLite allows one
+    writer at a time anyway, so funnelling writes through one connection removes lock
+    contention, and batching them into one transaction amortizes the commit (fsync) cost.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._conn = _connect()
+        self._thread = threading.Thread(target=self._run, name="lead-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params):
+        """Queues a statement; the future resolves to its lastrowid once committed."""
+        future = Future()
+        self._queue.put(((sql, params), future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=WRITE_TIMEOUT)
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + BATCH_WINDOW
+        while len(batch) < BATCH_MAX:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            try:
+                outcomes = self._write(batch)
+                for (_, future), (ok, value) in zip(batch, outcomes):
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        print(f"[DB] Write failed: {value}")
+                        future.set_exception(value)
+            except Exception as e:
+                print(f"[DB] Batch write of {len(batch)} statements failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+        self._conn.close()
+
+    def _write(self, batch):
+        """
+        Runs the batch in one transaction (one commit, one fsync). Each statement gets a
+        nested savepoint, so a bad write is undone and fails alone while the rest commit.
+        Returns (ok, lastrowid or exception) per statement.
+        """
+        outcomes = []
+        cursor = self._conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for (sql, params), _ in batch:
+                cursor.execute("SAVEPOINT write")
+                try:
+                    cursor.execute(sql, params)
+                    outcomes.append((True, cursor.lastrowid))
+                except sqlite3.Error as e:
+                    cursor.execute("ROLLBACK TO write")
+                    outcomes.append((False, e))
+                cursor.execute("RELEASE write")
+            cursor.execute("COMMIT")
+        except BaseException:
+            if self._conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+        return outcomes
+
+
+_writer = None
+_search_indexed = False
+_readers = threading.local()
+_init_lock = threading.Lock()
+
+
+def init_db():
+    global _writer, _search_indexed
+    with _init_lock:
+        conn = _connect()
+        migrate(conn)
+        if not has_search_index(conn):
+            # Built late when the SQLite that ran migration 7 lacked the trigram tokenizer
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _create_search_index(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        _search_indexed = has_search_index(conn)
+        conn.close()
+        if _writer is None:
+            _writer = LeadWriter()
+            atexit.register(close_db)
+
+
+def close_db():
+    """Flushes pending inserts and stops the writer thread."""
+    global _writer
+    with _init_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+def _reader():
+    # One read connection per thread; WAL lets readers run alongside the writer
+    conn = getattr(_readers, "conn", None)
+    if conn is None:
+        conn = _connect()
+        conn.row_factory = sqlite3.Row
+        _readers.conn = conn
+    return conn
+
+
+def _writer_or_init():
+    if _writer is None:
+        init_db()
+    return _writer
+
+
+def insert_lead(record):
+    """Inserts a lead dict and returns its new id once the batch holding it is committed."""
+    record = dict(record)
+    if isinstance(record.get('analysis_json'), (dict, list)):
+        record['analysis_json'] = json.dumps(record['analysis_json'])
+    if not record.get('search_text'):
+        record['search_text'] = search_text(record)
+    params = tuple(record.get(column) for column in INSERT_COLUMNS)
+    return _writer_or_init().submit(INSERT_LEAD_SQL, params).result(timeout=WRITE_TIMEOUT)
+
+
+def update_lead(lead_id, fields):
+    fields = dict(fields)
+    if isinstance(fields.get('analysis_json'), (dict, list)):
+        fields['analysis_json'] = json.dumps(fields['analysis_json'])
+    columns = sorted(column for column in fields if column in INSERT_COLUMNS)
+    if not columns:
+        return
+    sql = f"UPDATE leads SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?"
+    params = tuple(fields[column] for column in columns) + (lead_id,)
+    _writer_or_init().submit(sql, params).result(timeout=WRITE_TIMEOUT)
+
+
+def _row_to_dict(row):
+    record = dict(row)
+    # Same name as the Supabase column, so callers don't care which store they read from
+    record['created_at'] = record.get('timestamp')
+    if record.get('analysis_json'):
+        try:
+            record['analysis_json'] = json.loads(record['analysis_json'])
+        except ValueError:
+            pass
+    return record
+
+
+def get_lead(lead_id):
+    row = _reader().execute(f"{LEAD_WITH_STATUS_SELECT} WHERE leads.id = ?", (lead_id,)).fetchone()
+    return _row_to_dict(row) if row else None
+
+
+def find_lead_by_contact(email, phone):
+    """
+    Returns the first lead with this email or phone, or None. Both columns are indexed.
+    Archived leads are matched through the archive index and come back as
+    {'id', 'email', 'phone', 'created_at', 'archived': True}.
+    """
+    row = _reader().execute(
+        f"SELECT {LEAD_COLUMNS} FROM leads WHERE email = ? UNION SELECT {LEAD_COLUMNS} FROM leads WHERE phone = ? LIMIT 1",
+        (email, phone)
+    ).fetchone()
+    if row:
+        return _row_to_dict(row)
+    row = _reader().execute(
+        "SELECT lead_id AS id, email, phone, created_at FROM lead_archive_index WHERE email = ? "
+        "UNION SELECT lead_id AS id, email, phone, created_at FROM lead_archive_index WHERE phone = ? LIMIT 1",
+        (email, phone)
+    ).fetchone()
+    return {**dict(row), 'archived': True} if row else None
+
+
+def list_leads(limit=50, before_id=None):
+    """
+    Newest-first page of leads. Pass the last id of the previous page as `before_id`
+    (keyset pagination, so deep pages cost the same as the first one).
+    Returns (leads, next_before_id); next_before_id is None on the last page.
+    """
+    limit = max(1, min(int(limit), 500))
+    if before_id is None:
+        rows = _reader().execute(
+            f"{LEAD_WITH_STATUS_SELECT} ORDER BY leads.id DESC LIMIT ?", (limit,)
+        ).fetchall()
+    else:
+        rows = _reader().execute(
+            f"{LEAD_WITH_STATUS_SELECT} WHERE leads.id < ? ORDER BY leads.id DESC LIMIT ?", (before_id, limit)
+        ).fetchall()
+    leads = [_row_to_dict(row) for row in rows]
+    next_before_id = leads[-1]['id'] if len(leads) == limit else None
+    return leads, next_before_id
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search_leads(terms, limit=50, offset=0, fuzzy=False):
+    """
+    Leads whose search_text contains every term, best bm25 rank first (newest on ties),
+    among the newest SEARCH_RANK_WINDOW matches. With fuzzy=True: leads sharing trigrams
+    with the terms, kept when every term is close to one of their words (see
+    search_utils.word_similarity), closest first. Without the FTS index (SQLite < 3.34)
+    the same matches come from a scan, newest first.
+    """
+    page_size = limit * FUZZY_CANDIDATES_PER_RESULT if fuzzy else limit
+    if _search_indexed:
+        if fuzzy:
+            match = ' OR '.join(_fts_phrase(gram) for term in terms for gram in sorted(trigrams(term)))
+        else:
+            match = ' '.join(_fts_phrase(term) for term in terms)
+        rows = _reader().execute(
+            f"{LEAD_WITH_STATUS_SELECT} JOIN ("
+            "SELECT rowid AS match_id, rank AS match_rank FROM leads_fts WHERE leads_fts MATCH ? ORDER BY rowid DESC LIMIT ?"
+            ") matches ON matches.match_id = leads.id ORDER BY matches.match_rank, leads.id DESC LIMIT ? OFFSET ?",
+            (match, SEARCH_RANK_WINDOW, page_size, offset)
+        ).fetchall()
+    else:
+        needles = sorted({gram for term in terms for gram in trigrams(term)}) if fuzzy else terms
+        condition = (' OR ' if fuzzy else ' AND ').join('instr(leads.search_text, ?) > 0' for _ in needles)
+        rows = _reader().execute(
+            f"{LEAD_WITH_STATUS_SELECT} WHERE {condition} ORDER BY leads.id DESC LIMIT ? OFFSET ?",
+            (*needles, page_size, offset)
+        ).fetchall()
+    leads = [_row_to_dict(row) for row in rows]
+    if not fuzzy:
+        return leads
+    scored = [(min(word_similarity(term, lead.get('search_text')) for term in terms), lead) for lead in leads]
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return [lead for score, lead in scored if score >= FUZZY_MIN_SIMILARITY][:limit]
+
+
+def insert_deliveries(attempts):
+    """Appends delivery attempts; they share the writer's group commit. Waits until all are committed."""
+    writer = _writer_or_init()
+    futures = [writer.submit(INSERT_DELIVERY_SQL, tuple(attempt.get(column) for column in DELIVERY_COLUMNS)) for attempt in attempts]
+    for future in futures:
+        future.result(timeout=WRITE_TIMEOUT)
+
+
+def list_deliveries(lead_id):
+    rows = _reader().execute(
+        "SELECT * FROM webhook_deliveries WHERE lead_id = ? ORDER BY id", (lead_id,)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def count_leads():
+    return _reader().execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+
+def count_image_refs(digest):
+    """Number of leads (hot or archived) linking to the image with this digest."""
+    return _reader().execute(
+        "SELECT (SELECT COUNT(*) FROM leads WHERE image_digest = ?) + (SELECT COUNT(*) FROM lead_archive_index WHERE image_digest = ?)",
+        (digest, digest)
+    ).fetchone()[0]
+
+
+def count_image_url_refs(url):
+    return _reader().execute("SELECT COUNT(*) FROM leads WHERE image_url = ?", (url,)).fetchone()[0]
+
+
+def referenced_digests():
+    return {row[0] for row in _reader().execute(
+        "SELECT image_digest FROM leads WHERE image_digest IS NOT NULL "
+        "UNION SELECT image_digest FROM lead_archive_index WHERE image_digest IS NOT NULL"
+    )}
+
+
+def leads_before(cutoff, limit):
+    """Oldest-first leads created before `cutoff` ('YYYY-MM-DD HH:MM:SS' UTC), for archival."""
+    rows = _reader().execute(
+        f"{LEAD_WITH_STATUS_SELECT} WHERE leads.timestamp < ? ORDER BY leads.id LIMIT ?", (cutoff, limit)
+    ).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
+
+ARCHIVE_INDEX_COLUMNS = ("lead_id", "email", "phone", "image_digest", "created_at", "segment")
+INSERT_ARCHIVE_INDEX_SQL = (
+    f"INSERT OR REPLACE INTO lead_archive_index ({', '.join(ARCHIVE_INDEX_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in ARCHIVE_INDEX_COLUMNS)})"
+)
+
+
+def index_archived(entries):
+    writer = _writer_or_init()
+    futures = [writer.submit(INSERT_ARCHIVE_INDEX_SQL, tuple(entry.get(column) for column in ARCHIVE_INDEX_COLUMNS)) for entry in entries]
+    for future in futures:
+        future.result(timeout=WRITE_TIMEOUT)
+
+
+def archived_segments(lead_ids):
+    """{lead_id: segment} for the given archived lead ids."""
+    segments = {}
+    ids = list(lead_ids)
+    # Chunked to stay under SQLite's bound-parameter limit
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        rows = _reader().execute(
+            f"SELECT lead_id, segment FROM lead_archive_index WHERE lead_id IN ({', '.join('?' for _ in chunk)})", chunk
+        ).fetchall()
+        segments.update((row[0], row[1]) for row in rows)
+    return segments
+
+
+def delete_leads(lead_ids):
+    """Removes leads and their delivery rows from the hot tables in one group commit."""
+    writer = _writer_or_init()
+    futures = []
+    ids = list(lead_ids)
+    for start in range(0, len(ids), 500):
+        chunk = tuple(ids[start:start + 500])
+        placeholders = ', '.join('?' for _ in chunk)
+        for table, column in (("webhook_deliveries", "lead_id"), ("lead_delivery_status", "lead_id"), ("leads", "id")):
+            futures.append(writer.submit(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", chunk))
+    for future in futures:
+        future.result(timeout=WRITE_TIMEOUT)
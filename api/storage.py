@@ -0,0 +1,580 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException
+
+from capture_utils import TRAFFIC_CAPTURE, instrument
+from search_utils import FUZZY_MIN_SIMILARITY, search_text
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def supabase_url():
+    return os.getenv('SUPABASE_URL') or os.getenv('VITE_SUPABASE_URL')
+
+
+# Helper to get Supabase client
+def get_supabase():
+    """Shared Supabase client; created once per process instead of once per request."""
+    client = _clients.get('supabase')
+    if client is not None:
+        return client
+
+    url = supabase_url()
+    key = (
+        os.getenv('BACKEND_SERVICE_KEY') or
+        os.getenv('SUPABASE_SERVICE_ROLE_KEY') or
+        os.getenv('VITE_SUPABASE_ANON_KEY') or
+        os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY') or
+        os.getenv('SUPABASE_ANON_KEY') or
+        os.getenv('SUPABASE_PUBLISHABLE_KEY')
+    )
+    if not url or not key:
+        raise HTTPException(status_code=500, detail="Supabase credentials missing")
+
+    from supabase import create_client
+    with _clients_lock:
+        if 'supabase' not in _clients:
+            _clients['supabase'] = create_client(url, key)
+    return _clients['supabase']
+
+
+# Latest CRM delivery state is embedded from lead_delivery_status (see
+# supabase/migrations/0002_webhook_deliveries.sql) instead of living on the lead row
+LEAD_WITH_STATUS = '*, lead_delivery_status(channel, status, attempts, response_excerpt)'
+
+
+def _merge_delivery_status(row, channel='crm'):
+    statuses = row.pop('lead_delivery_status', None) or []
+    latest = next((status for status in statuses if status.get('channel') == channel), None)
+    if latest:
+        row['webhook_sent'] = True
+        row['webhook_status'] = latest['status']
+        row['webhook_response'] = latest['response_excerpt']
+    row['webhook_attempts'] = latest['attempts'] if latest else 0
+    return row
+
+
+class SupabaseLeadStore:
+    """Leads in the Supabase `leads` table."""
+    name = "supabase"
+
+    def find_by_contact(self, email, phone):
+        existing = get_supabase().table('leads').select('id').or_(f"email.eq.{email},phone.eq.{phone}").execute()
+        if existing.data:
+            return existing.data
+        # Archived leads still count as submitted
+        archived = (get_supabase().table('lead_archive_index').select('lead_id')
+                    .or_(f"email.eq.{email},phone.eq.{phone}").limit(1).execute())
+        return [{'id': row['lead_id'], 'archived': True} for row in archived.data or []]
+
+    def insert(self, record):
+        record = {**record, 'search_text': record.get('search_text') or search_text(record)}
+        result = get_supabase().table('leads').insert(record).execute()
+        if not result.data:
+            raise Exception("Insert failed")
+        return result.data[0]
+
+    def get(self, lead_id):
+        resp = get_supabase().table('leads').select(LEAD_WITH_STATUS).eq('id', lead_id).execute()
+        return _merge_delivery_status(resp.data[0]) if resp.data else None
+
+    def update(self, lead_id, fields):
+        get_supabase().table('leads').update(fields).eq('id', lead_id).execute()
+
+    def list(self, limit=50, before=None):
+        """Newest first. `before` is the created_at of the last lead on the previous page."""
+        query = get_supabase().table('leads').select(LEAD_WITH_STATUS).order('created_at', desc=True).limit(limit)
+        if before:
+            query = query.lt('created_at', before)
+        rows = [_merge_delivery_status(row) for row in query.execute().data or []]
+        return rows, (rows[-1]['created_at'] if len(rows) == limit else None)
+
+    def search(self, terms, limit, offset=0, fuzzy=False):
+        """Ranked by the search_leads function (supabase/migrations/0004_lead_search.sql)."""
+        ranked = get_supabase().rpc('search_leads', {
+            'terms': terms, 'page_limit': limit, 'page_offset': offset,
+            'fuzzy': fuzzy, 'min_similarity': FUZZY_MIN_SIMILARITY,
+        }).execute().data or []
+        if not ranked:
+            return []
+        rows = get_supabase().table('leads').select(LEAD_WITH_STATUS).in_('id', [row['id'] for row in ranked]).execute().data or []
+        by_id = {row['id']: _merge_delivery_status(row) for row in rows}
+        return [by_id[row['id']] for row in ranked if row['id'] in by_id]
+
+    def record_deliveries(self, attempts):
+        # One bulk insert; the table trigger updates lead_delivery_status
+        get_supabase().table('webhook_deliveries').insert(attempts).execute()
+
+    def deliveries(self, lead_id):
+        return get_supabase().table('webhook_deliveries').select('*').eq('lead_id', lead_id).order('id').execute().data or []
+
+    def image_refs(self, digest):
+        total = 0
+        for table in ('leads', 'lead_archive_index'):
+            resp = get_supabase().table(table).select('image_digest', count='exact').eq('image_digest', digest).limit(1).execute()
+            total += resp.count or 0
+        return total
+
+    def referenced_digests(self, page_size=1000):
+        digests = set()
+        for table, key in (('leads', 'id'), ('lead_archive_index', 'lead_id')):
+            offset = 0
+            while True:
+                rows = (get_supabase().table(table).select('image_digest')
+                        .not_.is_('image_digest', 'null').order(key)
+                        .range(offset, offset + page_size - 1).execute().data or [])
+                digests.update(row['image_digest'] for row in rows)
+                if len(rows) < page_size:
+                    break
+                offset += page_size
+        return digests
+
+    def image_url_refs(self, url):
+        resp = get_supabase().table('leads').select('id', count='exact').eq('image_url', url).limit(1).execute()
+        return resp.count or 0
+
+    def leads_before(self, cutoff, limit):
+        """Oldest-first leads created before `cutoff` (ISO timestamp), for archival."""
+        rows = (get_supabase().table('leads').select(LEAD_WITH_STATUS)
+                .lt('created_at', cutoff).order('created_at').limit(limit).execute().data or [])
+        return [_merge_delivery_status(row) for row in rows]
+
+    def index_archived(self, entries):
+        get_supabase().table('lead_archive_index').upsert(entries).execute()
+
+    def archived_segments(self, lead_ids):
+        segments = {}
+        ids = list(lead_ids)
+        for start in range(0, len(ids), 200):
+            rows = (get_supabase().table('lead_archive_index').select('lead_id, segment')
+                    .in_('lead_id', ids[start:start + 200]).execute().data or [])
+            segments.update((row['lead_id'], row['segment']) for row in rows)
+        return segments
+
+    def delete(self, lead_ids):
+        # Delivery rows go with them (on delete cascade)
+        ids = list(lead_ids)
+        for start in range(0, len(ids), 200):
+            get_supabase().table('leads').delete().in_('id', ids[start:start + 200]).execute()
+
+
+class SQLiteLeadStore:
+    """Leads in a local SQLite database (see sqlite_store)."""
+    name = "sqlite"
+
+    def __init__(self):
+        import sqlite_store
+        self.db = sqlite_store
+        self.db.init_db()
+
+    def find_by_contact(self, email, phone):
+        lead = self.db.find_lead_by_contact(email, phone)
+        return [lead] if lead else []
+
+    def insert(self, record):
+        lead_id = self.db.insert_lead(record)
+        return self.db.get_lead(lead_id)
+
+    def get(self, lead_id):
+        try:
+            return self.db.get_lead(int(lead_id))
+        except ValueError:
+            return None
+
+    def update(self, lead_id, fields):
+        self.db.update_lead(int(lead_id), fields)
+
+    def list(self, limit=50, before=None):
+        return self.db.list_leads(limit=limit, before_id=int(before) if before else None)
+
+    def search(self, terms, limit, offset=0, fuzzy=False):
+        return self.db.search_leads(terms, limit, offset, fuzzy)
+
+    def record_deliveries(self, attempts):
+        self.db.insert_deliveries(attempts)
+
+    def deliveries(self, lead_id):
+        return self.db.list_deliveries(int(lead_id))
+
+    def image_refs(self, digest):
+        return self.db.count_image_refs(digest)
+
+    def referenced_digests(self):
+        return self.db.referenced_digests()
+
+    def image_url_refs(self, url):
+        return self.db.count_image_url_refs(url)
+
+    def leads_before(self, cutoff, limit):
+        # SQLite CURRENT_TIMESTAMP format, UTC
+        return self.db.leads_before(cutoff.replace('T', ' ')[:19], limit)
+
+    def index_archived(self, entries):
+        self.db.index_archived(entries)
+
+    def archived_segments(self, lead_ids):
+        return self.db.archived_segments(lead_ids)
+
+    def delete(self, lead_ids):
+        self.db.delete_leads(lead_ids)
+
+
+class SupabaseBlobStore:
+    """Objects in a Supabase storage bucket, served from its public URL."""
+    name = "supabase"
+
+    def __init__(self, bucket="lead-images"):
+        self.bucket = bucket
+
+    def put(self, key, data, content_type):
+        get_supabase().storage.from_(self.bucket).upload(
+            path=key,
+            file=data,
+            file_options={"content-type": "application/octet-stream"}
+        )
+        return self.public_url(key)
+
+    def public_url(self, key):
+        return f"{supabase_url()}/storage/v1/object/public/{self.bucket}/{key}"
+
+    def get(self, key):
+        return get_supabase().storage.from_(self.bucket).download(key)
+
+    def read_head(self, key, length):
+        """(first `length` bytes, total size) with one ranged GET, or None if missing."""
+        import httpx
+        resp = httpx.get(self.public_url(key), headers={"Range": f"bytes=0-{length - 1}"}, timeout=10)
+        if resp.status_code in (400, 404):
+            return None
+        resp.raise_for_status()
+        total = resp.headers.get('content-range', '').rpartition('/')[2]
+        return resp.content[:length], int(total) if total.isdigit() else len(resp.content)
+
+    def signed_upload_url(self, key, content_type, ttl):
+        # Supabase fixes signed upload URLs at two hours; `ttl` is enforced when the key is used
+        signed = get_supabase().storage.from_(self.bucket).create_signed_upload_url(key)
+        return {"url": signed["signed_url"], "method": "PUT", "headers": {"Content-Type": content_type}}
+
+    def exists(self, key):
+        # HEAD on the object, no download
+        return get_supabase().storage.from_(self.bucket).exists(key)
+
+    def list_objects(self, prefix):
+        """Yields (key, last_modified_epoch) for objects directly under `prefix`."""
+        bucket = get_supabase().storage.from_(self.bucket)
+        folder = prefix.rstrip('/')
+        offset = 0
+        while True:
+            entries = bucket.list(folder, {"limit": 1000, "offset": offset, "sortBy": {"column": "name", "order": "asc"}})
+            for entry in entries:
+                if entry.get('id') is None:
+                    continue  # sub-folder placeholder
+                modified = entry.get('updated_at') or entry.get('created_at')
+                yield f"{folder}/{entry['name']}", _parse_timestamp(modified)
+            if len(entries) < 1000:
+                return
+            offset += 1000
+
+    def delete(self, keys):
+        if keys:
+            get_supabase().storage.from_(self.bucket).remove(list(keys))
+
+
+class LocalBlobStore:
+    """Objects on the local filesystem under `root`, served by the standalone server at `base_url`."""
+    name = "local"
+
+    def __init__(self, root, base_url):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+        # Where the standalone server mounts `root`: the path part of an absolute base URL
+        self.mount_path = urlsplit(self.base_url).path
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def put(self, key, data, content_type):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers never see a half-written file
+        tmp_path = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self.public_url(key)
+
+    def public_url(self, key):
+        return f"{self.base_url}/{key}"
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def read_head(self, key, length):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read(length), os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return None
+
+    def signed_upload_url(self, key, content_type, ttl):
+        # Served by PUT /api/uploads/{key} (see index.py), which checks the signature
+        expires = int(time.time()) + ttl
+        return {
+            "url": f"/api/uploads/{key}?expires={expires}&signature={upload_signature(key, expires)}",
+            "method": "PUT",
+            "headers": {"Content-Type": content_type},
+        }
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def list_objects(self, prefix):
+        """Yields (key, last_modified_epoch) for objects directly under `prefix`."""
+        folder = prefix.rstrip('/')
+        try:
+            entries = list(os.scandir(self._path(folder)))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_file() and '.tmp' not in entry.name:
+                yield f"{folder}/{entry.name}", entry.stat().st_mtime
+
+    def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+_upload_secret = (os.getenv('UPLOAD_SIGNING_SECRET') or os.getenv('ADMIN_API_TOKEN') or '').encode()
+if not _upload_secret:
+    # Fine for a single process; set UPLOAD_SIGNING_SECRET when running several workers
+    _upload_secret = secrets.token_bytes(32)
+
+
+def upload_signature(key, expires):
+    return hmac.new(_upload_secret, f"{key}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def verify_upload_signature(key, expires, signature):
+    return expires >= time.time() and hmac.compare_digest(upload_signature(key, expires), signature or '')
+
+
+def _parse_timestamp(value):
+    from datetime import datetime
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        # Unknown age: treat as brand new so GC leaves it alone
+        return time.time()
+
+
+# Store calls made while serving requests; timed per request when TRAFFIC_CAPTURE is on
+LEAD_STORE_TIMED_METHODS = ("find_by_contact", "insert", "get", "update", "list", "search", "deliveries")
+BLOB_STORE_TIMED_METHODS = ("put", "get", "read_head", "exists", "delete", "signed_upload_url")
+
+
+def _default_backend():
+    return 'supabase' if supabase_url() else None
+
+
+def get_lead_store():
+    """LEAD_STORE=supabase|sqlite; defaults to Supabase when it is configured, else SQLite."""
+    store = _clients.get('lead_store')
+    if store is None:
+        kind = os.getenv('LEAD_STORE') or _default_backend() or 'sqlite'
+        with _clients_lock:
+            if 'lead_store' not in _clients:
+                _clients['lead_store'] = SQLiteLeadStore() if kind == 'sqlite' else SupabaseLeadStore()
+                if TRAFFIC_CAPTURE:
+                    instrument(_clients['lead_store'], "lead_store", LEAD_STORE_TIMED_METHODS)
+                print(f"[STORAGE] Lead store: {kind}")
+        store = _clients['lead_store']
+    return store
+
+
+def local_blob_base_url():
+    """
+    Base URL of local blob objects. Image URLs go out in the CRM webhook and emails, so a
+    relative LOCAL_BLOB_BASE_URL is prefixed with PUBLIC_BASE_URL (the address the
+    standalone server is reached at). With CRM_WEBHOOK_URL set and no absolute URL to
+    build from, raises RuntimeError rather than sending links nobody can open.
+    """
+    base_url = os.getenv('LOCAL_BLOB_BASE_URL', '/uploads/lead-images')
+    public_base_url = os.getenv('PUBLIC_BASE_URL', '').rstrip('/')
+    if base_url.startswith('/') and public_base_url:
+        base_url = public_base_url + base_url
+    if not urlsplit(base_url).netloc and os.getenv('CRM_WEBHOOK_URL'):
+        raise RuntimeError(
+            "The local blob store needs an absolute image URL for CRM_WEBHOOK_URL: "
+            "set PUBLIC_BASE_URL or an absolute LOCAL_BLOB_BASE_URL"
+        )
+    return base_url
+
+
+def get_blob_store():
+    """BLOB_STORE=supabase|local; defaults to Supabase when it is configured, else the local filesystem."""
+    store = _clients.get('blob_store')
+    if store is None:
+        kind = os.getenv('BLOB_STORE') or _default_backend() or 'local'
+        with _clients_lock:
+            if 'blob_store' not in _clients:
+                if kind == 'local':
+                    _clients['blob_store'] = LocalBlobStore(os.getenv('LOCAL_BLOB_DIR', 'uploads'), local_blob_base_url())
+                else:
+                    _clients['blob_store'] = SupabaseBlobStore()
+                if TRAFFIC_CAPTURE:
+                    instrument(_clients['blob_store'], "blob_store", BLOB_STORE_TIMED_METHODS)
+                print(f"[STORAGE] Blob store: {kind}")
+        store = _clients['blob_store']
+    return store
+
+
+def get_archive_store():
+    """
+    Private store for archived lead segments (see archive_utils). Never the public image
+    bucket: segments hold contact details. LEAD_ARCHIVE_BUCKET / LOCAL_ARCHIVE_DIR.
+    """
+    store = _clients.get('archive_store')
+    if store is None:
+        kind = os.getenv('BLOB_STORE') or _default_backend() or 'local'
+        with _clients_lock:
+            if 'archive_store' not in _clients:
+                if kind == 'local':
+                    # Not under LOCAL_BLOB_DIR, which the standalone server serves publicly
+                    _clients['archive_store'] = LocalBlobStore(os.getenv('LOCAL_ARCHIVE_DIR', 'archive'), '')
+                else:
+                    _clients['archive_store'] = SupabaseBlobStore(os.getenv('LEAD_ARCHIVE_BUCKET', 'lead-archive'))
+        store = _clients['archive_store']
+    return store
+
+
+# --- Content-addressed images ---
+# Lead photos are stored once per distinct content under sha256/<digest>.<ext> and every
+# lead that submitted those bytes links to the same object (leads.image_digest).
+IMAGE_PREFIX = "sha256/"
+IMAGE_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpeg'}
+# Objects younger than this are never collected, so an upload whose lead insert is still
+# in flight is not mistaken for an orphan
+IMAGE_GC_GRACE = float(os.getenv('IMAGE_GC_GRACE_HOURS', '24')) * 3600
+
+
+def image_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(f, chunk_size=64 * 1024):
+    """image_digest of a file object's whole content, read in chunks; rewinds it afterwards."""
+    digest = hashlib.sha256()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+def stored_image_digest(key):
+    """image_digest of an object already in the blob store."""
+    return image_digest(get_blob_store().get(key))
+
+
+def image_key(digest, content_type):
+    return f"{IMAGE_PREFIX}{digest}{IMAGE_EXTENSIONS.get(content_type, '.jpeg')}"
+
+
+def put_image(data, content_type):
+    """
+    Stores image bytes under their content digest and returns (digest, public_url).
+    Bytes that are already stored are not uploaded again. Always asks the blob store
+    (one HEAD) rather than remembering keys in process: image GC runs in another process
+    and may have deleted an object this one saw earlier.
+    """
+    blobs = get_blob_store()
+    digest = image_digest(data)
+    key = image_key(digest, content_type)
+
+    if blobs.exists(key):
+        print(f"[STORAGE] Image {digest[:12]} already stored, skipping upload")
+    else:
+        try:
+            blobs.put(key, data, content_type)
+        except Exception as e:
+            # Another request uploaded the same bytes between the check and the put
+            if not blobs.exists(key):
+                raise
+            print(f"[STORAGE] Image {digest[:12]} uploaded concurrently: {e}")
+    return digest, blobs.public_url(key)
+
+
+def promote_upload(key):
+    """
+    Copies a direct upload to its content-addressed key (deduplicated like put_image).
+    The incoming object is left for image GC rather than deleted, so an idempotent retry
+    naming the same key can still be fingerprinted on its content.
+    Returns (digest, public_url, image_bytes).
+    """
+    blobs = get_blob_store()
+    data = blobs.get(key)
+    content_type = 'image/png' if key.endswith('.png') else 'image/jpeg'
+    digest, url = put_image(data, content_type)
+    return digest, url, data
+
+
+def collect_orphan_images(grace=IMAGE_GC_GRACE, dry_run=False):
+    """
+    Deletes content-addressed images that no lead references and direct uploads (already
+    promoted or never used), once they are older than `grace` seconds. Legacy per-lead objects
+    outside IMAGE_PREFIX and UPLOAD_PREFIX are left alone.
+    Returns {"scanned", "referenced", "orphaned", "deleted"}.
+    """
+    blobs = get_blob_store()
+    leads = get_lead_store()
+    referenced = leads.referenced_digests()
+    cutoff = time.time() - grace
+
+    scanned = 0
+    orphans = []
+    for key, modified in blobs.list_objects(IMAGE_PREFIX):
+        scanned += 1
+        digest = os.path.splitext(key[len(IMAGE_PREFIX):])[0]
+        if digest not in referenced and modified < cutoff:
+            orphans.append((key, digest))
+
+    deleted = []
+    for key, digest in orphans:
+        # Re-check just before deleting: a lead may have linked to it since the scan
+        if leads.image_refs(digest):
+            continue
+        deleted.append(key)
+
+    # Direct uploads, promoted or never used. One a lead still points at (its promotion
+    # failed) is kept.
+    from upload_utils import UPLOAD_PREFIX
+    for key, modified in blobs.list_objects(UPLOAD_PREFIX):
+        scanned += 1
+        if modified >= cutoff:
+            continue
+        if leads.image_url_refs(blobs.public_url(key)):
+            print(f"[STORAGE] Image GC: {key} is still linked from a lead, keeping it")
+            continue
+        orphans.append((key, None))
+        deleted.append(key)
+    if not dry_run:
+        blobs.delete(deleted)
+
+    print(f"[STORAGE] Image GC: scanned {scanned}, orphaned {len(orphans)}, "
+          f"{'would delete' if dry_run else 'deleted'} {len(deleted)}")
+    return {"scanned": scanned, "referenced": len(referenced), "orphaned": len(orphans), "deleted": deleted}
@@ -0,0 +1,65 @@
+import json
+
+from pydantic_core import to_json
+
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON object that arrives in text chunks and reports each top-level
+    field as soon as its value is complete, so nested objects are emitted whole.
+
+        parser = IncrementalJSONParser()
+        for chunk in chunks:
+            for key, value in parser.feed(chunk):
+                ...
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.field_start = None
+
+    def feed(self, text):
+        self.buffer += text
+        fields = []
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.field_start is None:
+                    self.field_start = self.pos
+            elif ch in '{[':
+                self.depth += 1
+            elif ch in '}]':
+                if self.depth == 1:
+                    self._close_field(fields)
+                self.depth -= 1
+            elif ch == ',' and self.depth == 1:
+                self._close_field(fields)
+            self.pos += 1
+        return fields
+
+    def _close_field(self, fields):
+        if self.field_start is None:
+            return
+        segment = self.buffer[self.field_start:self.pos]
+        self.field_start = None
+        try:
+            fields.extend(json.loads("{" + segment + "}").items())
+        except ValueError:
+            # Malformed member; the full parse at the end will surface the error
+            pass
+
+
+def ndjson_line(event):
+    """Encodes one streaming event as a newline-terminated JSON line (bytes)."""
+    return to_json(event) + b"\n"
@@ -0,0 +1,262 @@
+import json
+import os
+import re
+import struct
+import time
+import uuid
+
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+MAX_UPLOAD_PIXELS = int(os.getenv('MAX_UPLOAD_PIXELS', str(50_000_000)))
+# Photos accepted by one multi-photo /api/analyze scan (each within MAX_UPLOAD_BYTES)
+MAX_PHOTOS = int(os.getenv('ANALYZE_MAX_PHOTOS', '4'))
+CHUNK_SIZE = 64 * 1024
+
+# Multipart framing and form fields on top of the file itself
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SIGNATURE = b'\xff\xd8\xff'
+
+# SOF markers carry the frame dimensions (C4 = DHT, C8 = JPG, CC = DAC are not frames)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class UploadRejected(Exception):
+    """Raised when an upload fails validation. `status_code` is the HTTP status to return."""
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def sniff_image_type(head):
+    """Returns the MIME type implied by the magic bytes, or None if not JPEG/PNG."""
+    if head.startswith(PNG_SIGNATURE):
+        return 'image/png'
+    if head.startswith(JPEG_SIGNATURE):
+        return 'image/jpeg'
+    return None
+
+
+def _png_dimensions(data):
+    # Signature (8) + IHDR length (4) + b'IHDR' (4) + width (4) + height (4)
+    if len(data) < 24:
+        return None
+    if data[12:16] != b'IHDR':
+        raise UploadRejected("Corrupt PNG header.")
+    width, height = struct.unpack('>II', data[16:24])
+    return width, height
+
+
+def _jpeg_dimensions(data):
+    offset = 2
+    length = len(data)
+    while offset + 4 <= length:
+        if data[offset] != 0xFF:
+            raise UploadRejected("Corrupt JPEG header.")
+        marker = data[offset + 1]
+        # Fill bytes between markers
+        if marker == 0xFF:
+            offset += 1
+            continue
+        # Standalone markers without a length field
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            offset += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            # End of image / start of scan before any frame header
+            raise UploadRejected("JPEG has no frame header.")
+        segment_length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 9 > length:
+                return None
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + segment_length
+    return None
+
+
+def image_dimensions(data, mime_type):
+    """
+    Parses width/height from the image header without decoding pixels.
+    Returns None if `data` does not yet contain the full header.
+    """
+    if mime_type == 'image/png':
+        return _png_dimensions(data)
+    return _jpeg_dimensions(data)
+
+
+def check_content_length(content_length, max_bytes=MAX_UPLOAD_BYTES):
+    """Rejects a request up front when its declared body is larger than any valid upload."""
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + FORM_OVERHEAD_BYTES:
+        raise UploadRejected(f"Upload too large (max {max_bytes // (1024 * 1024)} MB).", status_code=413)
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware capping the request body of upload endpoints at `limits[path]` plus
+    FORM_OVERHEAD_BYTES. A declared Content-Length over the cap is refused before anything
+    is read; otherwise the bytes are counted as they arrive, so a chunked body without
+    Content-Length is cut off with 413 as soon as it passes the cap instead of being
+    spooled whole by the multipart parser.
+    """
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.limits:
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.limits[scope["path"]]
+        headers = dict(scope.get("headers", []))
+        try:
+            check_content_length(headers.get(b'content-length', b'').decode('latin-1'), max_bytes)
+        except UploadRejected as e:
+            await _send_rejection(send, e)
+            return
+
+        limit = max_bytes + FORM_OVERHEAD_BYTES
+        received = 0
+        rejected = None
+        started = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    rejected = UploadRejected(f"Upload too large (max {max_bytes // (1024 * 1024)} MB).", status_code=413)
+                    raise rejected
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # Once over the cap, whatever error the app makes of the aborted read is replaced by the 413
+            if rejected is not None:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadRejected as e:
+            if e is not rejected:
+                raise
+        if rejected is not None and not started:
+            await _send_rejection(send, rejected)
+
+
+async def _send_rejection(send, e):
+    body = json.dumps({"status": "error", "message": e.message, "error": e.message}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": e.status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_image_upload(file, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_UPLOAD_PIXELS):
+    """
+    Reads an UploadFile chunk by chunk, validating as it goes:
+    magic bytes on the first chunk, dimensions as soon as the header is available,
+    and the byte cap on every chunk. Stops reading at the first failure.
+    Returns (content_bytes, sniffed_mime_type).
+    """
+    # Spooled uploads know their size already; refuse without touching the data
+    if getattr(file, 'size', None) and file.size > max_bytes:
+        raise UploadRejected(f"Upload too large (max {max_bytes // (1024 * 1024)} MB).", status_code=413)
+
+    chunks = []
+    total = 0
+    mime_type = None
+    dimensions = None
+
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadRejected(f"Upload too large (max {max_bytes // (1024 * 1024)} MB).", status_code=413)
+        chunks.append(chunk)
+
+        if mime_type is None:
+            head = b''.join(chunks)
+            if len(head) < len(PNG_SIGNATURE):
+                continue
+            mime_type = sniff_image_type(head)
+            if mime_type is None:
+                raise UploadRejected("Only JPEG and PNG images are allowed.", status_code=415)
+
+        if dimensions is None:
+            dimensions = image_dimensions(b''.join(chunks), mime_type)
+            if dimensions is not None:
+                width, height = dimensions
+                if width == 0 or height == 0:
+                    raise UploadRejected("Image has invalid dimensions.")
+                if width * height > max_pixels:
+                    raise UploadRejected(f"Image dimensions too large ({width}x{height}).", status_code=413)
+
+    if mime_type is None:
+        raise UploadRejected("Empty or unrecognized image upload.", status_code=415)
+    if dimensions is None:
+        raise UploadRejected("Could not read image dimensions.")
+
+    return b''.join(chunks), mime_type
+
+
+# --- Direct-to-storage uploads ---
+# The browser PUTs the photo to a signed URL under UPLOAD_PREFIX and sends only the key
+# with the lead; the API checks the stored object instead of proxying the bytes.
+UPLOAD_PREFIX = "incoming/"
+UPLOAD_URL_TTL = int(os.getenv('UPLOAD_URL_TTL', '900'))
+UPLOAD_EXTENSIONS = {'image/jpeg': 'jpeg', 'image/png': 'png'}
+UPLOAD_KEY_RE = re.compile(r'^incoming/(\d{10})-([0-9a-f]{32})\.(jpeg|png)$')
+HEAD_BYTES = 64 * 1024
+
+
+def new_upload_key(content_type):
+    """Unguessable key for one direct upload; the issue time is part of it so stale keys can be refused."""
+    extension = UPLOAD_EXTENSIONS.get(content_type)
+    if extension is None:
+        raise UploadRejected("Only JPEG and PNG images are allowed.", status_code=415)
+    return f"{UPLOAD_PREFIX}{int(time.time())}-{uuid.uuid4().hex}.{extension}"
+
+
+def verify_stored_upload(blobs, key, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_UPLOAD_PIXELS):
+    """
+    Checks a directly uploaded object the same way read_image_upload checks a form upload:
+    key format and age, size, magic bytes and header dimensions. Only the first
+    HEAD_BYTES are fetched. Returns the sniffed MIME type.
+    """
+    match = UPLOAD_KEY_RE.match(key or '')
+    if not match:
+        raise UploadRejected("Invalid image key.")
+    # Keys are only valid for a while after issue (plus slack for a slow upload)
+    if time.time() - int(match.group(1)) > UPLOAD_URL_TTL * 2:
+        raise UploadRejected("Image upload expired, please upload again.", status_code=410)
+
+    stored = blobs.read_head(key, HEAD_BYTES)
+    if stored is None:
+        raise UploadRejected("Uploaded image not found.", status_code=404)
+    head, size = stored
+    if size > max_bytes:
+        raise UploadRejected(f"Upload too large (max {max_bytes // (1024 * 1024)} MB).", status_code=413)
+
+    mime_type = sniff_image_type(head)
+    if mime_type is None or UPLOAD_EXTENSIONS[mime_type] != match.group(3):
+        raise UploadRejected("Only JPEG and PNG images are allowed.", status_code=415)
+    dimensions = image_dimensions(head, mime_type)
+    if dimensions is None:
+        raise UploadRejected("Could not read image dimensions.")
+    width, height = dimensions
+    if width == 0 or height == 0:
+        raise UploadRejected("Image has invalid dimensions.")
+    if width * height > max_pixels:
+        raise UploadRejected(f"Image dimensions too large ({width}x{height}).", status_code=413)
+    return mime_type
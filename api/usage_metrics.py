@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+
+# USD per 1M tokens as (input, output), from the public price list when this was written.
+# Override or extend with GEMINI_PRICING_JSON='{"model-name": [input, output]}'.
+MODEL_PRICING = {
+    'gemini-3-flash-preview': (0.50, 3.00),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-flash-lite': (0.10, 0.40),
+}
+# Cached input tokens are billed at a fraction of the normal input price
+CACHED_INPUT_DISCOUNT = float(os.getenv('GEMINI_CACHED_INPUT_DISCOUNT', '0.25'))
+
+try:
+    MODEL_PRICING.update({k: tuple(v) for k, v in json.loads(os.getenv('GEMINI_PRICING_JSON') or '{}').items()})
+except ValueError as e:
+    print(f"WARNING: Ignoring invalid GEMINI_PRICING_JSON: {e}")
+
+
+def _modality_tokens(details, modality):
+    total = 0
+    for detail in details or []:
+        name = getattr(getattr(detail, 'modality', None), 'name', None) or str(getattr(detail, 'modality', ''))
+        if modality in name.upper():
+            total += getattr(detail, 'token_count', 0) or 0
+    return total
+
+
+def usage_from_response(response):
+    """
+    Token usage from a google-generativeai or google-genai response (or the last stream chunk).
+    Returns None when the response carries no usage metadata.
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return None
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return {
+        "prompt_tokens": getattr(usage, 'prompt_token_count', 0) or 0,
+        "cached_tokens": getattr(usage, 'cached_content_token_count', 0) or 0,
+        "image_tokens": _modality_tokens(details, 'IMAGE'),
+        "text_tokens": _modality_tokens(details, 'TEXT'),
+        "output_tokens": getattr(usage, 'candidates_token_count', 0) or 0,
+        "thinking_tokens": getattr(usage, 'thoughts_token_count', 0) or 0,
+    }
+
+
+def estimate_cost(model, usage):
+    input_price, output_price = MODEL_PRICING.get(model, (0.0, 0.0))
+    fresh_input = usage["prompt_tokens"] - usage["cached_tokens"]
+    return (
+        fresh_input * input_price
+        + usage["cached_tokens"] * input_price * CACHED_INPUT_DISCOUNT
+        + (usage["output_tokens"] + usage["thinking_tokens"]) * output_price
+    ) / 1_000_000
+
+
+class UsageMeter:
+    """Per-model counters for calls, tokens, estimated cost, latency and time to first token."""
+    COUNTERS = ("prompt_tokens", "cached_tokens", "image_tokens", "text_tokens", "output_tokens", "thinking_tokens")
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, usage, latency, ttft=None):
+        with self._lock:
+            stats = self._models.setdefault(model, {
+                "calls": 0, "cost_usd": 0.0, "latency_total": 0.0, "ttft_total": 0.0, "ttft_calls": 0,
+                **{counter: 0 for counter in self.COUNTERS},
+            })
+            stats["calls"] += 1
+            stats["latency_total"] += latency
+            if ttft is not None:
+                stats["ttft_total"] += ttft
+                stats["ttft_calls"] += 1
+            if usage:
+                for counter in self.COUNTERS:
+                    stats[counter] += usage[counter]
+                stats["cost_usd"] += estimate_cost(model, usage)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {}
+            for model, stats in self._models.items():
+                calls = stats["calls"] or 1
+                snapshot[model] = {
+                    "calls": stats["calls"],
+                    **{counter: stats[counter] for counter in self.COUNTERS},
+                    "avg_prompt_tokens": round(stats["prompt_tokens"] / calls, 1),
+                    "avg_output_tokens": round(stats["output_tokens"] / calls, 1),
+                    "cost_usd": round(stats["cost_usd"], 6),
+                    "avg_latency": round(stats["latency_total"] / calls, 3),
+                    "avg_ttft": round(stats["ttft_total"] / stats["ttft_calls"], 3) if stats["ttft_calls"] else None,
+                }
+            return snapshot
+
+
+usage_meter = UsageMeter()
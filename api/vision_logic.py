@@ -1,9 +1,21 @@
 import google.generativeai as genai
+import copy
+import hashlib
 import os
-import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import typing_extensions as typing
 from dotenv import load_dotenv
 
+from vision_providers import VisionProvider, VisionRouter, provider_timeout, limiter_from_env
+from local_vision import LocalHeuristicProvider, quality_gate, retake_result
+from stream_utils import IncrementalJSONParser
+from usage_metrics import usage_meter, usage_from_response
+from analysis_model import parse_analysis_json, parse_batch_analysis_json, normalize_analysis
+from image_workers import image_pool
+
 load_dotenv()
 
 # Fallback or load from environment
@@ -38,6 +50,10 @@ class AnalysisResult(typing.TypedDict):
     suitability_score: int
     scout_feedback: str
 
+class BatchAnalysisResult(typing.TypedDict):
+    images: list[AnalysisResult]
+    aggregate: AnalysisResult
+
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
 # Config for balanced creativity and JSON format
@@ -55,19 +71,11 @@ safety_settings = {
     HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
 }
 
-model = genai.GenerativeModel(
-    'gemini-3-flash-preview',
-    generation_config=generation_config,
-    safety_settings=safety_settings
-)
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-3-flash-preview')
+GENAI_MODEL = os.getenv('GENAI_MODEL', 'gemini-2.5-flash-lite')
 
-def analyze_image(image_bytes, mime_type="image/jpeg"):
-    """
-    Analyzes an image using Gemini 1.5 Flash to extract technical industry markers.
-    """
-    try:
-        # Prompt Pivot: Professional Technical Audit
-        prompt = """
+# Prompt Pivot: Professional Technical Audit
+PROMPT = """
         Analyze this image for modeling potential. Return JSON:
         {
           "face_geometry": {
@@ -90,47 +98,65 @@ def analyze_image(image_bytes, mime_type="image/jpeg"):
         
         Score 75-85 for most people. Focus on natural features, not photo quality.
         """
-        
-        # Validating input type
-        if not image_bytes:
-            raise ValueError("No image data provided")
 
-        # Optimization: Resize large images to prevent timeouts
-        try:
-            from PIL import Image
-            import io
-            
-            # Open image from bytes
-            img = Image.open(io.BytesIO(image_bytes))
-            
-            # Resize if Dimension > 1024
-            max_size = 1024
-            if img.width > max_size or img.height > max_size:
-                print(f"Resizing image from {img.width}x{img.height} to max {max_size}px")
-                img.thumbnail((max_size, max_size))
-                
-                # Save back to bytes
-                buffer = io.BytesIO()
-                # Convert to RGB if necessary (e.g. for PNGs with transparency)
-                if img.mode in ("RGBA", "P"):
-                    img = img.convert("RGB")
-                    
-                img.save(buffer, format="JPEG", quality=85)
-                image_bytes = buffer.getvalue()
-                mime_type = "image/jpeg" # Force JPEG after resizing
-                print(f"Resized image size: {len(image_bytes)} bytes")
-                
-        except Exception as e:
-            print(f"Image resizing failed (proceeding with original): {e}")
-        
-        # Ensure image_bytes is passed correctly
+# The static instruction goes in the system instruction, so every request shares the same
+# prefix (eligible for Gemini's implicit prompt caching) and only the image varies per call
+USER_PROMPT = "Analyze this photo."
+
+model = genai.GenerativeModel(
+    GEMINI_MODEL,
+    generation_config=generation_config,
+    safety_settings=safety_settings,
+    system_instruction=PROMPT
+)
+
+# Multi-photo scans: same system instruction (so the cached prefix is shared), batch schema
+batch_model = genai.GenerativeModel(
+    GEMINI_MODEL,
+    generation_config={**generation_config, "response_schema": BatchAnalysisResult},
+    safety_settings=safety_settings,
+    system_instruction=PROMPT
+)
+
+def batch_prompt(count):
+    return (
+        f"These {count} photos show the same person. Analyze each photo separately, in the order given, "
+        "then assess the person across all of them. Return JSON: "
+        '{"images": [one result per photo, in order, each in the format above], '
+        '"aggregate": one result in the same format for the person overall}.'
+    )
+
+def batch_contents(images, image_part):
+    """Photos labelled in order, then the batch instruction; `image_part` builds the SDK's image part."""
+    contents = []
+    for i, (image_bytes, mime_type) in enumerate(images, 1):
+        contents.append(f"Photo {i}:")
+        contents.append(image_part(image_bytes, mime_type))
+    contents.append(batch_prompt(len(images)))
+    return contents
+
+class GeminiProvider(VisionProvider):
+    """Gemini through the google-generativeai SDK (the original integration)."""
+    name = "gemini"
+
+    def __init__(self):
+        latency_budget = float(os.getenv('GEMINI_LATENCY_BUDGET', '15'))
+        super().__init__(quality=2, cost=1.0, latency_budget=latency_budget, limiter=limiter_from_env(latency_budget))
+
+    def available(self):
+        return bool(API_KEY)
+
+    def analyze(self, image_bytes, mime_type):
+        start = time.perf_counter()
         # The SDK handles bytes directly if passed as a Part with mime_type
         response = model.generate_content(
             [
                 {"mime_type": mime_type, "data": image_bytes}, 
-                prompt
-            ]
+                USER_PROMPT
+            ],
+            request_options={"timeout": provider_timeout()}
         )
+        usage_meter.record(GEMINI_MODEL, usage_from_response(response), time.perf_counter() - start)
         
         # Check validation
         print(f"Candidates generated: {len(response.candidates)}")
@@ -138,40 +164,407 @@ def analyze_image(image_bytes, mime_type="image/jpeg"):
              # If blocked despite safety settings, log it
              print(f"Prompt FeedBack: {response.prompt_feedback}")
              
-        result = json.loads(response.text)
-        
-        # Enforce minimum score of 70 as requested
-        if 'suitability_score' in result:
+        return self.parse(response.text)
+
+    def analyze_batch(self, images):
+        start = time.perf_counter()
+        response = batch_model.generate_content(
+            batch_contents(images, lambda data, mime_type: {"mime_type": mime_type, "data": data}),
+            request_options={"timeout": provider_timeout()}
+        )
+        usage_meter.record(GEMINI_MODEL, usage_from_response(response), time.perf_counter() - start)
+        return parse_batch_analysis_json(response.text, len(images))
+
+    def stream(self, image_bytes, mime_type):
+        start = time.perf_counter()
+        ttft = None
+        last = None
+        response = model.generate_content(
+            [
+                {"mime_type": mime_type, "data": image_bytes}, 
+                USER_PROMPT
+            ],
+            stream=True,
+            request_options={"timeout": provider_timeout()}
+        )
+        for chunk in response:
+            last = chunk
+            if chunk.parts:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                yield chunk.text
+        usage_meter.record(GEMINI_MODEL, usage_from_response(last), time.perf_counter() - start, ttft)
+
+    def parse(self, text):
+        # Parse, validate and fill defaults in one pass
+        return parse_analysis_json(text)
+
+    def warm(self):
+        # count_tokens is free and goes through the same client/channel as generate_content
+        model.count_tokens(USER_PROMPT, request_options={"timeout": provider_timeout()})
+
+class GenAIProvider(VisionProvider):
+    """Gemini through the newer google-genai SDK, pointed at a cheaper model by default."""
+    name = "genai"
+
+    def __init__(self):
+        latency_budget = float(os.getenv('GENAI_LATENCY_BUDGET', '10'))
+        super().__init__(quality=1, cost=0.3, latency_budget=latency_budget, limiter=limiter_from_env(latency_budget))
+        self._client = None
+        # Explicit context cache for the static instruction (GEMINI_CONTEXT_CACHE=1)
+        self.use_cache = os.getenv('GEMINI_CONTEXT_CACHE', '0') == '1'
+        self.cache_ttl = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL', '3600'))
+        self._cache_name = None
+        self._cache_expires = 0.0
+        self._cache_lock = threading.Lock()
+
+    def available(self):
+        return bool(API_KEY)
+
+    def _get_client(self):
+        if self._client is None:
+            from google import genai as genai_sdk
+            self._client = genai_sdk.Client(api_key=API_KEY)
+        return self._client
+
+    def analyze(self, image_bytes, mime_type):
+        from google.genai import types
+
+        start = time.perf_counter()
+        response = self._get_client().models.generate_content(
+            model=GENAI_MODEL,
+            contents=[types.Part.from_bytes(data=image_bytes, mime_type=mime_type), USER_PROMPT],
+            config=self._config(),
+        )
+        usage_meter.record(GENAI_MODEL, usage_from_response(response), time.perf_counter() - start)
+        return self.parse(response.text)
+
+    def analyze_batch(self, images):
+        from google.genai import types
+
+        start = time.perf_counter()
+        response = self._get_client().models.generate_content(
+            model=GENAI_MODEL,
+            contents=batch_contents(images, lambda data, mime_type: types.Part.from_bytes(data=data, mime_type=mime_type)),
+            config=self._config(),
+        )
+        usage_meter.record(GENAI_MODEL, usage_from_response(response), time.perf_counter() - start)
+        return parse_batch_analysis_json(response.text, len(images))
+
+    def stream(self, image_bytes, mime_type):
+        from google.genai import types
+
+        start = time.perf_counter()
+        ttft = None
+        last = None
+        for chunk in self._get_client().models.generate_content_stream(
+            model=GENAI_MODEL,
+            contents=[types.Part.from_bytes(data=image_bytes, mime_type=mime_type), USER_PROMPT],
+            config=self._config(),
+        ):
+            last = chunk
+            if chunk.text:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                yield chunk.text
+        usage_meter.record(GENAI_MODEL, usage_from_response(last), time.perf_counter() - start, ttft)
+
+    def parse(self, text):
+        return parse_analysis_json(text)
+
+    def warm(self):
+        # Creates the client, opens its pooled connection and, if enabled, the context cache
+        self._get_client().models.count_tokens(model=GENAI_MODEL, contents=USER_PROMPT)
+        self._cached_content()
+
+    def _cached_content(self):
+        """
+        Name of a context cache holding the static instruction, created on first use and
+        recreated shortly before it expires. Returns None if caching is off or unavailable
+        (the API refuses caches below the model's minimum token count).
+        """
+        if not self.use_cache:
+            return None
+        with self._cache_lock:
+            if self._cache_name and time.monotonic() < self._cache_expires:
+                return self._cache_name
+            from google.genai import types
             try:
-                score = int(result['suitability_score'])
-                print(f"Raw Score: {score}")
-                result['suitability_score'] = max(score, 70)
-            except:
-                result['suitability_score'] = 70
-        else:
-            result['suitability_score'] = 70
-        
-        # Add fallback values for fields that AI sometimes skips
-        if 'face_geometry' in result:
-            if not result['face_geometry'].get('jawline_definition'):
-                result['face_geometry']['jawline_definition'] = 'Defined'
+                cache = self._get_client().caches.create(
+                    model=GENAI_MODEL,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=PROMPT,
+                        ttl=f"{self.cache_ttl}s",
+                    ),
+                )
+                self._cache_name = cache.name
+                self._cache_expires = time.monotonic() + self.cache_ttl * 0.9
+                print(f"[VISION] Created context cache {cache.name} for {GENAI_MODEL}")
+            except Exception as e:
+                print(f"[VISION] Context cache unavailable, using system instruction: {e}")
+                self.use_cache = False
+                self._cache_name = None
+            return self._cache_name
+
+    def _config(self):
+        from google.genai import types
+
+        cache_name = self._cached_content()
+        return types.GenerateContentConfig(
+            temperature=generation_config["temperature"],
+            response_mime_type="application/json",
+            # A cached context already carries the instruction; sending both is rejected
+            system_instruction=None if cache_name else PROMPT,
+            cached_content=cache_name,
+            safety_settings=[
+                types.SafetySetting(category=category.name, threshold="BLOCK_NONE")
+                for category in safety_settings
+            ],
+            http_options=types.HttpOptions(timeout=int(provider_timeout() * 1000)),
+        )
+
+def build_router():
+    """Registers the enabled providers; VISION_PROVIDERS is a comma-separated allow-list."""
+    enabled = [name.strip() for name in os.getenv('VISION_PROVIDERS', 'gemini,genai,local').split(',') if name.strip()]
+    registry = {
+        "gemini": GeminiProvider,
+        "genai": GenAIProvider,
+        "local": LocalHeuristicProvider,
+    }
+    router = VisionRouter()
+    for name in enabled:
+        if name not in registry:
+            print(f"WARNING: Unknown vision provider '{name}' in VISION_PROVIDERS")
+            continue
+        router.register(registry[name]())
+    return router
+
+router = build_router()
+
+def preprocess_image(image_bytes, mime_type):
+    """
+    Resize large images to prevent timeouts, and take the local technical measurements
+    (resolution, brightness, sharpness) while the image is decoded anyway.
+    Runs in the image worker pool when IMAGE_WORKERS is set (see image_workers.py).
+    Returns (image_bytes, mime_type, metrics); on failure the original bytes are passed
+    through and metrics is None.
+    """
+    try:
+        return image_pool.process(image_bytes, mime_type)
+    except Exception as e:
+        print(f"Image resizing failed (proceeding with original): {e}")
+        return image_bytes, mime_type, None
+
+def normalize_result(result):
+    """Score floor and fallback values for fields that models sometimes skip (see AnalysisModel)."""
+    return normalize_analysis(result)
+
+# Model results per photo, keyed by the SHA-256 of the uploaded bytes, so a photo that was
+# already analyzed (alone or in a multi-photo scan) is never sent to the model again
+ANALYSIS_CACHE_SIZE = int(os.getenv('ANALYSIS_CACHE_SIZE', '2048'))
+ANALYSIS_CACHE_TTL = float(os.getenv('ANALYSIS_CACHE_TTL', '86400'))
+
+class AnalysisCache:
+    """
+    LRU of analysis results with a TTL. Only model answers are kept: local heuristic
+    fallbacks, retake answers and failures are worth retrying later.
+    """
+    def __init__(self, max_size=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return copy.deepcopy(entry[0])
+
+    def put(self, digest, result):
+        if result.get('error') or result.get('retake_photo') or result.get('provider') in (None, 'local'):
+            return
+        with self._lock:
+            self._entries[digest] = (copy.deepcopy(result), time.monotonic() + self.ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+analysis_cache = AnalysisCache()
+
+def analyze_image(image_bytes, mime_type="image/jpeg"):
+    """
+    Analyzes an image with the best healthy vision provider, failing over
+    down to the local heuristic analyzer when Gemini is slow or erroring.
+    """
+    try:
+        # Validating input type
+        if not image_bytes:
+            raise ValueError("No image data provided")
+
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        cached = analysis_cache.get(digest)
+        if cached is not None:
+            print(f"[VISION] Cached result for image {digest[:12]}")
+            return cached
+
+        image_bytes, mime_type, metrics = preprocess_image(image_bytes, mime_type)
+
+        # Unusable photos (black, blurry, tiny) get an instant retake answer instead of a model call
+        gate = quality_gate(metrics) if metrics else None
+        if gate and not gate["passed"]:
+            print(f"[QUALITY_GATE] Rejected photo: {gate['reasons']}")
+            return retake_result(gate, metrics)
         
-        if not result.get('scout_feedback'):
-            result['scout_feedback'] = 'Strong commercial potential with natural appeal.'
-                
+        result, provider_name = router.analyze(image_bytes, mime_type)
+        result = normalize_result(result)
+        result['provider'] = provider_name
+        if gate:
+            result['quality_gate'] = gate
+        analysis_cache.put(digest, result)
         return result
 
     except Exception as e:
         import traceback
         traceback.print_exc()
-        print(f"Error in Gemini analysis: {e}")
-        # Return a mock response if API fails (for development safety) or re-raise
-        # For now, returning minimal error structure
-        return {
-            "error": f"{str(e)}",
-            "suitability_score": 70,
-            "market_categorization": {"primary": "Unknown", "rationale": "Analysis failed."},
-            "face_geometry": {"primary_shape": "Unknown", "jawline_definition": "Unknown", "structural_note": "N/A"},
-            "aesthetic_audit": {"lighting_quality": "Unknown", "professional_readiness": "Unknown", "technical_flaw": "Analysis Error"},
-            "scout_feedback": f"Analysis failed: {str(e)}"
-        }
+        print(f"Error in vision analysis: {e}")
+        return failed_result(e)
+
+def failed_result(e):
+    # Return a mock response if every provider failed (for development safety)
+    # For now, returning minimal error structure
+    return {
+        "error": f"{str(e)}",
+        "suitability_score": 70,
+        "market_categorization": {"primary": "Unknown", "rationale": "Analysis failed."},
+        "face_geometry": {"primary_shape": "Unknown", "jawline_definition": "Unknown", "structural_note": "N/A"},
+        "aesthetic_audit": {"lighting_quality": "Unknown", "professional_readiness": "Unknown", "technical_flaw": "Analysis Error"},
+        "scout_feedback": f"Analysis failed: {str(e)}"
+    }
+
+def combine_results(results):
+    """
+    Aggregate for a multi-photo scan when no single model call saw every photo (some came
+    from the cache): the strongest usable photo stands for the set.
+    """
+    usable = [r for r in results if not r.get('error') and not r.get('retake_photo')]
+    best = max(usable or results, key=lambda r: r.get('suitability_score', 0))
+    aggregate = copy.deepcopy(best)
+    aggregate.pop('quality_gate', None)
+    aggregate.pop('technical_metrics', None)
+    return aggregate
+
+def analyze_images(images):
+    """
+    Multi-photo analysis of one person; `images` is [(image_bytes, mime_type), ...].
+    Cached photos are reused, the rest are preprocessed in parallel and, if they pass the
+    quality gate, analyzed together in one model call that also returns the aggregate.
+    Returns {"images": [result per photo, in order], "aggregate": result}.
+    """
+    digests = [hashlib.sha256(image_bytes).hexdigest() for image_bytes, _ in images]
+    results = [analysis_cache.get(digest) for digest in digests]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if len(pending) < len(images):
+        print(f"[VISION] {len(images) - len(pending)} of {len(images)} photos answered from cache")
+
+    prepared = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="preprocess") as pool:
+            prepared = dict(zip(pending, pool.map(lambda i: preprocess_image(*images[i]), pending)))
+
+    batch = []
+    for i in pending:
+        image_bytes, mime_type, metrics = prepared[i]
+        gate = quality_gate(metrics) if metrics else None
+        if gate and not gate["passed"]:
+            print(f"[QUALITY_GATE] Rejected photo {i + 1}: {gate['reasons']}")
+            results[i] = retake_result(gate, metrics)
+        else:
+            batch.append((i, image_bytes, mime_type, gate))
+
+    aggregate = None
+    if batch:
+        try:
+            (batch_results, aggregate), provider_name = router.analyze_batch(
+                [(image_bytes, mime_type) for _, image_bytes, mime_type, _ in batch]
+            )
+            for (i, _, _, gate), result in zip(batch, batch_results):
+                result = normalize_result(result)
+                result['provider'] = provider_name
+                if gate:
+                    result['quality_gate'] = gate
+                results[i] = result
+                analysis_cache.put(digests[i], result)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            print(f"Error in multi-photo analysis: {e}")
+            for i, _, _, _ in batch:
+                results[i] = failed_result(e)
+            aggregate = None
+
+    # The model's aggregate only counts when its call saw every photo worth assessing
+    if aggregate is not None and len(pending) == len(images):
+        aggregate = normalize_result(aggregate)
+        aggregate['provider'] = provider_name
+    else:
+        aggregate = combine_results(results)
+    return {"images": results, "aggregate": aggregate}
+
+def analyze_image_stream(image_bytes, mime_type="image/jpeg"):
+    """
+    Two-phase analysis as a generator of events:
+      {"type": "precheck", "technical_audit": {...}, "quality_gate": {...}}
+                                                      local measurements, available immediately
+      {"type": "field", "key": ..., "value": ...}     each top-level result field as the model emits it
+      {"type": "reset"}                               a provider failed mid-stream; drop shown fields
+      {"type": "result", "result": {...}}             the complete normalized result, always last
+    """
+    try:
+        if not image_bytes:
+            raise ValueError("No image data provided")
+
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        cached = analysis_cache.get(digest)
+        if cached is not None:
+            print(f"[VISION] Cached result for image {digest[:12]}")
+            yield {"type": "result", "result": cached}
+            return
+
+        image_bytes, mime_type, metrics = preprocess_image(image_bytes, mime_type)
+        gate = quality_gate(metrics) if metrics else None
+        yield {"type": "precheck", "technical_audit": metrics, "quality_gate": gate}
+        if gate and not gate["passed"]:
+            print(f"[QUALITY_GATE] Rejected photo: {gate['reasons']}")
+            yield {"type": "result", "result": retake_result(gate, metrics)}
+            return
+
+        parser = IncrementalJSONParser()
+        for event in router.stream(image_bytes, mime_type):
+            if event[0] == "text":
+                for key, value in parser.feed(event[1]):
+                    if key == 'suitability_score':
+                        value = normalize_result({key: value})[key]
+                    yield {"type": "field", "key": key, "value": value}
+            elif event[0] == "reset":
+                parser = IncrementalJSONParser()
+                yield {"type": "reset"}
+            else:
+                _, result, provider_name = event
+                result = normalize_result(result)
+                result['provider'] = provider_name
+                if gate:
+                    result['quality_gate'] = gate
+                analysis_cache.put(digest, result)
+                yield {"type": "result", "result": result}
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Error in streamed vision analysis: {e}")
+        yield {"type": "result", "result": failed_result(e)}
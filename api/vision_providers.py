@@ -0,0 +1,392 @@
+import json
+import os
+import threading
+import time
+
+from capture_utils import record_upstream
+
+
+class ProviderUnavailable(Exception):
+    """Raised when no vision provider could produce a result."""
+    pass
+
+
+class LimiterTimeout(Exception):
+    """Raised when a call waited past its deadline for a concurrency slot."""
+    pass
+
+
+OVERLOAD_STATUS_CODES = {429, 503, 504}
+OVERLOAD_ERROR_NAMES = {"ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "TooManyRequests"}
+
+
+def is_overload_error(e):
+    """True for errors that mean 'slow down' (quota, overload, timeouts) rather than a bad request."""
+    code = getattr(e, 'code', None) or getattr(e, 'status_code', None)
+    if isinstance(code, int) and code in OVERLOAD_STATUS_CODES:
+        return True
+    if type(e).__name__ in OVERLOAD_ERROR_NAMES:
+        return True
+    message = str(e).lower()
+    return '429' in message or 'timed out' in message or 'timeout' in message or 'quota' in message
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for calls to one upstream.
+    Each fast success adds 1/limit (about +1 per round of calls); an overload error
+    or a call slower than `latency_target` halves the limit, at most once per
+    round-trip so one burst of failures counts as a single congestion signal.
+    Callers over the limit wait in line until their deadline, then get LimiterTimeout.
+    """
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_target=10.0, backoff=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise LimiterTimeout(f"no slot within {timeout:.1f}s (limit {int(self.limit)})")
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    def release(self, latency, overloaded=False):
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded or latency > self.latency_target:
+                if now - self._last_decrease >= min(latency, self.latency_target):
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Gives a slot back without a latency sample (the call never ran or was abandoned)."""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "rejected": self.rejected,
+            }
+
+
+class VisionProvider:
+    """
+    Base class for vision backends.
+    Subclasses implement `analyze(image_bytes, mime_type)` and return an AnalysisResult-shaped dict.
+
+    `quality` ranks how good the answers are (higher is preferred), `cost` is the relative
+    price of one call, and `latency_budget` is the slowest acceptable call in seconds.
+    """
+    name = "base"
+
+    def __init__(self, quality=1, cost=1.0, latency_budget=20.0, limiter=None):
+        self.quality = quality
+        self.cost = cost
+        self.latency_budget = latency_budget
+        # Remote providers get an AdaptiveLimiter; local ones run unthrottled
+        self.limiter = limiter
+
+    def available(self):
+        return True
+
+    def analyze(self, image_bytes, mime_type):
+        raise NotImplementedError
+
+    def analyze_batch(self, images):
+        """
+        Analyzes several photos of one person, given as [(image_bytes, mime_type), ...].
+        Returns (results in the same order, aggregate result or None). Providers without a
+        batched call analyze the photos one by one and leave the aggregate to the caller.
+        """
+        return [self.analyze(image_bytes, mime_type) for image_bytes, mime_type in images], None
+
+    def stream(self, image_bytes, mime_type):
+        """Yields the JSON result as text chunks. Providers without native streaming yield it whole."""
+        yield json.dumps(self.analyze(image_bytes, mime_type))
+
+    def parse(self, text):
+        """Parses the full streamed text into a result."""
+        return json.loads(text)
+
+    def warm(self):
+        """Creates clients and opens connections ahead of the first request, without billed work."""
+
+
+class ProviderHealth:
+    """
+    Rolling health for one provider: EWMA latency, error rate and a circuit breaker.
+    The circuit opens after `failure_threshold` consecutive failures (a call slower than the
+    latency budget counts as one) and lets a single probe through after `cooldown` seconds.
+    """
+    def __init__(self, failure_threshold=3, cooldown=30.0, alpha=0.2):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.ewma_latency = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.calls = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def ready(self):
+        """True if allow() would currently let a call through; claims nothing."""
+        with self._lock:
+            return (self.consecutive_failures < self.failure_threshold
+                    or (time.monotonic() >= self.open_until and not self._probing))
+
+    def allow(self):
+        """True if the circuit is closed, or if this caller gets the half-open probe."""
+        with self._lock:
+            if self.consecutive_failures < self.failure_threshold:
+                return True
+            if time.monotonic() >= self.open_until and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def abandon(self):
+        """The call was cancelled before an outcome; let the next caller probe instead."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, latency, ok, latency_budget):
+        with self._lock:
+            self.calls += 1
+            self._probing = False
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency = self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+            self.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_rate
+
+            if ok and latency <= latency_budget:
+                self.consecutive_failures = 0
+                return
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.open_until = time.monotonic() + self.cooldown
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "ewma_latency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+                "error_rate": round(self.error_rate, 3),
+                "consecutive_failures": self.consecutive_failures,
+                "circuit_open": self.consecutive_failures >= self.failure_threshold,
+                "calls": self.calls,
+            }
+
+
+class VisionRouter:
+    """
+    Picks providers in order of health, then quality, then cost and observed latency,
+    and fails over to the next one when a call raises.
+    """
+    def __init__(self):
+        self.providers = {}
+        self.health = {}
+        self._lock = threading.Lock()
+
+    def register(self, provider, failure_threshold=3, cooldown=30.0):
+        with self._lock:
+            self.providers[provider.name] = provider
+            self.health[provider.name] = ProviderHealth(failure_threshold, cooldown)
+
+    def candidates(self):
+        ranked = []
+        for name, provider in self.providers.items():
+            if not provider.available():
+                continue
+            health = self.health[name]
+            latency = health.ewma_latency if health.ewma_latency is not None else 0.0
+            ranked.append((-provider.quality, provider.cost, latency, name))
+        ranked.sort()
+        return [self.providers[item[-1]] for item in ranked]
+
+    def analyze(self, image_bytes, mime_type):
+        """Returns (result, provider_name). Raises ProviderUnavailable if every provider failed."""
+        return self._first_success(lambda provider: provider.analyze(image_bytes, mime_type))
+
+    def analyze_batch(self, images):
+        """
+        Multi-photo variant of `analyze`: one call per provider for all of `images`.
+        Returns ((results, aggregate or None), provider_name).
+        """
+        return self._first_success(lambda provider: provider.analyze_batch(images))
+
+    def _first_success(self, call):
+        errors = []
+        for provider in self.candidates():
+            health = self.health[provider.name]
+            if not self._claim(provider, health, errors):
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = call(provider)
+            except Exception as e:
+                self._release(provider, time.perf_counter() - start, e)
+                health.record(time.perf_counter() - start, False, provider.latency_budget)
+                record_upstream(f"vision.{provider.name}", time.perf_counter() - start, False)
+                print(f"[VISION] Provider {provider.name} failed, failing over: {e}")
+                errors.append(f"{provider.name}: {e}")
+                continue
+
+            latency = time.perf_counter() - start
+            self._release(provider, latency)
+            health.record(latency, True, provider.latency_budget)
+            record_upstream(f"vision.{provider.name}", latency)
+            print(f"[VISION] Provider {provider.name} answered in {latency:.2f}s")
+            return result, provider.name
+
+        raise ProviderUnavailable("; ".join(errors) or "No vision provider available")
+
+    def stream(self, image_bytes, mime_type):
+        """
+        Streaming variant of `analyze`. Yields events:
+          ("text", chunk)             raw JSON text as the provider produces it
+          ("reset",)                  the provider failed mid-stream; discard text seen so far
+          ("result", dict, name)      the parsed result, always last
+        Raises ProviderUnavailable if every provider failed.
+        """
+        errors = []
+        for provider in self.candidates():
+            health = self.health[provider.name]
+            if not self._claim(provider, health, errors):
+                continue
+
+            start = time.perf_counter()
+            chunks = []
+            try:
+                for chunk in provider.stream(image_bytes, mime_type):
+                    chunks.append(chunk)
+                    yield ("text", chunk)
+                result = provider.parse("".join(chunks))
+            except GeneratorExit:
+                # Client went away mid-stream; give the slot back without judging the provider
+                self._cancel(provider)
+                health.abandon()
+                raise
+            except Exception as e:
+                self._release(provider, time.perf_counter() - start, e)
+                health.record(time.perf_counter() - start, False, provider.latency_budget)
+                record_upstream(f"vision.{provider.name}", time.perf_counter() - start, False)
+                print(f"[VISION] Provider {provider.name} stream failed, failing over: {e}")
+                errors.append(f"{provider.name}: {e}")
+                if chunks:
+                    yield ("reset",)
+                continue
+
+            latency = time.perf_counter() - start
+            self._release(provider, latency)
+            health.record(latency, True, provider.latency_budget)
+            record_upstream(f"vision.{provider.name}", latency)
+            print(f"[VISION] Provider {provider.name} streamed in {latency:.2f}s")
+            yield ("result", result, provider.name)
+            return
+
+        raise ProviderUnavailable("; ".join(errors) or "No vision provider available")
+
+    def _claim(self, provider, health, errors):
+        """
+        Takes the provider's concurrency slot, then asks the circuit breaker. The slot comes
+        first so a caller holding the half-open probe never gives up waiting for a slot
+        with the probe still marked taken, which would keep the circuit open for good.
+        """
+        if not health.ready():
+            return False
+        if not self._acquire(provider, errors):
+            return False
+        if not health.allow():
+            # Another caller took the probe while this one waited for a slot
+            self._cancel(provider)
+            return False
+        return True
+
+    def _acquire(self, provider, errors):
+        """Waits for the provider's concurrency slot; False means fail over to the next provider."""
+        if provider.limiter is None:
+            return True
+        try:
+            provider.limiter.acquire(queue_deadline())
+            return True
+        except LimiterTimeout as e:
+            print(f"[VISION] Provider {provider.name} saturated, failing over: {e}")
+            errors.append(f"{provider.name}: {e}")
+            return False
+
+    def _release(self, provider, latency, error=None):
+        if provider.limiter is not None:
+            provider.limiter.release(latency, overloaded=error is not None and is_overload_error(error))
+
+    def _cancel(self, provider):
+        if provider.limiter is not None:
+            provider.limiter.cancel()
+
+    def warm(self):
+        """Warms every available provider; returns {name: seconds or error}. Health is not touched."""
+        timings = {}
+        for name, provider in self.providers.items():
+            if not provider.available():
+                continue
+            start = time.perf_counter()
+            try:
+                provider.warm()
+                timings[name] = round(time.perf_counter() - start, 3)
+            except Exception as e:
+                timings[name] = f"error: {e}"
+        return timings
+
+    def stats(self):
+        stats = {}
+        for name, provider in self.providers.items():
+            stats[name] = self.health[name].snapshot()
+            if provider.limiter is not None:
+                stats[name]["concurrency"] = provider.limiter.snapshot()
+        return stats
+
+
+def provider_timeout():
+    """Per-call timeout for remote providers, in seconds."""
+    return float(os.getenv('VISION_PROVIDER_TIMEOUT', '20'))
+
+
+def queue_deadline():
+    """How long a call may wait for a provider's concurrency slot before failing over, in seconds."""
+    return float(os.getenv('VISION_QUEUE_DEADLINE', '5'))
+
+
+def limiter_from_env(latency_target):
+    return AdaptiveLimiter(
+        initial=int(os.getenv('VISION_AIMD_INITIAL', '4')),
+        minimum=int(os.getenv('VISION_AIMD_MIN', '1')),
+        maximum=int(os.getenv('VISION_AIMD_MAX', '32')),
+        latency_target=latency_target,
+    )
@@ -0,0 +1,115 @@
+import io
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# A warm instance answers scheduler pings from its last report instead of redoing the work
+WARMUP_MIN_INTERVAL = float(os.getenv('WARMUP_MIN_INTERVAL', '60'))
+# No single stage may hold up startup or a scheduler call for longer than this
+WARMUP_STAGE_TIMEOUT = float(os.getenv('WARMUP_STAGE_TIMEOUT', '10'))
+
+INSTANCE_ID = uuid.uuid4().hex[:12]
+INSTANCE_STARTED = time.time()
+
+
+def warm_vision(router):
+    timings = router.warm()
+    errors = {name: result for name, result in timings.items() if isinstance(result, str)}
+    if errors:
+        raise RuntimeError(f"{errors} (warm: {timings})")
+    return timings
+
+
+def warm_lead_store():
+    from storage import get_lead_store
+    store = get_lead_store()
+    # Cheapest indexed read; opens the Supabase HTTP connection or the SQLite reader
+    store.list(1)
+    return store.name
+
+
+def warm_blob_store():
+    from storage import get_blob_store, IMAGE_PREFIX
+    blobs = get_blob_store()
+    blobs.exists(f"{IMAGE_PREFIX}warmup")
+    return blobs.name
+
+
+def warm_crm():
+    url = os.getenv('CRM_WEBHOOK_URL')
+    if not url:
+        return "not configured"
+    from webhook_utils import warm_connection
+    warm_connection(url, timeout=WARMUP_STAGE_TIMEOUT)
+    return "connected"
+
+
+def warm_image_pipeline():
+    """Loads the Pillow codecs and NumPy paths used by preprocessing on a tiny synthetic image."""
+    from PIL import Image
+    from vision_logic import preprocess_image
+
+    for fmt, mime_type in (("JPEG", "image/jpeg"), ("PNG", "image/png")):
+        buffer = io.BytesIO()
+        # Wider than the resize limit, so the thumbnail + JPEG re-encode path runs too
+        Image.new("RGB", (1100, 16), (128, 96, 80)).save(buffer, format=fmt)
+        preprocess_image(buffer.getvalue(), mime_type)
+    return "ok"
+
+
+class Warmup:
+    """
+    Runs the warm-up stages in parallel and reports how long each took. Stages fail
+    independently; one unreachable dependency only marks the report degraded.
+    """
+    def __init__(self, stages, min_interval=WARMUP_MIN_INTERVAL, stage_timeout=WARMUP_STAGE_TIMEOUT):
+        self.stages = stages
+        self.min_interval = min_interval
+        self.stage_timeout = stage_timeout
+        self.boot_seconds = None
+        self._report = None
+        self._finished = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, force=False):
+        with self._lock:
+            if not force and self._report and time.monotonic() - self._finished < self.min_interval:
+                return {**self._report, "cached": True}
+
+            start = time.perf_counter()
+            results = {}
+            pool = ThreadPoolExecutor(max_workers=len(self.stages), thread_name_prefix="warmup")
+            futures = {name: pool.submit(self._timed, stage) for name, stage in self.stages.items()}
+            for name, future in futures.items():
+                remaining = max(0.0, self.stage_timeout - (time.perf_counter() - start))
+                try:
+                    results[name] = future.result(timeout=remaining)
+                except Exception:
+                    results[name] = {"ok": False, "seconds": round(time.perf_counter() - start, 3), "error": "timed out"}
+            # Don't wait for stages that timed out; they finish (or fail) on their own
+            pool.shutdown(wait=False)
+
+            self._report = {
+                "status": "ok" if all(result["ok"] for result in results.values()) else "degraded",
+                "instance": INSTANCE_ID,
+                "instance_age_seconds": round(time.time() - INSTANCE_STARTED, 1),
+                "boot_seconds": self.boot_seconds,
+                "total_seconds": round(time.perf_counter() - start, 3),
+                "stages": results,
+            }
+            self._finished = time.monotonic()
+            failed = [name for name, result in results.items() if not result["ok"]]
+            print(f"[WARMUP] {self._report['status']} in {self._report['total_seconds']}s"
+                  + (f" (failed: {', '.join(failed)})" if failed else ""))
+            return {**self._report, "cached": False}
+
+    @staticmethod
+    def _timed(stage):
+        start = time.perf_counter()
+        try:
+            detail = stage()
+            return {"ok": True, "seconds": round(time.perf_counter() - start, 3), "detail": detail}
+        except Exception as e:
+            return {"ok": False, "seconds": round(time.perf_counter() - start, 3), "error": str(e)[:200]}
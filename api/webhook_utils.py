@@ -1,6 +1,16 @@
 import requests
 import json
 import logging
+import os
+import threading
+import time
+import atexit
+
+from capture_utils import record_upstream
+
+# Pooled connections: consecutive webhooks (and a prior warm-up) reuse the TLS session
+_session = requests.Session()
+
 
 class WebhookResponse:
     """Mock response object for failed requests"""
@@ -23,7 +33,7 @@ def send_webhook(url, payload):
             'User-Agent': 'ModelScanner/1.0'
         }
         print(f"[WEBHOOK] Sending POST to {url}")
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        response = _session.post(url, json=payload, headers=headers, timeout=10)
         print(f"[WEBHOOK] Response: {response.status_code} — {response.text[:300]}")
         return response
     except requests.exceptions.Timeout:
@@ -47,3 +57,109 @@ def send_webhook(url, payload):
         print(f"[WEBHOOK] UNEXPECTED ERROR: {msg}")
         return WebhookResponse(0, msg)
 
+
+
+def warm_connection(url, timeout=5):
+    """Opens a pooled connection to the webhook's host with a HEAD on its origin (nothing is posted)."""
+    from urllib.parse import urlsplit
+    parts = urlsplit(url)
+    _session.head(f"{parts.scheme}://{parts.netloc}/", timeout=timeout, allow_redirects=False)
+
+
+def crm_payload(lead_record):
+    """CRM webhook body for a lead; the background task and manual retries send the same shape."""
+    address = f"{lead_record.get('city', '')}, {lead_record.get('zip_code', '')}"
+    return {
+        'campaign': lead_record.get('campaign', ''),
+        'email': lead_record.get('email'),
+        'telephone': lead_record.get('phone'),
+        'address': address,
+        'firstname': lead_record.get('first_name'),
+        'lastname': lead_record.get('last_name'),
+        'image': lead_record.get('image_url', ''),
+        'analyticsid': '',
+        'age': str(lead_record.get('age', '')),
+        'gender': 'M' if lead_record.get('gender') == 'Male' else 'F',
+        'opt_in': 'true' if lead_record.get('wants_assessment') else 'false'
+    }
+
+
+# Only the start of the CRM response is kept; full bodies bloat the log for no benefit
+RESPONSE_EXCERPT_CHARS = int(os.getenv('WEBHOOK_RESPONSE_EXCERPT_CHARS', '500'))
+DELIVERY_LOG_BATCH_MAX = int(os.getenv('DELIVERY_LOG_BATCH_MAX', '100'))
+DELIVERY_LOG_FLUSH_INTERVAL = float(os.getenv('DELIVERY_LOG_FLUSH_MS', '500')) / 1000.0
+
+
+class DeliveryLog:
+    """
+    Buffers delivery attempts and appends them to the lead store's delivery log in
+    batches, from a flusher thread every DELIVERY_LOG_FLUSH_MS or once
+    DELIVERY_LOG_BATCH_MAX attempts are waiting. Call flush() when the attempt must be
+    visible right away (manual retries) or the process may be frozen (serverless).
+    """
+    def __init__(self, batch_max=DELIVERY_LOG_BATCH_MAX, flush_interval=DELIVERY_LOG_FLUSH_INTERVAL):
+        self.batch_max = batch_max
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, lead_id, channel, attempt, status, status_code, latency, response_text):
+        entry = {
+            'lead_id': lead_id,
+            'channel': channel,
+            'attempt': attempt,
+            'status': status,
+            'status_code': status_code or None,
+            'latency_ms': int(latency * 1000),
+            'response_excerpt': (response_text or '')[:RESPONSE_EXCERPT_CHARS],
+        }
+        with self._lock:
+            self._pending.append(entry)
+            full = len(self._pending) >= self.batch_max
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="delivery-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        # One flush at a time, so batches reach the store in order
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            from storage import get_lead_store
+            try:
+                get_lead_store().record_deliveries(batch)
+            except Exception as e:
+                print(f"[WEBHOOK] Failed to write {len(batch)} delivery attempts: {e}")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+delivery_log = DeliveryLog()
+
+
+def deliver_crm_webhook(lead_record, url, attempt=1):
+    """Sends the CRM webhook for a lead and logs the attempt. Returns (status, response_text)."""
+    start = time.perf_counter()
+    response = send_webhook(url, crm_payload(lead_record))
+    latency = time.perf_counter() - start
+
+    status = 'success' if response is not None and 0 < response.status_code < 300 else 'failed'
+    record_upstream("crm", latency, status == 'success')
+    response_text = response.text if response is not None else "Connection failed"
+    delivery_log.record(
+        lead_record['id'], 'crm', attempt, status,
+        response.status_code if response is not None else None, latency, response_text,
+    )
+    return status, response_text
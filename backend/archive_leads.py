@@ -0,0 +1,36 @@
+"""
+Move old leads out of the hot table into compressed NDJSON segments in the
+private archive store (see api/archive_utils.py). Dedup checks, image GC and
+GET /api/leads/export keep seeing archived leads.
+
+    python archive_leads.py --dry-run
+    python archive_leads.py --days 180 --batch 1000
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import archive_utils
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=archive_utils.ARCHIVE_AFTER_DAYS, help="Archive leads older than this")
+    parser.add_argument("--batch", type=int, default=archive_utils.ARCHIVE_BATCH, help="Leads per segment")
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="Report the first batch without moving anything")
+    args = parser.parse_args()
+
+    result = archive_utils.archive_leads(args.days, args.batch, args.max_batches, args.dry_run)
+    for key in result["segments"]:
+        print(f"segment: {key}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Microbenchmark: parsing, validating and re-encoding a Gemini analysis response.
+
+Compares the old path (json.loads + hand-patched fields + FastAPI's jsonable_encoder/json.dumps)
+with the compiled AnalysisModel path (model_validate_json + pydantic-core to_json).
+
+    python bench_parsing.py [--iterations 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+
+from fastapi.encoders import jsonable_encoder
+from analysis_model import parse_analysis_json, analysis_to_json, normalize_analysis
+
+SAMPLE = json.dumps({
+    "face_geometry": {"primary_shape": "Oval", "jawline_definition": "", "structural_note": "High cheekbones with balanced symmetry."},
+    "market_categorization": {"primary": "Commercial", "rationale": "Approachable, versatile look suited to lifestyle campaigns."},
+    "aesthetic_audit": {"lighting_quality": "Natural", "professional_readiness": "Selfie", "technical_flaw": "Slight wide-angle distortion."},
+    "suitability_score": "78",
+    "scout_feedback": "",
+})
+
+
+def old_path(text):
+    result = json.loads(text)
+    try:
+        result['suitability_score'] = max(int(result['suitability_score']), 70)
+    except:
+        result['suitability_score'] = 70
+    if 'face_geometry' in result and not result['face_geometry'].get('jawline_definition'):
+        result['face_geometry']['jawline_definition'] = 'Defined'
+    if not result.get('scout_feedback'):
+        result['scout_feedback'] = 'Strong commercial potential with natural appeal.'
+    result['provider'] = 'gemini'
+    # /api/analyze clamps again, then FastAPI encodes the dict
+    result['suitability_score'] = max(int(result.get('suitability_score', 0)), 70)
+    return json.dumps(jsonable_encoder(result)).encode()
+
+
+def new_path(text):
+    result = normalize_analysis(parse_analysis_json(text))
+    result['provider'] = 'gemini'
+    return analysis_to_json(result)
+
+
+def new_path_model_only(text):
+    # Lower bound: no dict round trip between parsing and encoding
+    return analysis_to_json(parse_analysis_json(text))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    assert json.loads(old_path(SAMPLE)) == json.loads(new_path(SAMPLE))
+
+    for name, fn in (("old", old_path), ("model", new_path), ("model_only", new_path_model_only)):
+        seconds = min(timeit.repeat(lambda: fn(SAMPLE), number=args.iterations, repeat=3))
+        print(f"{name:>12}: {seconds / args.iterations * 1e6:8.2f} us/op")
+
+
+if __name__ == "__main__":
+    main()
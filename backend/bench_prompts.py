@@ -0,0 +1,112 @@
+"""
+Compare prompt variants for the vision call: input tokens, output tokens,
+time to first token, total latency and estimated cost per 1k scans.
+
+    python bench_prompts.py photo1.jpg photo2.png --runs 3
+    python bench_prompts.py photo.jpg --count-only      # token counts only, no generation
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+
+import google.generativeai as genai
+import vision_logic
+from usage_metrics import usage_from_response, estimate_cost
+
+COMPACT_PROMPT = (
+    "You are a model scout. Assess the person's modeling potential from the photo and fill "
+    "every field of the JSON schema. Score 75-85 for most people. Focus on natural features, "
+    "not photo quality."
+)
+
+# name -> (system_instruction, user text sent with the image)
+VARIANTS = {
+    "inline": (None, vision_logic.PROMPT),
+    "system": (vision_logic.PROMPT, vision_logic.USER_PROMPT),
+    "compact": (COMPACT_PROMPT, vision_logic.USER_PROMPT),
+}
+
+
+def build_model(model_name, system_instruction):
+    return genai.GenerativeModel(
+        model_name,
+        generation_config=vision_logic.generation_config,
+        safety_settings=vision_logic.safety_settings,
+        system_instruction=system_instruction,
+    )
+
+
+def run_variant(model_name, name, images, runs, count_only):
+    system_instruction, user_text = VARIANTS[name]
+    model = build_model(model_name, system_instruction)
+    counted, prompt_tokens, output_tokens, ttfts, latencies, costs = [], [], [], [], [], []
+
+    for image_bytes, mime_type in images:
+        contents = [{"mime_type": mime_type, "data": image_bytes}, user_text]
+        counted.append(model.count_tokens(contents).total_tokens)
+        if count_only:
+            continue
+
+        for _ in range(runs):
+            start = time.perf_counter()
+            ttft = None
+            last = None
+            for chunk in model.generate_content(contents, stream=True):
+                last = chunk
+                if ttft is None and chunk.parts:
+                    ttft = time.perf_counter() - start
+            latencies.append(time.perf_counter() - start)
+            if ttft is not None:
+                ttfts.append(ttft)
+            usage = usage_from_response(last)
+            if usage:
+                prompt_tokens.append(usage["prompt_tokens"])
+                output_tokens.append(usage["output_tokens"])
+                costs.append(estimate_cost(model_name, usage))
+
+    def avg(values, digits=1):
+        return round(statistics.mean(values), digits) if values else "-"
+
+    return {
+        "variant": name,
+        "counted_input": avg(counted),
+        "billed_input": avg(prompt_tokens),
+        "output": avg(output_tokens),
+        "ttft_s": avg(ttfts, 2),
+        "p50_latency_s": round(statistics.median(latencies), 2) if latencies else "-",
+        "usd_per_1k": round(statistics.mean(costs) * 1000, 3) if costs else "-",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="Image files to analyze")
+    parser.add_argument("--model", default=vision_logic.GEMINI_MODEL)
+    parser.add_argument("--runs", type=int, default=1, help="Generations per image per variant")
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="Comma-separated subset of: " + ", ".join(VARIANTS))
+    parser.add_argument("--count-only", action="store_true", help="Only count input tokens")
+    args = parser.parse_args()
+
+    images = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            data = f.read()
+        mime_type = "image/png" if path.lower().endswith(".png") else "image/jpeg"
+        # Same preprocessing as production, so image token counts match
+        image_bytes, mime_type, _ = vision_logic.preprocess_image(data, mime_type)
+        images.append((image_bytes, mime_type))
+
+    rows = [run_variant(args.model, name.strip(), images, args.runs, args.count_only) for name in args.variants.split(",")]
+
+    columns = list(rows[0].keys())
+    print("  ".join(f"{column:>14}" for column in columns))
+    for row in rows:
+        print("  ".join(f"{str(row[column]):>14}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Delete content-addressed lead images that no lead links to any more.
+
+Uses the same LEAD_STORE / BLOB_STORE configuration as the API. Objects newer
+than IMAGE_GC_GRACE_HOURS are kept, so uploads whose lead is still being saved
+are never collected.
+
+    python gc_images.py --dry-run
+    python gc_images.py --grace-hours 48
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grace-hours", type=float, default=storage.IMAGE_GC_GRACE / 3600)
+    parser.add_argument("--dry-run", action="store_true", help="Report orphans without deleting them")
+    args = parser.parse_args()
+
+    result = storage.collect_orphan_images(grace=args.grace_hours * 3600, dry_run=args.dry_run)
+    for key in result["deleted"]:
+        print(f"{'orphan' if args.dry_run else 'deleted'}: {key}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# gunicorn -c gunicorn.conf.py main:app
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# Same default as main.worker_count(); not imported so the master doesn't load the app before forking
+workers = int(os.getenv('WEB_CONCURRENCY') or max(2, os.cpu_count() or 1))
+
+# Gemini calls can take up to VISION_PROVIDER_TIMEOUT per provider, plus failover
+timeout = 90
+graceful_timeout = 30
+keepalive = 30
+
+# Recycle workers now and then to cap memory growth from image decoding
+max_requests = 2000
+max_requests_jitter = 200
+
+forwarded_allow_ips = "*"
@@ -1,64 +1,65 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import uvicorn
-import shutil
+"""
+Standalone server for self-hosted deployments.
+
+Serves the same FastAPI app as the Vercel function in api/index.py, so both
+deployments share one hot path. Storage is picked by LEAD_STORE / BLOB_STORE
+(see api/storage.py); with no Supabase configured it runs on SQLite and the
+local filesystem.
+
+    python main.py                               # uvicorn, WEB_CONCURRENCY workers
+    gunicorn -c gunicorn.conf.py main:app        # gunicorn + uvicorn workers
+"""
 import os
-from vision_engine import analyze_image
-import database
-
-app = FastAPI()
-
-# CORS for frontend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], # Allow all for dev, restrict in prod
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Initialize DB
-database.init_db()
-
-class Lead(BaseModel):
-    first_name: str
-    last_name: str
-    age: int
-    gender: str
-    email: str
-    phone: str
-    city: str
-    zip_code: str
-    wants_assessment: bool
-    analysis_data: dict
+import sys
+
+import uvicorn
+from fastapi.staticfiles import StaticFiles
+
+# Make the shared api/ modules importable the same way Vercel does
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+
+
+def image_worker_count():
+    """
+    Image preprocessing runs in a process pool per server worker; splitting the cores
+    between server workers keeps the total near one image process per core.
+    """
+    return max(1, (os.cpu_count() or 1) // int(os.getenv('WEB_CONCURRENCY') or max(2, os.cpu_count() or 1)))
+
+
+# Read when image_workers is imported, so it must be set before the app is
+if not os.getenv('IMAGE_WORKERS'):
+    os.environ['IMAGE_WORKERS'] = str(image_worker_count())
+
+from index import app
+from storage import get_blob_store, LocalBlobStore
+
+# Local blob storage is served directly; Supabase objects are served by Supabase
+blob_store = get_blob_store()
+if isinstance(blob_store, LocalBlobStore):
+    app.mount(blob_store.mount_path, StaticFiles(directory=blob_store.root), name="uploads")
+
 
 @app.get("/")
 def read_root():
     return {"message": "Model Suitability Scanner API is running"}
 
-@app.post("/analyze")
-async def analyze_endpoint(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    try:
-        content = await file.read()
-        # Call Vision Engine
-        result = analyze_image(content, mime_type=file.content_type)
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/lead")
-def submit_lead(lead: Lead):
-    try:
-        lead_id = database.save_lead(lead)
-        # Mock Email Sending
-        print(f"Sending email to {lead.email} with report...")
-        return {"status": "success", "lead_id": lead_id, "message": "Lead saved and report sent (mocked)."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+def worker_count():
+    """
+    The app is async and runs Gemini/storage calls in the threadpool, so one
+    worker per core is enough; WEB_CONCURRENCY overrides it.
+    """
+    return int(os.getenv('WEB_CONCURRENCY') or max(2, os.cpu_count() or 1))
+
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "main:app",
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=int(os.getenv('PORT', '8000')),
+        workers=worker_count(),
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        timeout_keep_alive=30,
+    )
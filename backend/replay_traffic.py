@@ -0,0 +1,516 @@
+"""
+Replay captured production traffic (TRAFFIC_CAPTURE=1, see api/capture_utils.py) against a
+local build and compare latencies between builds.
+
+    python replay_traffic.py serve --port 8100                  # this checkout, stubbed upstreams
+    python replay_traffic.py run capture.ndjson --target http://127.0.0.1:8100 \\
+        --speed 4 --label candidate --out candidate.json
+    python replay_traffic.py compare baseline.json candidate.json --max-regression 10
+
+`serve` runs the app on SQLite and local files with Gemini, Supabase latency, the CRM
+webhook, Meta CAPI and SMTP stubbed. Each replayed request carries its recorded upstream
+latencies in an X-Replay-Upstream header and the stubs sleep for those, so the two builds
+see the same dependency behavior. `run` keeps the recorded inter-arrival times divided by
+--speed; contact hashes, image digests and idempotency keys map to the same synthetic
+values, so duplicate resubmits and retries still collide the way they did in production.
+Each recorded client hash becomes a stable synthetic X-Forwarded-For address, so the
+per-IP admission buckets throttle the replay the way they throttled the capture
+(`serve --no-rate-limits` turns the buckets off instead).
+
+`compare` only takes latencies from requests that got the status they got when captured,
+and reports throttled (429) and diverging requests separately, so a build that answers
+fast because it is rejecting requests can't look like a speed-up.
+"""
+import argparse
+import asyncio
+import contextvars
+import ipaddress
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+
+# Built per client-side flow rather than replayed on their own
+SKIPPED_ROUTES = ("/api/upload-url", "/api/uploads/{key:path}", "unmatched")
+ADMIN_ROUTES = ("/api/leads", "/api/leads/export", "/api/leads/search", "/api/leads/{lead_id}/deliveries", "/api/metrics")
+# Per-IP and per-campaign admission knobs that --no-rate-limits lifts
+RATE_LIMIT_SETTINGS = (
+    "ANALYZE_RATE_PER_MIN_IP", "ANALYZE_BURST_IP", "ANALYZE_RATE_PER_MIN_CAMPAIGN", "ANALYZE_BURST_CAMPAIGN",
+    "UPLOAD_URL_RATE_PER_MIN_IP", "UPLOAD_URL_BURST_IP",
+)
+UNLIMITED = "1000000000"
+DEFAULT_DIMENSIONS = (900, 1200)
+
+_plan = contextvars.ContextVar('replay_plan', default=None)
+
+
+# --- serve: the app with stubbed upstreams ---
+
+def stub_delay(prefix):
+    """Sleeps for the next recorded call whose name starts with `prefix` (none recorded: no delay)."""
+    plan = _plan.get()
+    if not plan:
+        return
+    for i, (name, ms) in enumerate(plan):
+        if name.startswith(prefix):
+            del plan[i]
+            time.sleep(ms / 1000.0)
+            return
+
+
+class ReplayPlanMiddleware:
+    """Puts the request's recorded upstream latencies where the stubs can find them."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for key, value in scope.get("headers", []):
+                if key == b"x-replay-upstream":
+                    _plan.set([tuple(item) for item in json.loads(value)])
+        await self.app(scope, receive, send)
+
+
+def install_stubs(delay_stores):
+    import email_utils
+    import meta_utils
+    import webhook_utils
+    from local_vision import LocalHeuristicProvider
+    from storage import get_lead_store, get_blob_store, LEAD_STORE_TIMED_METHODS, BLOB_STORE_TIMED_METHODS
+    from vision_logic import router
+    from vision_providers import limiter_from_env
+
+    class ReplayVisionProvider(LocalHeuristicProvider):
+        """Stands in for Gemini: the local heuristic answer after the recorded model latency."""
+        name = "gemini"
+
+        def __init__(self):
+            super().__init__()
+            self.quality = 2
+            self.latency_budget = float(os.getenv('GEMINI_LATENCY_BUDGET', '15'))
+            self.limiter = limiter_from_env(self.latency_budget)
+
+        def analyze(self, image_bytes, mime_type):
+            stub_delay("vision.")
+            return super().analyze(image_bytes, mime_type)
+
+    router.providers.clear()
+    router.health.clear()
+    router.register(ReplayVisionProvider())
+    router.register(LocalHeuristicProvider())
+
+    class StubResponse:
+        status_code = 200
+        text = '{"status": "ok"}'
+
+    def post(url, **kwargs):
+        stub_delay("crm")
+        return StubResponse()
+    webhook_utils._session.post = post
+
+    def send_conversion_event(lead_data, client_ip, user_agent):
+        stub_delay("meta")
+    meta_utils.send_conversion_event = send_conversion_event
+
+    class StubSMTP:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def starttls(self):
+            pass
+
+        def login(self, *args):
+            pass
+
+        def send_message(self, message):
+            stub_delay("smtp")
+    email_utils.smtplib.SMTP = StubSMTP
+
+    if delay_stores:
+        # SQLite and local files answer in microseconds; add what Supabase took in production
+        def delayed(store, label, methods):
+            for method in methods:
+                original = getattr(store, method, None)
+                if original is None:
+                    continue
+
+                def wrapper(*args, _original=original, _name=f"{label}.{method}", **kwargs):
+                    stub_delay(_name)
+                    return _original(*args, **kwargs)
+                setattr(store, method, wrapper)
+        delayed(get_lead_store(), "lead_store", LEAD_STORE_TIMED_METHODS)
+        delayed(get_blob_store(), "blob_store", BLOB_STORE_TIMED_METHODS)
+
+
+def serve(args):
+    import uvicorn
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="replay-")
+    os.makedirs(workdir, exist_ok=True)
+    os.environ.update({
+        "LEAD_STORE": "sqlite",
+        "BLOB_STORE": "local",
+        "LEADS_DB_PATH": os.path.join(workdir, "leads.db"),
+        "LOCAL_BLOB_DIR": os.path.join(workdir, "uploads"),
+        "LOCAL_ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "VISION_PROVIDERS": "local",
+        "CRM_WEBHOOK_URL": "http://crm.replay.invalid/webhook",
+        "PUBLIC_BASE_URL": f"http://{args.host}:{args.port}",
+        "ADMIN_API_TOKEN": args.admin_token,
+        "TRAFFIC_CAPTURE": "0",
+        "WARMUP_ON_STARTUP": "0",
+    })
+    if args.no_rate_limits:
+        os.environ.update({name: UNLIMITED for name in RATE_LIMIT_SETTINGS})
+    from index import app
+    install_stubs(delay_stores=not args.no_store_delay)
+    app.add_middleware(ReplayPlanMiddleware)
+    print(f"[REPLAY] Serving on {args.host}:{args.port} (data in {workdir})")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+# --- run: re-drive a capture ---
+
+_images = {}
+
+
+def synthetic_image(info):
+    """Deterministic stand-in photo with the recorded format and dimensions, one per digest."""
+    info = info or {}
+    key = info.get("digest") or "default"
+    if key not in _images:
+        import numpy as np
+        from PIL import Image
+
+        width = info.get("width") or DEFAULT_DIMENSIONS[0]
+        height = info.get("height") or DEFAULT_DIMENSIONS[1]
+        rng = np.random.default_rng(int(key, 16) if key != "default" else 0)
+        # A lit gradient with texture: passes the quality gate like a real portrait
+        gradient = np.linspace(70, 190, height, dtype=np.float32)[:, None, None]
+        pixels = np.clip(gradient + rng.normal(0, 25, (height, width, 3)), 0, 255).astype(np.uint8)
+        mime_type = info.get("mime_type") or "image/jpeg"
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="PNG" if mime_type == "image/png" else "JPEG", quality=90)
+        _images[key] = (buffer.getvalue(), mime_type)
+    return _images[key]
+
+
+def synthetic_contact(contact):
+    email = (contact or {}).get("email") or os.urandom(8).hex()
+    phone = (contact or {}).get("phone") or os.urandom(8).hex()
+    return f"lead-{email}@replay.test", "+1555" + str(int(phone, 16) % 10_000_000).zfill(7)
+
+
+def load_trace(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda record: record["ts"])
+
+
+class Replayer:
+    def __init__(self, client, admin_token):
+        self.client = client
+        self.admin_token = admin_token
+        self.lead_ids = []
+        self.results = []
+        self.skipped = 0
+
+    @staticmethod
+    def client_address(record):
+        """Stable stand-in address per recorded client hash (10.0.0.0/8), so per-IP buckets match the capture."""
+        client = record.get("client")
+        if not client:
+            return "10.0.0.1"
+        return str(ipaddress.IPv4Address((10 << 24) | (int(client[:6], 16) or 1)))
+
+    def headers(self, record):
+        headers = {
+            "X-Replay-Upstream": json.dumps([[u["name"], u["ms"]] for u in record.get("upstream", [])]),
+            "X-Forwarded-For": self.client_address(record),
+        }
+        if record.get("idempotency_key"):
+            headers["Idempotency-Key"] = f"replay-{record['idempotency_key']}"
+        if record.get("route") in ADMIN_ROUTES or record.get("route") == "/api/retry_webhook":
+            headers["Authorization"] = f"Bearer {self.admin_token}"
+        return headers
+
+    async def timed(self, record, lag, method, url, **kwargs):
+        start = time.perf_counter()
+        ttfb = None
+        status = 0
+        try:
+            async with self.client.stream(method, url, **kwargs) as response:
+                status = response.status_code
+                chunks = []
+                async for chunk in response.aiter_bytes():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start
+                    chunks.append(chunk)
+            if record.get("route") == "/api/lead" and status == 200:
+                lead_id = json.loads(b"".join(chunks) or b"{}").get("lead_id")
+                if lead_id is not None:
+                    self.lead_ids.append(lead_id)
+        except Exception as e:
+            print(f"[REPLAY] {method} {url} failed: {e}")
+        elapsed = time.perf_counter() - start
+        self.results.append({
+            "route": record.get("route"),
+            "method": method,
+            "status": status,
+            "recorded_status": record.get("status"),
+            "ms": round(elapsed * 1000, 1),
+            "ttfb_ms": round((ttfb if ttfb is not None else elapsed) * 1000, 1),
+            "recorded_ms": record.get("duration_ms"),
+            "lag_ms": round(lag * 1000, 1),
+        })
+        return status
+
+    async def send(self, record, lag):
+        route = record.get("route")
+        headers = self.headers(record)
+        params = record.get("query") or {}
+
+        if route == "/api/analyze":
+            data, mime_type = synthetic_image(record.get("image"))
+            if record.get("campaign"):
+                headers["X-Campaign"] = f"#{record['campaign'][:6].upper()}"
+            if record.get("accept_ndjson"):
+                headers["Accept"] = "application/x-ndjson"
+            files = {"file": ("photo.png" if mime_type == "image/png" else "photo.jpg", data, mime_type)}
+            await self.timed(record, lag, "POST", route, params=params, headers=headers, files=files)
+        elif route == "/api/lead":
+            await self.send_lead(record, lag, headers)
+        elif route == "/api/leads/{lead_id}/deliveries":
+            if not self.lead_ids:
+                self.skipped += 1
+                return
+            await self.timed(record, lag, "GET", f"/api/leads/{self.lead_ids[-1]}/deliveries", headers=headers)
+        elif route == "/api/retry_webhook":
+            if not self.lead_ids:
+                self.skipped += 1
+                return
+            await self.timed(record, lag, "POST", route, headers=headers, json={"lead_id": str(self.lead_ids[-1])})
+        elif record.get("method") == "GET" and "{" not in route:
+            await self.timed(record, lag, "GET", route, params=params, headers=headers)
+        else:
+            self.skipped += 1
+
+    async def send_lead(self, record, lag, headers):
+        email, phone = synthetic_contact(record.get("contact"))
+        form = {
+            "first_name": "Replay", "last_name": "Lead", "age": "27", "gender": "Female",
+            "email": email, "phone": phone, "city": "New York", "zip_code": "10001",
+            "campaign": f"#{record['campaign'][:6].upper()}" if record.get("campaign") else "",
+            "wants_assessment": "true",
+            "analysis_data": '{"suitability_score": 80}' if record.get("has_analysis") else "{}",
+        }
+        files = None
+        if record.get("direct_upload"):
+            # The browser's flow: signed URL, PUT to storage, then the lead with only the key
+            data, mime_type = synthetic_image(record.get("image"))
+            signed = await self.client.post("/api/upload-url", json={"content_type": mime_type, "size": len(data)},
+                                            headers={"X-Forwarded-For": headers["X-Forwarded-For"]})
+            if signed.status_code != 200:
+                self.skipped += 1
+                return
+            body = signed.json()
+            await self.client.put(body["upload_url"], content=data, headers=body["headers"])
+            form["image_key"] = body["key"]
+        elif record.get("image"):
+            data, mime_type = synthetic_image(record.get("image"))
+            files = {"file": ("photo.png" if mime_type == "image/png" else "photo.jpg", data, mime_type)}
+        await self.timed(record, lag, "POST", "/api/lead", headers=headers, data=form, files=files)
+
+
+async def replay(records, target, speed, admin_token, concurrency):
+    import httpx
+
+    records = [record for record in records if record.get("route") not in SKIPPED_ROUTES]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=target, timeout=120, limits=limits) as client:
+        replayer = Replayer(client, admin_token)
+        if not records:
+            return replayer
+        first = records[0]["ts"]
+        start = time.perf_counter()
+        tasks = []
+        for record in records:
+            due = (record["ts"] - first) / speed
+            delay = due - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # How far behind schedule the request went out (a saturated client skews results)
+            lag = max(0.0, (time.perf_counter() - start) - due)
+            tasks.append(asyncio.create_task(replayer.send(record, lag)))
+        await asyncio.gather(*tasks)
+        return replayer
+
+
+def run(args):
+    records = load_trace(args.trace)
+    print(f"[REPLAY] {len(records)} recorded requests at {args.speed}x against {args.target}")
+    start = time.time()
+    replayer = asyncio.run(replay(records, args.target, args.speed, args.admin_token, args.concurrency))
+    report = {
+        "label": args.label,
+        "trace": os.path.abspath(args.trace),
+        "target": args.target,
+        "speed": args.speed,
+        "started": start,
+        "skipped": replayer.skipped,
+        "results": replayer.results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f)
+    print(f"[REPLAY] {len(replayer.results)} requests replayed, {replayer.skipped} skipped; results in {args.out}")
+    diverged = [row for row in replayer.results if not matches_capture(row)]
+    if diverged:
+        throttled = sum(1 for row in diverged if row["status"] == 429)
+        print(f"[REPLAY] {len(diverged)} requests got a different status than captured ({throttled} throttled)")
+    print_table([summarize(report["results"])], [args.label])
+
+
+# --- compare: latency report between two builds ---
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))]
+
+
+def matches_capture(row):
+    return row.get("recorded_status") is None or row["status"] == row["recorded_status"]
+
+
+def summarize(results):
+    """
+    {route: {n, errors, throttled, diverged, p50, p95, p99, mean, ttfb_p50}}. errors are 5xx
+    and failed connections, throttled are 429s, diverged are rows whose status differs from
+    the captured one. Latencies only come from rows that match the capture.
+    """
+    by_route = {}
+    for result in results:
+        by_route.setdefault(f"{result['method']} {result['route']}", []).append(result)
+        by_route.setdefault("ALL", []).append(result)
+    summary = {}
+    for route, rows in by_route.items():
+        matched = [row for row in rows if matches_capture(row)]
+        latencies = [row["ms"] for row in matched]
+        summary[route] = {
+            "n": len(rows),
+            "errors": sum(1 for row in rows if row["status"] == 0 or row["status"] >= 500),
+            "throttled": sum(1 for row in rows if row["status"] == 429),
+            "diverged": len(rows) - len(matched),
+            "p50": percentile(latencies, 50) if latencies else None,
+            "p95": percentile(latencies, 95) if latencies else None,
+            "p99": percentile(latencies, 99) if latencies else None,
+            "mean": round(statistics.mean(latencies), 1) if latencies else None,
+            "ttfb_p50": percentile([row["ttfb_ms"] for row in matched], 50) if matched else None,
+        }
+    return summary
+
+
+def print_table(summaries, labels):
+    routes = sorted({route for summary in summaries for route in summary}, key=lambda r: (r == "ALL", r))
+    stats = ("p50", "p95", "p99")
+    header = f"{'route':<44}" + "".join(f"{label[:10] + ' n':>14}" for label in labels)
+    header += "".join(f"{label[:8] + ' ' + column:>14}" for column in ("429", "diff") for label in labels)
+    header += "".join(f"{label[:8] + ' ' + stat:>16}" for stat in stats for label in labels)
+    if len(summaries) == 2:
+        header += "".join(f"{'Δ ' + stat:>10}" for stat in stats)
+    print(header)
+    for route in routes:
+        rows = [summary.get(route) for summary in summaries]
+        line = f"{route[:44]:<44}"
+        line += "".join(f"{(str(row['n']) + ('/' + str(row['errors']) + 'err' if row['errors'] else '')) if row else '-':>14}" for row in rows)
+        line += "".join(f"{row[column] if row else '-':>14}" for column in ("throttled", "diverged") for row in rows)
+        line += "".join(f"{row[stat] if row and row[stat] is not None else '-':>16}" for stat in stats for row in rows)
+        if len(summaries) == 2:
+            line += "".join(f"{_delta(rows[0], rows[1], stat):>10}" for stat in stats)
+        print(line)
+
+
+def _delta(base, candidate, stat):
+    if not base or not candidate or not base[stat] or candidate[stat] is None:
+        return "-"
+    return f"{(candidate[stat] - base[stat]) / base[stat] * 100:+.1f}%"
+
+
+def compare(args):
+    reports = []
+    for path in (args.baseline, args.candidate):
+        with open(path) as f:
+            reports.append(json.load(f))
+    summaries = [summarize(report["results"]) for report in reports]
+    labels = [report.get("label") or os.path.basename(path) for report, path in zip(reports, (args.baseline, args.candidate))]
+    if reports[0].get("trace") != reports[1].get("trace") or reports[0].get("speed") != reports[1].get("speed"):
+        print("WARNING: the two runs replayed different traces or speeds")
+    print_table(summaries, labels)
+
+    if args.max_regression is not None:
+        failed = False
+        regressed = [
+            route for route, base in summaries[0].items()
+            if route in summaries[1] and base["p95"] and summaries[1][route]["p95"] is not None
+            and (summaries[1][route]["p95"] - base["p95"]) / base["p95"] * 100 > args.max_regression
+        ]
+        if regressed:
+            print(f"p95 regressed more than {args.max_regression}% on: {', '.join(regressed)}")
+            failed = True
+        # Fewer requests answered as captured means the latencies above compare less work
+        diverged = [
+            route for route, base in summaries[0].items()
+            if route in summaries[1] and summaries[1][route]["diverged"] > base["diverged"]
+        ]
+        if diverged:
+            print(f"More requests diverged from the captured status (throttled or failed) on: {', '.join(diverged)}")
+            failed = True
+        if failed:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run this checkout with stubbed upstreams")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8100)
+    serve_parser.add_argument("--workdir", help="SQLite and upload directory (default: a new temp dir)")
+    serve_parser.add_argument("--admin-token", default="replay")
+    serve_parser.add_argument("--no-store-delay", action="store_true",
+                              help="don't add the recorded Supabase latency to SQLite/local store calls")
+    serve_parser.add_argument("--no-rate-limits", action="store_true",
+                              help="lift the per-IP and per-campaign admission buckets")
+
+    run_parser = commands.add_parser("run", help="replay a capture against a running server")
+    run_parser.add_argument("trace")
+    run_parser.add_argument("--target", default="http://127.0.0.1:8100")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="divide recorded inter-arrival times by this")
+    run_parser.add_argument("--admin-token", default="replay")
+    run_parser.add_argument("--concurrency", type=int, default=200, help="max open connections")
+    run_parser.add_argument("--label", default="run")
+    run_parser.add_argument("--out", default="replay-results.json")
+
+    compare_parser = commands.add_parser("compare", help="latency report between two runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--max-regression", type=float,
+                                help="exit 1 if any route's p95 got worse by more than this percent")
+
+    args = parser.parse_args()
+    {"serve": serve, "run": run, "compare": compare}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+import sqlite_store
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_store, "DB_NAME", str(tmp_path / "leads.db"))
+    sqlite_store.init_db()
+    yield sqlite_store
+    sqlite_store.close_db()
+    sqlite_store._readers.__dict__.clear()
+
+
+def _lead(name):
+    record = {"first_name": name, "email": f"{name}@example.com", "search_text": name}
+    return sqlite_store.INSERT_LEAD_SQL, tuple(record.get(column) for column in sqlite_store.INSERT_COLUMNS)
+
+
+def test_batch_commits_once(db):
+    writer = db._writer_or_init()
+    statements = []
+    writer._conn.set_trace_callback(statements.append)
+    batch = [(_lead(f"lead{i}"), None) for i in range(50)]
+
+    outcomes = writer._write(batch)
+
+    writer._conn.set_trace_callback(None)
+    assert all(ok for ok, _ in outcomes)
+    assert sum(statement.startswith("BEGIN") for statement in statements) == 1
+    assert statements.count("COMMIT") == 1
+    assert db.count_leads() == 50
+
+
+def test_bad_write_fails_alone(db):
+    writer = db._writer_or_init()
+    good = writer.submit(*_lead("good"))
+    # status is NOT NULL
+    bad = writer.submit(sqlite_store.INSERT_DELIVERY_SQL, (1, "crm", 1, None, 200, 5, "x"))
+
+    assert good.result(timeout=5) == 1
+    with pytest.raises(sqlite_store.sqlite3.IntegrityError):
+        bad.result(timeout=5)
+    assert db.count_leads() == 1
+
+
+def test_failed_migration_leaves_no_partial_schema(db, monkeypatch):
+    version = len(sqlite_store.MIGRATIONS) + 1
+    monkeypatch.setattr(sqlite_store, "MIGRATIONS", sqlite_store.MIGRATIONS + [[
+        "ALTER TABLE leads ADD COLUMN extra TEXT",
+        "CREATE TABLE broken (",
+    ]])
+    conn = sqlite_store._connect()
+    with pytest.raises(sqlite_store.sqlite3.OperationalError):
+        sqlite_store.migrate(conn)
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == version - 1
+    assert "extra" not in [row[1] for row in conn.execute("PRAGMA table_info(leads)")]
+
+    sqlite_store.MIGRATIONS[-1] = ["ALTER TABLE leads ADD COLUMN extra TEXT"]
+    sqlite_store.migrate(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == version
+    conn.close()
+
+
+def test_search_without_trigram_tokenizer(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_store, "DB_NAME", str(tmp_path / "leads.db"))
+    monkeypatch.setattr(sqlite_store, "trigram_supported", lambda conn: False)
+    sqlite_store.init_db()
+    try:
+        assert not sqlite_store._search_indexed
+        for name, phone in (("john", "555 010 0100"), ("joanne", "555 777 8888")):
+            sqlite_store.insert_lead({"first_name": name, "last_name": "smith", "phone": phone})
+        assert [lead["first_name"] for lead in sqlite_store.search_leads(["smith", "0100"])] == ["john"]
+        assert [lead["first_name"] for lead in sqlite_store.search_leads(["jonne"], fuzzy=True)] == ["joanne"]
+
+        # Once the tokenizer is available, the next start builds the index
+        monkeypatch.undo()
+        monkeypatch.setattr(sqlite_store, "DB_NAME", str(tmp_path / "leads.db"))
+        sqlite_store.init_db()
+        assert sqlite_store._search_indexed
+        assert [lead["first_name"] for lead in sqlite_store.search_leads(["smith", "0100"])] == ["john"]
+    finally:
+        sqlite_store.close_db()
+        sqlite_store._readers.__dict__.clear()
@@ -1,5 +1,8 @@
 import os
-from vision_engine import analyze_image
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+from vision_logic import analyze_image
 
 # Read real image from disk
 image_path = "d:/Gemini_Generated_Image_mer7p4mer7p4mer7.PNG"
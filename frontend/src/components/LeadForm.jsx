@@ -1,6 +1,8 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import { Lock, CheckCircle, Smartphone, Mail, User, X } from 'lucide-react';
 import axios from 'axios';
+import { idempotencyKey } from '../utils/analysisStream';
+import { uploadImageDirect } from '../utils/directUpload';
 
 const LeadForm = ({ analysisData, imageBlob, onSubmitSuccess, onCancel }) => {
     const [formData, setFormData] = useState({
@@ -16,6 +18,7 @@ const LeadForm = ({ analysisData, imageBlob, onSubmitSuccess, onCancel }) => {
     });
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState(null);
+    const uploadedImage = useRef(null);
 
     const validateForm = () => {
         // Email validation
@@ -163,14 +166,28 @@ const LeadForm = ({ analysisData, imageBlob, onSubmitSuccess, onCancel }) => {
             // Append Analysis Data as JSON string
             payload.append('analysis_data', JSON.stringify(analysisData));
 
-            // Append Image File
+            const API_URL = import.meta.env.MODE === 'production' ? '/api' : 'http://localhost:8000/api';
+
+            // Append Image: uploaded straight to storage when possible, else sent with the form
             if (imageBlob) {
-                payload.append('file', imageBlob);
+                try {
+                    // A resubmit of the same photo reuses the object uploaded the first time
+                    if (uploadedImage.current?.blob !== imageBlob) {
+                        uploadedImage.current = { blob: imageBlob, key: await uploadImageDirect(API_URL, imageBlob) };
+                    }
+                    payload.append('image_key', uploadedImage.current.key);
+                } catch (uploadError) {
+                    console.warn("Direct upload unavailable, sending the image with the form:", uploadError);
+                    payload.append('file', imageBlob);
+                }
             }
-
-            const API_URL = import.meta.env.MODE === 'production' ? '/api' : 'http://localhost:8000';
+            // Same details resubmitted (e.g. after a dropped connection) reuse the key, so the
+            // server replays the saved lead instead of answering "already submitted"
             const response = await axios.post(`${API_URL}/lead`, payload, {
-                headers: { 'Content-Type': 'multipart/form-data' }
+                headers: {
+                    'Content-Type': 'multipart/form-data',
+                    'Idempotency-Key': idempotencyKey(formData, campaignCode, imageBlob?.size ?? null),
+                }
             });
 
             if (response.data.status === 'success') {
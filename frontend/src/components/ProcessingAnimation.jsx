@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 
-const ProcessingAnimation = ({ onComplete }) => {
+const ProcessingAnimation = ({ onComplete, precheck, fields = {} }) => {
     const [textIndex, setTextIndex] = useState(0);
     const messages = [
         "Analyzing Facial Geometry...",
@@ -35,6 +35,17 @@ const ProcessingAnimation = ({ onComplete }) => {
                 <div className="absolute bottom-4 right-4 w-4 h-4 border-b-2 border-r-2 border-pastel-accent"></div>
             </div>
 
+            {/* Live Readout: local technical audit, then model fields as they stream in */}
+            {(precheck || Object.keys(fields).length > 0) && (
+                <div className="absolute top-8 left-1/2 -translate-x-1/2 z-30 bg-pastel-card/80 px-4 py-2 rounded-lg backdrop-blur-md border border-white/20 shadow-lg font-mono text-xs text-pastel-text space-y-1">
+                    {precheck && (
+                        <p>{precheck.width}x{precheck.height} · Light {Math.round(precheck.brightness / 2.55)}% · Sharpness {precheck.sharpness > 100 ? 'OK' : 'Low'}</p>
+                    )}
+                    {fields.face_geometry?.primary_shape && <p>Face Shape: {fields.face_geometry.primary_shape}</p>}
+                    {fields.market_categorization?.primary && <p>Market: {fields.market_categorization.primary}</p>}
+                </div>
+            )}
+
             {/* Text Animation */}
             <div className="z-30 mt-32 md:mt-48 text-center bg-pastel-card/80 px-6 py-2 rounded-full backdrop-blur-md border border-white/20 shadow-lg">
                 <AnimatePresence mode="wait">
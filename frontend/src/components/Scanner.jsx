@@ -2,13 +2,13 @@ import React, { useState, useRef } from 'react';
 import { Upload, X, ScanFace, Check } from 'lucide-react';
 import ProcessingAnimation from './ProcessingAnimation';
 import LeadForm from './LeadForm';
-import axios from 'axios';
 import { motion } from 'framer-motion';
 import { compressImage } from '../utils/imageUtils';
+import { streamAnalysis, idempotencyKey } from '../utils/analysisStream';
 import Testimonials from './Testimonials';
 
 // Use /api for production (Vercel), localhost for development
-const API_URL = import.meta.env.MODE === 'production' ? '/api' : 'http://localhost:8000';
+const API_URL = import.meta.env.MODE === 'production' ? '/api' : 'http://localhost:8000/api';
 
 
 const Scanner = () => {
@@ -16,6 +16,8 @@ const Scanner = () => {
     const [file, setFile] = useState(null);
     const [previewUrl, setPreviewUrl] = useState(null);
     const [analysisResult, setAnalysisResult] = useState(null);
+    const [precheck, setPrecheck] = useState(null);
+    const [partialFields, setPartialFields] = useState({});
     const [showApplyForm, setShowApplyForm] = useState(false);
     const fileInputRef = useRef(null);
 
@@ -35,15 +37,26 @@ const Scanner = () => {
             const formData = new FormData();
             formData.append('file', compressedFile);
 
-            const response = await axios.post(`${API_URL}/analyze`, formData, {
-                headers: { 'Content-Type': 'multipart/form-data' },
-                timeout: 60000 // 60 seconds to accommodate Gemini API processing time
-            });
-            setAnalysisResult(response.data);
+            // Streamed: local technical audit arrives first, then model fields as they are generated
+            setPrecheck(null);
+            setPartialFields({});
+            const result = await streamAnalysis(`${API_URL}/analyze`, formData, {
+                onPrecheck: setPrecheck,
+                onField: (key, value) => setPartialFields((prev) => ({ ...prev, [key]: value })),
+                onReset: () => setPartialFields({}),
+            }, 60000, idempotencyKey(selectedFile)); // 60 seconds to accommodate Gemini API processing time
+            // Quality gate: unusable photo, ask for a retake instead of showing a score
+            if (result.retake_photo) {
+                alert(result.scout_feedback);
+                reset();
+                return;
+            }
+
+            setAnalysisResult(result);
 
-            // Check for errors in the response body even if status is 200
-            if (response.data.error) {
-                throw new Error(response.data.error);
+            // Check for errors in the result even if status is 200
+            if (result.error) {
+                throw new Error(result.error);
             }
 
             // Natural Transition: Immediately show results when ready
@@ -82,6 +95,8 @@ const Scanner = () => {
         setFile(null);
         setPreviewUrl(null);
         setAnalysisResult(null);
+        setPrecheck(null);
+        setPartialFields({});
     };
 
     return (
@@ -134,7 +149,7 @@ const Scanner = () => {
                     <>
                         <img src={previewUrl} className="absolute inset-0 w-full h-full object-cover opacity-50 filter grayscale" alt="Scanning" />
                         <div className="absolute inset-0 z-10">
-                            <ProcessingAnimation />
+                            <ProcessingAnimation precheck={precheck} fields={partialFields} />
                         </div>
                     </>
                 )}
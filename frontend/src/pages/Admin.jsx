@@ -11,6 +11,7 @@ const Admin = () => {
     const [leads, setLeads] = useState([]);
     const [loading, setLoading] = useState(true);
     const [searchTerm, setSearchTerm] = useState('');
+    const [searchResults, setSearchResults] = useState(null);
     const [resendingId, setResendingId] = useState(null);
     const [selectedIds, setSelectedIds] = useState(new Set());
     const [bulkSending, setBulkSending] = useState(false);
@@ -18,7 +19,7 @@ const Admin = () => {
     const [webhookFilter, setWebhookFilter] = useState('all');
     const navigate = useNavigate();
 
-    const API_URL = import.meta.env.MODE === 'production' ? '/api' : 'http://localhost:8000';
+    const API_URL = import.meta.env.MODE === 'production' ? '/api' : 'http://localhost:8000/api';
 
     useEffect(() => {
         const init = async () => {
@@ -32,6 +33,33 @@ const Admin = () => {
         init();
     }, []);
 
+    // Searches every lead through the indexed /leads/search endpoint, not just the loaded ones
+    useEffect(() => {
+        const query = searchTerm.trim();
+        if (query.length < 3) {
+            setSearchResults(null);
+            return;
+        }
+        let cancelled = false;
+        const timer = setTimeout(async () => {
+            try {
+                const { data: { session } } = await supabase.auth.getSession();
+                const response = await axios.get(`${API_URL}/leads/search`, {
+                    params: { q: query, limit: 100 },
+                    headers: { Authorization: `Bearer ${session?.access_token}` },
+                });
+                if (!cancelled) setSearchResults(response.data.leads);
+            } catch (error) {
+                console.error('Search failed:', error.message);
+                if (!cancelled) setSearchResults(null);
+            }
+        }, 250);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [searchTerm]);
+
     const checkAuth = async () => {
         const { data: { session } } = await supabase.auth.getSession();
         if (!session) {
@@ -42,13 +70,19 @@ const Admin = () => {
     const fetchLeads = async () => {
         setLoading(true);
         try {
+            // Latest CRM delivery comes from the delivery log's materialized status table
             const { data, error } = await supabase
                 .from('leads')
-                .select('*')
+                .select('*, lead_delivery_status(channel, status, attempts, response_excerpt)')
                 .order('created_at', { ascending: false });
 
             if (error) throw error;
-            setLeads(data || []);
+            setLeads((data || []).map(({ lead_delivery_status: statuses, ...lead }) => {
+                const crm = (statuses || []).find((status) => status.channel === 'crm');
+                return crm
+                    ? { ...lead, webhook_status: crm.status, webhook_response: crm.response_excerpt, webhook_attempts: crm.attempts }
+                    : lead;
+            }));
         } catch (error) {
             console.error('Error fetching leads:', error.message);
         } finally {
@@ -91,6 +125,26 @@ const Admin = () => {
         }
     };
 
+    // Server-side export includes archived leads, which the table above no longer loads
+    const handleExport = async () => {
+        try {
+            const { data: { session } } = await supabase.auth.getSession();
+            const response = await axios.get(`${API_URL}/leads/export`, {
+                headers: { Authorization: `Bearer ${session?.access_token}` },
+                responseType: 'blob',
+            });
+            const url = URL.createObjectURL(response.data);
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = `leads-${new Date().toISOString().slice(0, 10)}.csv`;
+            link.click();
+            URL.revokeObjectURL(url);
+        } catch (error) {
+            console.error('Export failed:', error);
+            alert('Export failed. Please try again.');
+        }
+    };
+
     const handleBulkResend = async () => {
         const ids = Array.from(selectedIds);
         if (ids.length === 0) return;
@@ -123,8 +177,8 @@ const Admin = () => {
         }
     };
 
-    const filteredLeads = leads.filter(lead => {
-        const matchesSearch =
+    const filteredLeads = (searchResults || leads).filter(lead => {
+        const matchesSearch = searchResults !== null ||
             lead.first_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
             lead.last_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
             lead.email.toLowerCase().includes(searchTerm.toLowerCase());
@@ -166,7 +220,7 @@ const Admin = () => {
                         <Search className="absolute left-3 top-3 text-gray-500" size={18} />
                         <input
                             type="text"
-                            placeholder="Search by name, email..."
+                            placeholder="Search by name, email, phone..."
                             className="w-full bg-white border border-gray-200 rounded-lg py-2.5 pl-10 pr-4 focus:outline-none focus:border-pastel-accent"
                             value={searchTerm}
                             onChange={e => setSearchTerm(e.target.value)}
@@ -198,7 +252,7 @@ const Admin = () => {
                             }
                         </button>
                     )}
-                    <button className="flex items-center gap-2 px-4 py-2 rounded-lg bg-pastel-accent text-white font-semibold hover:bg-red-300 transition-colors">
+                    <button onClick={handleExport} className="flex items-center gap-2 px-4 py-2 rounded-lg bg-pastel-accent text-white font-semibold hover:bg-red-300 transition-colors">
                         <Download size={18} /> Export CSV
                     </button>
                 </div>
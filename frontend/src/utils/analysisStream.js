@@ -0,0 +1,90 @@
+/**
+ * Posts an image to /analyze in streaming mode and reads the NDJSON event stream.
+ * @param {string} url - The analyze endpoint URL.
+ * @param {FormData} formData - Form data containing the `file` field.
+ * @param {Object} handlers - Optional callbacks: onPrecheck(audit), onField(key, value), onReset().
+ * @param {number} timeout - Overall timeout in milliseconds. Default 60000.
+ * @param {string} idempotencyKey - Optional key; resubmitting with the same key replays the first result.
+ * @returns {Promise<Object>} - A promise that resolves to the final analysis result.
+ */
+export const streamAnalysis = async (url, formData, handlers = {}, timeout = 60000, idempotencyKey = null) => {
+    const controller = new AbortController();
+    const timer = setTimeout(() => controller.abort(), timeout);
+
+    try {
+        const response = await fetch(`${url}?stream=1`, {
+            method: 'POST',
+            body: formData,
+            headers: {
+                Accept: 'application/x-ndjson',
+                ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}),
+            },
+            signal: controller.signal,
+        });
+
+        if (!response.ok || !response.body) {
+            throw new Error(`Analysis request failed with status ${response.status}`);
+        }
+
+        // Servers without streaming support (e.g. the local dev backend) answer with plain JSON
+        if (!(response.headers.get('content-type') || '').includes('application/x-ndjson')) {
+            return await response.json();
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (!line) continue;
+
+                const event = JSON.parse(line);
+                if (event.type === 'precheck') {
+                    handlers.onPrecheck?.(event.technical_audit);
+                } else if (event.type === 'field') {
+                    handlers.onField?.(event.key, event.value);
+                } else if (event.type === 'reset') {
+                    handlers.onReset?.();
+                } else if (event.type === 'error') {
+                    throw new Error(event.error);
+                } else if (event.type === 'result') {
+                    return event.result;
+                }
+            }
+        }
+
+        throw new Error('Analysis stream ended without a result');
+    } finally {
+        clearTimeout(timer);
+    }
+};
+
+/**
+ * Idempotency key for a submission: the same parts always give the same key, so a
+ * resubmit after a dropped connection replays the original response instead of redoing it.
+ * @param {...*} parts - Values identifying the submission (a File contributes name, size and mtime).
+ * @returns {string}
+ */
+export const idempotencyKey = (...parts) => {
+    const text = JSON.stringify(parts.map((part) => (
+        part instanceof File ? [part.name, part.size, part.lastModified] : part
+    )));
+    // FNV-1a, twice with different seeds for a 64-bit key
+    const hash = (seed) => {
+        let h = seed;
+        for (let i = 0; i < text.length; i++) {
+            h ^= text.charCodeAt(i);
+            h = Math.imul(h, 16777619);
+        }
+        return (h >>> 0).toString(16).padStart(8, '0');
+    };
+    return `${hash(0x811c9dc5)}${hash(0x5bd1e995)}`;
+};
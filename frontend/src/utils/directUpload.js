@@ -0,0 +1,25 @@
+/**
+ * Uploads an image straight to storage through a signed URL from /api/upload-url,
+ * so the photo does not pass through the API function.
+ * @param {string} apiUrl - Base API URL (e.g. '/api').
+ * @param {Blob} blob - The image to upload (JPEG or PNG).
+ * @returns {Promise<string>} - The storage key to send as `image_key` with the lead.
+ */
+export const uploadImageDirect = async (apiUrl, blob) => {
+    const contentType = blob.type === 'image/png' ? 'image/png' : 'image/jpeg';
+    const signResponse = await fetch(`${apiUrl}/upload-url`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ content_type: contentType, size: blob.size }),
+    });
+    if (!signResponse.ok) {
+        throw new Error(`Could not get an upload URL (status ${signResponse.status})`);
+    }
+    const { key, upload_url: uploadUrl, method, headers } = await signResponse.json();
+
+    const uploadResponse = await fetch(uploadUrl, { method, headers, body: blob });
+    if (!uploadResponse.ok) {
+        throw new Error(`Direct upload failed with status ${uploadResponse.status}`);
+    }
+    return key;
+};
@@ -0,0 +1,4 @@
+-- Content-addressed lead images: each lead links to the shared object
+-- sha256/<image_digest>.<ext> in the lead-images bucket (see api/storage.py).
+alter table leads add column if not exists image_digest text;
+create index if not exists idx_leads_image_digest on leads (image_digest);
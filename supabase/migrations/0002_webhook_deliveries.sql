@@ -0,0 +1,62 @@
+-- Append-only CRM/webhook delivery log. Attempts are only ever inserted; the trigger
+-- keeps the latest status per lead and channel in lead_delivery_status, so the leads
+-- row is not rewritten on every attempt.
+create table if not exists webhook_deliveries (
+    id bigint generated always as identity primary key,
+    lead_id bigint not null references leads (id) on delete cascade,
+    channel text not null,
+    attempt integer not null,
+    status text not null,
+    status_code integer,
+    latency_ms integer,
+    response_excerpt text,
+    created_at timestamptz not null default now()
+);
+create index if not exists idx_webhook_deliveries_lead on webhook_deliveries (lead_id, id);
+
+create table if not exists lead_delivery_status (
+    lead_id bigint not null references leads (id) on delete cascade,
+    channel text not null,
+    status text not null,
+    attempts integer not null,
+    status_code integer,
+    response_excerpt text,
+    updated_at timestamptz not null default now(),
+    primary key (lead_id, channel)
+);
+create index if not exists idx_lead_delivery_status_status on lead_delivery_status (channel, status);
+
+-- Both tables hold CRM response excerpts. RLS keeps them away from the anon key; the API
+-- uses the service-role key, which bypasses it. Signed-in admins read the latest status
+-- from the browser (Admin.jsx embeds lead_delivery_status in its leads query).
+alter table webhook_deliveries enable row level security;
+alter table lead_delivery_status enable row level security;
+drop policy if exists "Authenticated users can read delivery status" on lead_delivery_status;
+create policy "Authenticated users can read delivery status" on lead_delivery_status
+    for select to authenticated using (true);
+
+create or replace function materialize_delivery_status() returns trigger
+language plpgsql as $$
+begin
+    insert into lead_delivery_status (lead_id, channel, status, attempts, status_code, response_excerpt, updated_at)
+    values (new.lead_id, new.channel, new.status, new.attempt, new.status_code, new.response_excerpt, new.created_at)
+    on conflict (lead_id, channel) do update set
+        status = excluded.status,
+        attempts = greatest(lead_delivery_status.attempts, excluded.attempts),
+        status_code = excluded.status_code,
+        response_excerpt = excluded.response_excerpt,
+        updated_at = excluded.updated_at;
+    return null;
+end;
+$$;
+
+drop trigger if exists materialize_delivery_status on webhook_deliveries;
+create trigger materialize_delivery_status after insert on webhook_deliveries
+    for each row execute function materialize_delivery_status();
+
+-- Carry over the status written to the old lead columns
+insert into lead_delivery_status (lead_id, channel, status, attempts, response_excerpt, updated_at)
+select id, 'crm', webhook_status, 1, left(webhook_response, 500), created_at
+from leads
+where webhook_sent and webhook_status is not null
+on conflict (lead_id, channel) do nothing;
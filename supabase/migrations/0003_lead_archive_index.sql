@@ -0,0 +1,22 @@
+-- Lookup index for leads archived to the private lead-archive bucket (see api/archive_utils.py).
+-- Keeps email/phone dedup and image reference counts working after rows leave `leads`.
+create table if not exists lead_archive_index (
+    lead_id bigint primary key,
+    email text,
+    phone text,
+    image_digest text,
+    created_at timestamptz,
+    segment text not null
+);
+create index if not exists idx_lead_archive_email on lead_archive_index (email);
+create index if not exists idx_lead_archive_phone on lead_archive_index (phone);
+create index if not exists idx_lead_archive_image_digest on lead_archive_index (image_digest);
+
+-- Holds contact details: no policies, so only the API's service-role key (which bypasses
+-- RLS) can read it; the browser's anon and user sessions get nothing through PostgREST
+alter table lead_archive_index enable row level security;
+
+-- Archive segments hold contact details: keep the bucket private
+insert into storage.buckets (id, name, public)
+values ('lead-archive', 'lead-archive', false)
+on conflict (id) do nothing;
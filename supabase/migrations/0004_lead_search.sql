@@ -0,0 +1,71 @@
+-- Admin lead search (see api/search_utils.py). The API fills leads.search_text at insert:
+-- lowercased names, city and zip, the email whole and split at '@', the phone as bare
+-- digits. A trigram index over it serves substring matches (partial names, emails and
+-- phone numbers in any format) and near matches for typos.
+create extension if not exists pg_trgm;
+
+alter table leads add column if not exists search_text text;
+
+-- Same normalization as search_utils.search_text for leads inserted before this migration
+update leads set search_text = concat_ws(' ',
+    nullif(lower(trim(first_name)), ''),
+    nullif(lower(trim(last_name)), ''),
+    nullif(lower(trim(email)), ''),
+    nullif(split_part(lower(trim(email)), '@', 1), ''),
+    nullif(split_part(lower(trim(email)), '@', 2), ''),
+    nullif(regexp_replace(coalesce(phone, ''), '\D', '', 'g'), ''),
+    nullif(lower(trim(city)), ''),
+    nullif(lower(trim(zip_code::text)), '')
+)
+where search_text is null;
+
+create index if not exists idx_leads_search_text_trgm on leads using gin (search_text gin_trgm_ops);
+
+-- Ids of leads containing every term (or, with fuzzy, close to them), best match first
+-- among the newest `rank_window` matches, so very common terms stay cheap to rank.
+-- The first term drives the trigram index; the others filter its hits.
+-- Volatile: the fuzzy branch sets pg_trgm.word_similarity_threshold for the transaction.
+create or replace function search_leads(
+    terms text[],
+    page_limit integer default 50,
+    page_offset integer default 0,
+    fuzzy boolean default false,
+    min_similarity real default 0.4,
+    rank_window integer default 5000
+)
+returns table (id bigint, rank real)
+language plpgsql volatile
+as $$
+declare
+    phrase text := array_to_string(terms, ' ');
+begin
+    if fuzzy then
+        perform set_config('pg_trgm.word_similarity_threshold', min_similarity::text, true);
+        return query
+        select m.id, word_similarity(phrase, m.search_text)
+        from (
+            select l.id, l.search_text from leads l
+            where phrase <% l.search_text
+            order by l.id desc limit rank_window
+        ) m
+        order by 2 desc, m.id desc
+        limit least(page_limit, 100) offset page_offset;
+    else
+        return query
+        select m.id, word_similarity(phrase, m.search_text)
+        from (
+            select l.id, l.search_text from leads l
+            where l.search_text like '%' || replace(replace(replace(terms[1], '\', '\\'), '%', '\%'), '_', '\_') || '%'
+              and not exists (select 1 from unnest(terms) t where strpos(l.search_text, t) = 0)
+            order by l.id desc limit rank_window
+        ) m
+        order by 2 desc, m.id desc
+        limit least(page_limit, 100) offset page_offset;
+    end if;
+end;
+$$;
+
+-- Admin-only: the API calls it with the service-role key. Supabase's default privileges
+-- also grant new functions to anon and authenticated directly, so revoke those too.
+revoke execute on function search_leads(text[], integer, integer, boolean, real, integer) from public, anon, authenticated;
+grant execute on function search_leads(text[], integer, integer, boolean, real, integer) to service_role;